@@ -0,0 +1,170 @@
+import json, math, os, threading, time
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import ClosingIterator
+
+# ---- Admission control ----
+# A gthread worker has GUNICORN_THREADS threads; a request holds one from the
+# moment it is accepted. If every thread is waiting on the model, /healthz and
+# page shells queue behind them in the socket backlog. This WSGI middleware
+# classifies each request (health, static, read, write, llm) before Flask
+# does any work and gives each class its own concurrency limit, a small wait
+# queue and a queue deadline; anything past that gets an immediate 503 with
+# Retry-After.
+#
+# llm requests spend their time waiting on the model's HTTP response, not on
+# CPU, so they get most of the threads: limit = threads - ADMIT_RESERVE. The
+# reserve (default a quarter of the threads, at least 2) is kept for health,
+# reads and writes. A queued request still holds its thread while it waits,
+# so the llm queue comes out of the reserve and always leaves one thread
+# free: /healthz stays fast however backed up the model is. The trade-off is
+# a short llm queue. Past limit + queue, /ask sheds with 503 instead of
+# waiting, so raise GUNICORN_THREADS (cheap for I/O-bound work) rather than
+# the queue when llm traffic grows.
+#
+# ADMIT_<CLASS>="limit,queue,deadline_seconds" overrides a class, e.g.
+# ADMIT_LLM="4,2,1.5". health and static are never limited.
+ADMISSION = os.getenv("ADMISSION", "1") == "1"
+THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+ADMIT_RESERVE = os.getenv("ADMIT_RESERVE")  # threads the llm class can't take; default max(2, threads // 4)
+
+CLASSES = ("health", "static", "read", "write", "llm")
+
+
+def _defaults(threads, reserve=None):
+    t = max(1, threads)
+    r = min(t - 1, int(reserve) if reserve is not None else max(2, t // 4))
+    return {
+        "llm": (max(1, t - r), max(0, r - 1), 5.0),  # model calls take seconds; a 2s queue shed servable ones
+        "write": (max(1, t - 1), t, 1.0),
+        "read": (t, 2 * t, 1.0),
+    }
+
+
+def _limits(threads=THREADS, reserve=ADMIT_RESERVE):
+    out = _defaults(threads, reserve)
+    for cls in out:
+        raw = os.getenv(f"ADMIT_{cls.upper()}")
+        if raw:
+            limit, queue, deadline = raw.split(",")
+            out[cls] = (int(limit), int(queue), float(deadline))
+    return out
+
+
+class Gate:
+    """Counting semaphore with a bounded wait queue and a wait deadline."""
+
+    def __init__(self, name, limit, queue, deadline):
+        self.name, self.limit, self.queue, self.deadline = name, limit, queue, deadline
+        self._cond = threading.Condition()
+        self.active = self.waiting = 0
+        self.admitted = self.shed = self.timed_out = 0
+        self.wait_seconds = 0.0
+
+    def enter(self):
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            t0 = time.monotonic()
+            end = t0 + self.deadline
+            try:
+                while self.active >= self.limit:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+                return True
+            finally:
+                self.waiting -= 1
+                self.wait_seconds += time.monotonic() - t0
+
+    def leave(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {"limit": self.limit, "queue_limit": self.queue, "in_flight": self.active,
+                    "queued": self.waiting, "admitted_total": self.admitted, "shed_total": self.shed,
+                    "timed_out_total": self.timed_out, "queue_wait_seconds_total": round(self.wait_seconds, 6)}
+
+
+class AdmissionControl:
+    """WSGI middleware; `classify(endpoint, method)` maps a matched endpoint to a class."""
+
+    def __init__(self, app, classify, limits=None):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.classify = classify
+        self.gates = {cls: Gate(cls, *cfg) for cls, cfg in (limits or _limits()).items()}
+
+    def _class_of(self, environ):
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return "read"  # 404/405 are cheap but still take a thread
+        except Exception:
+            return "read"
+        if endpoint == "static":
+            return "static"
+        return self.classify(endpoint, environ.get("REQUEST_METHOD", "GET"))
+
+    def __call__(self, environ, start_response):
+        cls = self._class_of(environ)
+        gate = self.gates.get(cls)
+        if gate is None:
+            return self.wsgi_app(environ, start_response)
+        if not gate.enter():
+            return self._reject(gate, start_response)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            gate.leave()
+            raise
+        return ClosingIterator(body, gate.leave)  # release after the body has been sent
+
+    def _reject(self, gate, start_response):
+        retry = str(max(1, math.ceil(gate.deadline)))
+        if gate.name in ("llm", "write"):
+            payload, ctype = json.dumps({"ok": False, "error": "overloaded", "retry_after": int(retry)}), \
+                "application/json"
+        else:
+            payload, ctype = "Busy right now, please retry in a moment.", "text/plain; charset=utf-8"
+        data = payload.encode()
+        start_response("503 Service Unavailable", [
+            ("Content-Type", ctype), ("Content-Length", str(len(data))),
+            ("Retry-After", retry), ("Cache-Control", "no-store")])
+        return [data]
+
+    def stats(self):
+        return {cls: g.stats() for cls, g in self.gates.items()}
+
+    def metrics(self):
+        """Prometheus lines: per-class gauges and counters."""
+        out = []
+        for key, kind in (("in_flight", "gauge"), ("queued", "gauge"), ("limit", "gauge"),
+                          ("admitted_total", "counter"), ("shed_total", "counter"),
+                          ("timed_out_total", "counter"), ("queue_wait_seconds_total", "counter")):
+            name = f"amara_admission_{key}"
+            out.append(f"# TYPE {name} {kind}")
+            for cls, s in sorted(self.stats().items()):
+                out.append(f'{name}{{class="{cls}"}} {s[key]}')
+        return out
+
+
+def init_app(app, classify, limits=None):
+    """Install the middleware (when ADMISSION=1); returns it, or None when disabled."""
+    if not ADMISSION:
+        return None
+    ac = AdmissionControl(app, classify, limits)
+    app.wsgi_app = ac
+    return ac
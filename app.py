@@ -1,222 +1,481 @@
-import os, uuid, re
-from datetime import datetime, timedelta, timezone
+import os, uuid, time, threading
+import click
+from datetime import date, datetime, timedelta, timezone
 from typing import Optional
-from flask import Flask, render_template, render_template_string, request, redirect, session, jsonify, url_for
-from sqlalchemy import create_engine, text
+from flask import Blueprint, Flask, current_app, render_template, render_template_string, request, redirect, send_file, session, jsonify, url_for, make_response
+from sqlalchemy import bindparam, text
 from sqlalchemy.exc import IntegrityError
-from openai import OpenAI
+from db import make_engine, make_router, pool_stats
+from cache import make_cache, DashboardCache
+import admission
+import capture
+import health
+import history
+import jsonio
+import llm
+import localday
+from idempotency import IdempotencyStore
+import moon
+import profiler
+import themes
+import spreads
+import sync
+import tracker
+import user_context
+import tracing
+from tracing import traced
+from library import LibraryIndex, build_library, activate_version, draw_cards
 AUTH_BYPASS = os.getenv("AUTH_BYPASS", "1") == "1"          # default ON in dev
 ENFORCE_RATE_LIMIT = os.getenv("ENFORCE_RATE_LIMIT", "0") == "1"  # default OFF in dev
+# Run the idempotent DDL on a worker's first request (set 0 when deploys run `flask --app app init-db`)
+SCHEMA_AUTO_INIT = os.getenv("SCHEMA_AUTO_INIT", "1") == "1"
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
-
-app = Flask(__name__, static_folder="static", template_folder="templates")
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret")
 DATABASE_URL = os.environ.get("DATABASE_URL")
-# ---- Database engine (define before bootstrap) ----
+# ---- Database engine (define before bootstrap; no connection is made until first use) ----
+# Pool sizing / PgBouncer mode live in db.py (DB_POOL_*, DB_PGBOUNCER env vars)
 if DATABASE_URL:
-    ENGINE = create_engine(DATABASE_URL, pool_pre_ping=True)
+    ENGINE = make_engine(DATABASE_URL)
 else:
     # Fallback to local SQLite on Render’s ephemeral disk (ok for free tier)
-    ENGINE = create_engine("sqlite:///app.db", pool_pre_ping=True)
+    ENGINE = make_engine("sqlite:///app.db")
 
 IS_SQLITE = ENGINE.url.get_backend_name() == "sqlite"
+# Read-only views go through ROUTER (DATABASE_REPLICA_URL); primary if unset
+ROUTER = make_router(ENGINE)
+# Per-user dashboard results + ETags, shared by every worker on the host by default (a bump
+# must reach all of them); CACHE_URL=redis://... across hosts, memory:// for a single dev process
+DASH = DashboardCache(make_cache(os.getenv("CACHE_URL", "sqlite:///var/dash-cache.db")),
+                      release=os.getenv("RELEASE_ID") or os.getenv("RENDER_GIT_COMMIT", "dev"))
 # ---------------------------------------------------
 
+# ---- LLM client (created on first use, never at import) ----
+_llm_client = None
+_llm_lock = threading.Lock()
+
+def _llm():
+    """Shared OpenAI client; the SDK import and client setup happen on first call."""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_lock:
+            if _llm_client is None:
+                from openai import OpenAI
+                _llm_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return _llm_client
+
+# Model, max_tokens and JSON shape per call type, plus daily token budgets (llm.py)
+LLM = llm.ModelRouter(ENGINE, _llm)
+
+# Pre-generated card meanings (card x orientation x position), loaded lazily from card_library
+LIBRARY = LibraryIndex(ENGINE)
+
+# ---- Near-duplicate questions (similar.py; numpy loads on first /ask, not at import) ----
+SIMILAR_INDEX = os.getenv("SIMILAR_INDEX", "1") == "1"
+SIMILAR_SERVE = float(os.getenv("SIMILAR_SERVE", "0.9"))  # reuse the stored answer as-is
+SIMILAR_SEED = float(os.getenv("SIMILAR_SEED", "0.7"))    # hand it to the model as a starting point
+_similar_index = None
+_similar_lock = threading.Lock()
+
+def _similar():
+    global _similar_index
+    if _similar_index is None:
+        with _similar_lock:
+            if _similar_index is None:
+                from similar import QuestionIndex
+                _similar_index = QuestionIndex()
+    return _similar_index
+
+def _similar_answer(q, uid):
+    """Best past answer to one of `uid`'s own questions scoring >= SIMILAR_SEED, with its score; None otherwise.
+
+    Answers are written from the asker's context (user_context), so another
+    user's answer is never served or used as a seed. The index ranks only
+    the asker's rows; the JOIN re-checks ownership (rows indexed before
+    users.S36 existed carry no owner until the next similar-rebuild).
+    """
+    if not SIMILAR_INDEX:
+        return None
+    try:
+        hits = [h for h in _similar().search(q, user_id=uid) if h[1] >= SIMILAR_SEED]
+    except Exception:
+        current_app.logger.exception("similar lookup failed")
+        return None
+    if not hits:
+        return None
+    with ENGINE.connect() as cx:
+        rows = cx.execute(
+            text("SELECT a.question_id, a.body, a.affirmation, a.tags_csv FROM answers a "
+                 "JOIN questions q ON q.id = a.question_id WHERE a.question_id IN :ids AND q.user_id = :uid")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": [h[0] for h in hits], "uid": uid},
+        ).mappings().all()
+    by_q = {r["question_id"]: r for r in rows}
+    for qid, score in hits:
+        if qid in by_q:
+            return dict(by_q[qid], score=score)
+    return None
+
+# Idempotency-Key handling for POSTs that pay for a completion (/ask, /daily/generate)
+IDEM = IdempotencyStore(ENGINE)
 
-@app.route("/readyz")
+bp = Blueprint("main", __name__)
+
+# Admission classes (admission.py): per-class concurrency limits, health/static never limited
+LLM_ENDPOINTS = {"main.ask", "main.ask_card", "main.daily_generate"}
+HEALTH_ENDPOINTS = {"main.healthz", "main.readyz", "main.health_detail", "main.metrics_pool", "metrics",
+                    "admission_stats", "debug_profile"}
+
+def route_class(endpoint, method):
+    if endpoint in HEALTH_ENDPOINTS:
+        return "health"
+    if endpoint in LLM_ENDPOINTS:
+        return "llm"
+    return "read" if method in ("GET", "HEAD", "OPTIONS") else "write"
+
+
+# ---- Health: background probes (health.py); the endpoints below only read cached results ----
+HEALTH = health.HealthMonitor()
+HEALTH.add(health.Probe("db", health.db_check(ENGINE), health.HEALTH_DB_INTERVAL))
+if ROUTER.replica is not None:
+    HEALTH.add(health.Probe("db_replica", health.db_check(ROUTER.replica), health.HEALTH_DB_INTERVAL, critical=False))
+if os.environ.get("OPENAI_API_KEY"):
+    HEALTH.add(health.Probe("llm", health.llm_check(), health.HEALTH_LLM_INTERVAL, critical=False))
+HEALTH.add(health.Probe("disk", health.disk_check(
+    os.path.dirname(os.path.abspath(ENGINE.url.database)) if IS_SQLITE and ENGINE.url.database else os.getcwd()),
+    health.HEALTH_DISK_INTERVAL))
+
+
+@bp.route("/readyz")
 def readyz():
-    try:
-        with ENGINE.connect() as conn:
-            conn.exec_driver_sql("SELECT 1")
+    # Ready = DB (and disk) probes fresh and passing; LLM/replica trouble only degrades /health
+    if HEALTH.status()["ready"]:
         return "ready", 200
-    except Exception:
-        return "not-ready", 500
-
-
-def _bootstrap_schema():
-    """Create tables idempotently with a single explicit transaction."""
-    ddl = [
-        """
-        CREATE TABLE IF NOT EXISTS questions (
-            id TEXT PRIMARY KEY,
-            user_id TEXT,
-            body TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS answers (
-            id TEXT PRIMARY KEY,
-            question_id TEXT,
-            body TEXT NOT NULL,
-            affirmation TEXT,
-            tags_csv TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            email TEXT UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-    ]
-from flask import render_template_string
-from datetime import date
+    return "not-ready", 503
+
+
+@bp.route("/health")
+def health_detail():
+    st = HEALTH.status()
+    code = 200 if st["ready"] else 503
+    if not tracing.metrics_authorized(request):
+        return jsonify({"status": st["status"], "ready": st["ready"]}), code  # probes, pid, disk: bearer only
+    return jsonify(st), code
+
+
+@bp.route("/metrics/pool")
+def metrics_pool():
+    # Checkout counts, wait times and reconnects for this worker's pool (METRICS_TOKEN bearer)
+    if not tracing.metrics_authorized(request):
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    replica = ROUTER.stats()
+    if ROUTER.replica is not None:
+        replica["pool"] = pool_stats(ROUTER.replica)
+    return jsonify({**pool_stats(ENGINE), "replica": replica})
+
+
+BOOTSTRAP_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS questions (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        body TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS answers (
+        id TEXT PRIMARY KEY,
+        question_id TEXT,
+        body TEXT NOT NULL,
+        affirmation TEXT,
+        tags_csv TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        email TEXT UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
 
-def upsert_daily_draw(kind: str, user_id: str):
-    """Return today's draw for (user_id, kind); insert a placeholder if none exists yet."""
+# -------- Simple, template-free routes to make the menu work --------
+
+def upsert_daily_draw(kind: str, user_id: str, day: Optional[date] = None, prewarm: bool = False):
+    """Return the draw for (user_id, kind) on `day` (the user's local today); insert one if none exists yet.
+
+    prewarm=True (daily-rollover) creates tomorrow's row unseen; the card
+    reaches the user's oracle context only when they first get it here.
+    """
     if kind not in ("rune", "tarot"):
         raise ValueError("unknown kind")
-    today = date.today().isoformat()
+    today = (day or _today()).isoformat()
     with ENGINE.begin() as cx:
         row = cx.exec_driver_sql("""
-            SELECT id, name, keywords
+            SELECT id, name, keywords, meaning, affirmation, orientation, unseen
             FROM daily_draws
             WHERE user_id = :u AND kind = :k AND draw_date = :d
         """, {"u": user_id, "k": kind, "d": today}).mappings().first()
-        if row:
-            return row
-        # TODO: replace with your real draw logic
-        defaults = {
-            "rune": ("Raidho", "journey, movement, change"),
-            "tarot": ("The Sun", "vitality, success, joy"),
-        }
-        name, keywords = defaults[kind]
+        first_view = bool(row) and row["unseen"] and not prewarm and cx.execute(
+            text("UPDATE daily_draws SET unseen = 0 WHERE id = :id AND unseen = 1"), {"id": row["id"]}).rowcount == 1
+    if row:
+        if first_view:
+            try:
+                user_context.record_card(ENGINE, user_id, row["name"])
+            except Exception:
+                current_app.logger.exception("user context update failed")
+        return row
+    with ENGINE.begin() as cx:
+        # Meaning comes from the in-memory library; no model call on the draw path
+        (name, orientation, position), = draw_cards(kind)
+        entry = ai_draw(kind, name, orientation=orientation, position=position)
         did = str(uuid.uuid4())
-        cx.exec_driver_sql("""
-            INSERT INTO daily_draws (id, user_id, draw_date, kind, name, keywords)
-            VALUES (:id, :u, :d, :k, :name, :kw)
-        """, {"id": did, "u": user_id, "d": today, "k": kind, "name": name, "kw": keywords})
-        return {"id": did, "name": name, "keywords": keywords}
-
-@app.route("/logout")
-def logout():
+        cx.execute(text("""
+            INSERT INTO daily_draws (id, user_id, draw_date, kind, name, keywords, meaning, affirmation, orientation,
+                                     unseen)
+            VALUES (:id, :u, :d, :k, :name, :kw, :m, :a, :o, :unseen)
+        """), {"id": did, "u": user_id, "d": today, "k": kind, "name": name, "kw": entry["keywords"],
+               "m": entry["meaning"], "a": entry["affirmation"], "o": orientation,
+               "unseen": 1 if prewarm else 0})
+    if not prewarm:
+        try:
+            user_context.record_card(ENGINE, user_id, name)
+        except Exception:
+            current_app.logger.exception("user context update failed")
+    return {"id": did, "name": name, "keywords": entry["keywords"], "meaning": entry["meaning"],
+            "affirmation": entry["affirmation"], "orientation": orientation}
+
+@bp.route("/logout", endpoint="logout")
+def do_logout():
     session.clear()
-    return redirect(url_for("index"))
+    return redirect(url_for(".index"))
 
 # Accept GET *and* POST so menu clicks (GET) won’t 405/500
-@app.route("/draw/<kind>", methods=["GET", "POST"])
+@bp.route("/draw/<kind>", methods=["GET", "POST"])
 def draw(kind):
     gate = _ensure_login()
     if gate:
         return gate
     try:
         upsert_daily_draw(kind, session["user_id"])
-        return redirect(url_for("app_view"))
+        _mark_write()
+        return redirect(url_for(".app_view"))
     except Exception:
-        app.logger.exception("daily draw failed")
+        current_app.logger.exception("daily draw failed")
         return "Error creating today's draw", 500
 
+# draw.html posts here: today's card for this kind plus a reading of the question
+@bp.route("/ask/<kind>", methods=["POST"])
+def ask_card(kind):
+    gate = _ensure_login()
+    if gate:
+        return gate
+    if kind not in ("rune", "tarot"):
+        return jsonify({"ok": False, "error": "unknown_kind"}), 404
+    q = (request.form.get("question") or "").strip()
+    row = upsert_daily_draw(kind, session["user_id"])
+    _mark_write()
+    reading = ai_draw(kind, row["name"], question=q or None, orientation=row["orientation"] or "upright")
+    answer = reading["meaning"] + ("\n\n" + reading["personal"] if reading["personal"] else "")
+    return jsonify({"ok": True, "card": row["name"], "orientation": reading["orientation"],
+                    "answer": answer, "affirmation": reading["affirmation"],
+                    "image": spread_url(kind, "single", [(row["name"], reading["orientation"])])})
+
+# ---- Spread images: one cached composite per spread (spreads.py) ----
+SPREAD_CACHE = spreads.SpreadCache()
+
+def spread_url(kind, spread, cards, fmt="webp"):
+    return url_for("main.spread_image", kind=kind, spread=spread, cards=spreads.spec(cards), fmt=fmt)
+
+@bp.route("/spread/<kind>/<spread>/<cards>.<fmt>")
+def spread_image(kind, spread, cards, fmt):
+    """Composited spread, e.g. /spread/tarot/three/the-fool:r,death,the-star.webp (immutable)."""
+    if fmt not in spreads.FORMATS:
+        return "unknown format", 404
+    try:
+        parsed = spreads.parse(kind, spread, cards)
+    except ValueError:
+        return "unknown spread", 404
+    key = spreads.cache_key(kind, spread, parsed, fmt)
+    if key in request.if_none_match:
+        resp = make_response("", 304)
+    else:
+        key, path = SPREAD_CACHE.get_or_render(kind, spread, parsed, fmt)
+        resp = send_file(path, mimetype=spreads.FORMATS[fmt][1], etag=key, conditional=False)
+    resp.set_etag(key)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
 # Friendly aliases used by menus
-@app.route("/daily/tarot", methods=["GET", "POST"])
+@bp.route("/daily/tarot", methods=["GET", "POST"])
 def daily_tarot():
     return draw("tarot")
 
-@app.route("/daily/rune", methods=["GET", "POST"])
+@bp.route("/daily/rune", methods=["GET", "POST"])
 def daily_rune():
     return draw("rune")
 
-@app.route("/journal", methods=["GET", "POST"])
-def journal():
+# ---- Moon Sync (moon.py: local phase table, fixed ritual per phase; no network) ----
+@bp.route("/moon")
+def moon_view():
+    today = _today()
+    m = moon.moon_on(today)
+    resp = make_response(render_template(
+        "moon.html", today=f"{today:%A, %d %B %Y} · {m['phase']}", ritual=m["ritual"], moon=m))
+    resp.headers["Cache-Control"] = "private, max-age=3600"  # the date is the visitor's local day
+    return resp
+
+@bp.route("/moon/calendar")
+def moon_calendar():
+    """Phases for a date range (calendar views): ?start=YYYY-MM-DD&days=N (max 1096); NDJSON on request."""
+    try:
+        start = date.fromisoformat(request.args.get("start") or _today().replace(day=1).isoformat())
+        days = max(1, min(int(request.args.get("days", 42)), 1096))
+        cal = moon.calendar(start, days)
+    except ValueError:
+        return jsonify({"ok": False, "error": "bad_range"}), 400
+    out = [{"date": str(d), "phase": moon.PHASES[p], "illumination": round(float(il), 3)}
+           for d, p, il in zip(cal["dates"], cal["phase"], cal["illumination"])]
+    events = [{"kind": k, "at": t.isoformat()} for k, t in
+              moon.events_between(start, start + timedelta(days=days))]
+    resp = jsonio.list_response("days", out, events=events)
+    # without ?start the range follows the visitor's local month
+    resp.headers["Cache-Control"] = ("public" if request.args.get("start") else "private") + ", max-age=86400"
+    return resp
+
+# ---- Themes: tag analytics over answer_tags (themes.py) ----
+@bp.route("/themes")
+def themes_top():
+    """Top tags for the user: ?period=week|month|year|all&k=10."""
+    gate = _ensure_login()
+    if gate:
+        return gate
+    period = request.args.get("period", "month")
+    if period not in themes.PERIOD_DAYS:
+        return jsonify({"ok": False, "error": "bad_period"}), 400
+    k = max(1, min(int(request.args.get("k", 10) or 10), 50))
+    with _read_cx() as cx:
+        top = themes.top_tags(cx, session["user_id"], period, k)
+    return jsonify({"ok": True, "period": period, "tags": [{"tag": t, "count": n} for t, n in top]})
+
+@bp.route("/themes/<tag>")
+def themes_tag(tag):
+    """When a theme came up: the user's most recent answers carrying `tag`."""
+    gate = _ensure_login()
+    if gate:
+        return gate
+    norm = themes.normalize_tags([tag])
+    if not norm:
+        return jsonify({"ok": False, "error": "bad_tag"}), 400
+    with _read_cx() as cx:
+        hits = themes.tag_timeline(cx, session["user_id"], norm[0])
+    return jsonio.list_response("answers", ({"answer_id": a, "created_at": t} for a, t in hits), tag=norm[0])
+
+# ---- History: hot tables with read-through to archived months (history.py) ----
+@bp.route("/history")
+def history_view():
+    """The user's questions and answers, newest first: ?before=<ISO time>&limit=50."""
+    gate = _ensure_login()
+    if gate:
+        return gate
+    try:
+        before = tracker.as_dt(request.args["before"]) if request.args.get("before") else None
+    except ValueError:
+        return jsonify({"ok": False, "error": "bad_before"}), 400
+    limit = max(1, min(int(request.args.get("limit", 50) or 50), 200))
+    with _read_cx() as cx:
+        rows = history.recent(cx, session["user_id"], limit, before, files=True)
+    return jsonio.list_response("rows", rows, next_before=rows[-1]["created_at"] if len(rows) == limit else None)
+
+@bp.route("/history/export")
+def history_export():
+    """Everything the user has asked, streamed as NDJSON (hot, cold and file-archived months)."""
+    gate = _ensure_login()
+    if gate:
+        return gate
+    resp = jsonio.ndjson(history.iter_user(ENGINE, session["user_id"]))
+    resp.headers["Content-Disposition"] = "attachment; filename=amara-history.ndjson"
+    return resp
+
+# ---- Path Mirror tracker (rollups maintained in tracker.py) ----
+@bp.route("/tracker")
+def tracker_view():
     gate = _ensure_login()
     if gate:
         return gate
     uid = session["user_id"]
-    if request.method == "POST":
-        # create a simple entry for today
+    ver = DASH.version(uid)
+    etag = DASH.etag(uid, "tracker", ver)
+    unchanged = _not_modified(etag)
+    if unchanged:
+        return unchanged
+    data = DASH.get_or_set(uid, "tracker", ver, lambda: _load_tracker(uid))
+    return _with_etag(render_template("tracker.html", **data), etag)
+
+def _load_tracker(uid):
+    with _read_cx() as cx:
+        rows = [dict(r) for r in cx.execute(text(
+            "SELECT id, card_name, notes, created_at FROM cards WHERE user_id = :u "
+            "ORDER BY created_at DESC LIMIT 50"), {"u": uid}).mappings()]
+        top = tracker.top_cards(cx, uid, 10)
+    for r in rows:
+        r["created_at"] = tracker.as_dt(r["created_at"])
+    return {"rows": rows, "top": top}
+
+@bp.route("/tracker/add", methods=["POST"])
+def tracker_add():
+    gate = _ensure_login()
+    if gate:
+        return gate
+    name = tracker.normalize_card(request.form.get("card_name"))
+    if name:
         with ENGINE.begin() as cx:
-            cx.exec_driver_sql(
-                "INSERT INTO daily_entries (id, user_id) VALUES (:id, :u)",
-                {"id": str(uuid.uuid4()), "u": uid},
-            )
-        return redirect(url_for("journal"))
-    # list entries
-    with ENGINE.connect() as cx:
-        rows = cx.exec_driver_sql("""
-            SELECT entry_date, created_at FROM daily_entries
-            WHERE user_id = :u
-            ORDER BY created_at DESC
-        """, {"u": uid}).mappings().all()
-    return render_template_string("""
-        <h1>Journal</h1>
-        <form method="post"><button>Add today’s entry</button></form>
-        <ul>
-        {% for r in rows %}
-          <li>{{ r.entry_date }} — {{ r.created_at }}</li>
-        {% else %}
-          <li>No entries yet.</li>
-        {% endfor %}
-        </ul>
-        <p><a href="{{ url_for('app_view') }}">Back</a></p>
-    """, rows=rows)
-
-# Global safety net so 500s show a friendly message while logs capture details
-@app.errorhandler(Exception)
-def on_error(e):
-    app.logger.exception("Unhandled exception: %s", e)
-    return "Something went wrong. Please try again.", 500
-# -------- Simple, template-free routes to make the menu work --------
-from flask import render_template_string
-from datetime import date
+            tracker.add_card(cx, session["user_id"], name, (request.form.get("notes") or "").strip() or None,
+                             tz=session.get("tz"))
+        _mark_write()
+        try:
+            user_context.record_card(ENGINE, session["user_id"], name)
+        except Exception:
+            current_app.logger.exception("user context update failed")
+    return redirect(url_for(".tracker_view"))
 
-def upsert_daily_draw(kind: str, user_id: str):
-    """Return today's draw for (user_id, kind); insert a placeholder if none exists yet."""
-    if kind not in ("rune", "tarot"):
-        raise ValueError("unknown kind")
-    today = date.today().isoformat()
+@bp.route("/tracker/<card_id>/delete", methods=["POST"])
+def tracker_delete(card_id):
+    gate = _ensure_login()
+    if gate:
+        return gate
     with ENGINE.begin() as cx:
-        row = cx.exec_driver_sql("""
-            SELECT id, name, keywords
-            FROM daily_draws
-            WHERE user_id = :u AND kind = :k AND draw_date = :d
-        """, {"u": user_id, "k": kind, "d": today}).mappings().first()
-        if row:
-            return row
-        # TODO: replace with your real draw logic
-        defaults = {
-            "rune": ("Raidho", "journey, movement, change"),
-            "tarot": ("The Sun", "vitality, success, joy"),
-        }
-        name, keywords = defaults[kind]
-        did = str(uuid.uuid4())
-        cx.exec_driver_sql("""
-            INSERT INTO daily_draws (id, user_id, draw_date, kind, name, keywords)
-            VALUES (:id, :u, :d, :k, :name, :kw)
-        """, {"id": did, "u": user_id, "d": today, "k": kind, "name": name, "kw": keywords})
-        return {"id": did, "name": name, "keywords": keywords}
-
-@app.route("/logout", endpoint="logout")
-def do_logout():
-    session.clear()
-    return redirect(url_for("index"))
-
-# Accept GET *and* POST so menu clicks (GET) won’t 405/500
-@app.route("/draw/<kind>", methods=["GET", "POST"])
-def draw(kind):
+        found = tracker.delete_card(cx, session["user_id"], card_id)
+        if found:
+            sync.record_delete(cx, session["user_id"], card_id)
+    if found:
+        _mark_write()
+    return redirect(url_for(".tracker_view"))
+
+@bp.route("/tracker/stats")
+def tracker_stats():
+    """This week's/month's top cards for the user and for everyone, plus all-time global.
+
+    The period is the one containing the user's local today; the everyone
+    rows count each card in its logger's local week/month (tracker.py).
+    """
     gate = _ensure_login()
     if gate:
         return gate
-    try:
-        upsert_daily_draw(kind, session["user_id"])
-        return redirect(url_for("app_view"))
-    except Exception:
-        app.logger.exception("daily draw failed")
-        return "Error creating today's draw", 500
-
-# Friendly aliases used by menus
-@app.route("/daily/tarot", methods=["GET", "POST"])
-def daily_tarot():
-    return draw("tarot")
-
-@app.route("/daily/rune", methods=["GET", "POST"])
-def daily_rune():
-    return draw("rune")
-
-@app.route("/journal", methods=["GET", "POST"])
+    period = request.args.get("period", "week")
+    if period not in tracker.PERIODS:
+        return jsonify({"ok": False, "error": "bad_period"}), 400
+    start = tracker.period_starts(_today())[period]
+    uid = session["user_id"]
+    with _read_cx() as cx:
+        mine = tracker.top_period(cx, uid, period, start)
+        everyone = tracker.top_period(cx, tracker.GLOBAL, period, start)
+        all_time = tracker.top_global(cx)
+    return jsonify({"ok": True, "period": period, "period_start": start,
+                    "mine": mine, "everyone": everyone, "all_time": all_time})
+
+@bp.route("/journal", methods=["GET", "POST"])
 def journal():
     gate = _ensure_login()
     if gate:
@@ -225,13 +484,14 @@ def journal():
     if request.method == "POST":
         # create a simple entry for today
         with ENGINE.begin() as cx:
-            cx.exec_driver_sql(
-                "INSERT INTO daily_entries (id, user_id) VALUES (:id, :u)",
-                {"id": str(uuid.uuid4()), "u": uid},
-            )
-        return redirect(url_for("journal"))
+            cx.execute(text(
+                "INSERT INTO daily_entries (id, user_id, entry_date) VALUES (:id, :u, :d) "
+                "ON CONFLICT (user_id, entry_date) DO NOTHING"  # today's entry may have come in via /sync
+            ), {"id": str(uuid.uuid4()), "u": uid, "d": _today()})
+        _mark_write()
+        return redirect(url_for(".journal"))
     # list entries
-    with ENGINE.connect() as cx:
+    with _read_cx() as cx:
         rows = cx.exec_driver_sql("""
             SELECT entry_date, created_at FROM daily_entries
             WHERE user_id = :u
@@ -247,48 +507,52 @@ def journal():
           <li>No entries yet.</li>
         {% endfor %}
         </ul>
-        <p><a href="{{ url_for('app_view') }}">Back</a></p>
+        <p><a href="{{ url_for('.app_view') }}">Back</a></p>
     """, rows=rows)
 
+# Offline writes queued by the service worker arrive here in batches (sync.py)
+@bp.route("/sync", methods=["POST"])
+def sync_batch():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "login_required"}), 401
+    data = request.get_json(silent=True) or {}
+    ops = data.get("ops") or []
+    if not isinstance(ops, list):
+        return jsonify({"ok": False, "error": "bad_ops"}), 400
+    if len(ops) > sync.SYNC_MAX_OPS:
+        return jsonify({"ok": False, "error": "too_many_ops", "max": sync.SYNC_MAX_OPS}), 413
+    uid = session["user_id"]
+    now = _now_utc()
+    try:
+        with ENGINE.begin() as cx:
+            results, logged = sync.apply(cx, uid, ops, now, _today(), session.get("tz"))
+            delta = sync.delta(cx, uid, data.get("cursor"), now)
+    except IntegrityError:
+        # the same ops are being applied by a concurrent sync; retrying reports them as duplicates
+        return jsonify({"ok": False, "error": "retry"}), 409
+    if any(r["status"] == "applied" for r in results):
+        _mark_write()
+    if logged:
+        try:
+            user_context.record_cards(ENGINE, uid, logged)
+        except Exception:
+            current_app.logger.exception("user context update failed")
+    return jsonify({"ok": True, "results": results, "cursor": sync.cursor(now), "delta": delta})
+
+# Served from the root so its scope covers /tracker/add and /journal
+@bp.route("/service-worker.js")
+def service_worker():
+    resp = send_file(os.path.join(current_app.static_folder, "service-worker.js"), mimetype="text/javascript")
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
 # Global safety net so 500s show a friendly message while logs capture details
-@app.errorhandler(Exception)
+@bp.app_errorhandler(Exception)
 def on_error(e):
-    app.logger.exception("Unhandled exception: %s", e)
+    current_app.logger.exception("Unhandled exception: %s", e)
     return "Something went wrong. Please try again.", 500
 
 
-def _bootstrap_schema():
-    # create tables if they don't exist
-    with ENGINE.begin() as cx:
-        cx.exec_driver_sql("""
-            CREATE TABLE IF NOT EXISTS questions (
-                id TEXT PRIMARY KEY,
-                user_id TEXT,
-                body TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cx.exec_driver_sql("""
-            CREATE TABLE IF NOT EXISTS answers (
-                id TEXT PRIMARY KEY,
-                question_id TEXT,
-                body TEXT NOT NULL,
-                affirmation TEXT,
-                tags_csv TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cx.exec_driver_sql("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-_bootstrap_schema()
-# ---- end bootstrap ----
-
 DDL = """
 CREATE TABLE IF NOT EXISTS daily_draws (
   id TEXT PRIMARY KEY,
@@ -328,203 +592,377 @@ CREATE TABLE IF NOT EXISTS cards (
   user_id TEXT,
   card_name TEXT NOT NULL,
   notes TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  local_day DATE
+);
+
+CREATE TABLE IF NOT EXISTS card_library_versions (
+  version INTEGER PRIMARY KEY,
+  source TEXT,
+  active INTEGER NOT NULL DEFAULT 0,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+CREATE TABLE IF NOT EXISTS card_library (
+  version INTEGER NOT NULL,
+  kind TEXT NOT NULL,
+  card TEXT NOT NULL,
+  orientation TEXT NOT NULL,
+  position TEXT NOT NULL,
+  keywords TEXT,
+  meaning TEXT,
+  affirmation TEXT,
+  PRIMARY KEY (version, kind, card, orientation, position)
+);
+
+CREATE INDEX IF NOT EXISTS cards_user_created_idx ON cards (user_id, created_at);
+CREATE INDEX IF NOT EXISTS cards_user_card_idx ON cards (user_id, card_name, created_at);
+CREATE INDEX IF NOT EXISTS cards_card_idx ON cards (card_name, created_at);
+
+CREATE TABLE IF NOT EXISTS card_counts (
+  user_id TEXT NOT NULL,
+  card_name TEXT NOT NULL,
+  count INTEGER NOT NULL DEFAULT 0,
+  last_seen TIMESTAMP,
+  PRIMARY KEY (user_id, card_name)
+);
+CREATE INDEX IF NOT EXISTS card_counts_top_idx ON card_counts (user_id, count);
+
+CREATE TABLE IF NOT EXISTS card_counts_global (
+  card_name TEXT PRIMARY KEY,
+  count INTEGER NOT NULL DEFAULT 0,
+  last_seen TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS card_counts_period (
+  user_id TEXT NOT NULL,
+  period TEXT NOT NULL,
+  period_start TEXT NOT NULL,
+  card_name TEXT NOT NULL,
+  count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, period, period_start, card_name)
+);
+CREATE INDEX IF NOT EXISTS card_counts_period_top_idx ON card_counts_period (user_id, period, period_start, count);
+
+CREATE INDEX IF NOT EXISTS answers_question_idx ON answers (question_id);
+
+CREATE TABLE IF NOT EXISTS answer_tags (
+  answer_id TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  tag TEXT NOT NULL,
+  created_at TIMESTAMP NOT NULL,
+  PRIMARY KEY (answer_id, tag)
+);
+CREATE INDEX IF NOT EXISTS answer_tags_user_tag_idx ON answer_tags (user_id, tag, created_at);
+CREATE INDEX IF NOT EXISTS answer_tags_user_time_idx ON answer_tags (user_id, created_at, tag);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  user_id TEXT NOT NULL,
+  route TEXT NOT NULL,
+  key TEXT NOT NULL,
+  fingerprint TEXT,
+  state TEXT NOT NULL,
+  status INTEGER,
+  mimetype TEXT,
+  body TEXT,
+  created_at DOUBLE PRECISION NOT NULL,
+  expires_at DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY (user_id, route, key)
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_expires_idx ON idempotency_keys (expires_at);
+
+CREATE TABLE IF NOT EXISTS user_context (
+  user_id TEXT PRIMARY KEY,
+  state TEXT NOT NULL,
+  prompt TEXT NOT NULL,
+  tokens INTEGER NOT NULL,
+  version INTEGER NOT NULL,
+  updated_at TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS history_months (
+  month TEXT PRIMARY KEY,
+  state TEXT NOT NULL,
+  row_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS llm_usage (
+  day DATE NOT NULL,
+  user_id TEXT NOT NULL,
+  route TEXT NOT NULL,
+  calls INTEGER NOT NULL DEFAULT 0,
+  failures INTEGER NOT NULL DEFAULT 0,
+  prompt_tokens INTEGER NOT NULL DEFAULT 0,
+  completion_tokens INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, user_id, route)
+);
+
+CREATE TABLE IF NOT EXISTS rollover_runs (
+  tz TEXT NOT NULL,
+  local_date DATE NOT NULL,
+  users INTEGER NOT NULL DEFAULT 0,
+  finished_at TIMESTAMP,
+  PRIMARY KEY (tz, local_date)
+);
+
+CREATE TABLE IF NOT EXISTS sync_ops (
+  user_id TEXT NOT NULL,
+  client_id TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  ref_id TEXT,
+  created_at TIMESTAMP NOT NULL,
+  PRIMARY KEY (user_id, client_id)
+);
+CREATE INDEX IF NOT EXISTS sync_ops_created_idx ON sync_ops (created_at);
 """
+# Column additions for tables that already exist; each may fail harmlessly once applied
+MIGRATIONS = [
+    "ALTER TABLE daily_draws ADD COLUMN orientation TEXT",
+    "ALTER TABLE users ADD COLUMN tz TEXT",
+    # 1 until the user first gets the draw (daily-rollover pre-creates tomorrow's rows)
+    "ALTER TABLE daily_draws ADD COLUMN unseen INTEGER NOT NULL DEFAULT 0",
+    # daily_generate upserts on (user_id, entry_date); fails if old duplicate rows exist
+    "CREATE UNIQUE INDEX IF NOT EXISTS daily_entries_user_date_uq ON daily_entries (user_id, entry_date)",
+    # the logger's local date, for week/month buckets (tracker.py); NULL on older rows
+    "ALTER TABLE cards ADD COLUMN local_day DATE",
+]
 # Make Postgres-style DDL work on SQLite when needed
 DDL_SQL = (DDL
            .replace("UUID", "TEXT")
            .replace("TIMESTAMPTZ DEFAULT now()", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"))
-# Create tables if they don't exist (execute DDL one statement at a time)
-try:
-    with ENGINE.begin() as cx:
-        for stmt in DDL_SQL.split(";"):
-            s = stmt.strip()
-            if not s:
-                continue
-            cx.execute(text(s))
-except Exception as e:
-    print("DDL init error:", e)
 
-ddl_to_run = DDL_SQL if IS_SQLITE else DDL
+def init_db(engine=None):
+    """Create tables if they don't exist (execute DDL one statement at a time)."""
+    engine = engine or ENGINE
+    with engine.begin() as cx:
+        for stmt in BOOTSTRAP_DDL:
+            cx.exec_driver_sql(stmt)
+    try:
+        with engine.begin() as cx:
+            for stmt in DDL_SQL.split(";"):
+                s = stmt.strip()
+                if not s:
+                    continue
+                cx.execute(text(s))
+            history.init(cx)
+    except Exception as e:
+        print("DDL init error:", e)
+    for stmt in MIGRATIONS:
+        try:
+            with engine.begin() as cx:
+                cx.exec_driver_sql(stmt)
+        except Exception:
+            pass  # already applied
+# ---- end bootstrap ----
 
 def _ensure_login():
     if "user_id" not in session:
-        return redirect(url_for("index"))
+        return redirect(url_for(".index"))
     return None
 
 def _now_utc():
     return datetime.now(timezone.utc)
 
-TAROT_FILE_MAP = {
-    "the fool":"0-the-fool.jpg","the magician":"1-the-magician.jpg","the high priestess":"2-the-high-priestess.jpg",
-    "the empress":"3-the-empress.jpg","the emperor":"4-the-emperor.jpg","the hierophant":"5-the-hierophant.jpg",
-    "the lovers":"6-the-lovers.jpg","the chariot":"7-the-chariot.jpg","strength":"8-strength.jpg",
-    "the hermit":"9-the-hermit.jpg","wheel of fortune":"10-wheel-of-fortune.jpg","justice":"11-justice.jpg",
-    "the hanged man":"12-the-hanged-man.jpg","death":"13-death.jpg","temperance":"14-temperance.jpg",
-    "the devil":"15-the-devil.jpg","the tower":"16-the-tower.jpg","the star":"17-the-star.jpg",
-    "the moon":"18-the-moon.jpg","the sun":"19-the-sun.jpg","judgement":"20-judgement.jpg","the world":"21-the-world.jpg",
-}
-RUNE_FILE_MAP = {
-    "fehu":"fehu.svg","uruz":"uruz.svg","thurisaz":"thurisaz.svg","ansuz":"ansuz.svg","raidho":"raidho.svg",
-    "kenaz":"kenaz.svg","gebo":"gebo.svg","wunjo":"wunjo.svg","hagalaz":"hagalaz.svg","nauthiz":"nauthiz.svg",
-    "isa":"isa.svg","jera":"jera.svg","eihwaz":"eihwaz.svg","perthro":"perthro.svg","algiz":"algiz.svg",
-    "sowilo":"sowilo.svg","tiwaz":"tiwaz.svg","berkano":"berkano.svg","ehwaz":"ehwaz.svg","mannaz":"mannaz.svg",
-    "laguz":"laguz.svg","ingwaz":"ingwaz.svg","othala":"othala.svg","dagaz":"dagaz.svg",
-}
+def _today():
+    """The signed-in user's local date (localday.py); every daily row is keyed on it."""
+    return localday.today(session.get("tz"))
+
+def _read_cx():
+    """Connection for a read-only block: replica unless this user just wrote."""
+    return ROUTER.read(session.get("last_write_at"))
+
+def _mark_write():
+    # Pins this user's reads to the primary for DB_REPLICA_STICKY seconds
+    # and invalidates their cached dashboards
+    session["last_write_at"] = time.time()
+    DASH.bump(session["user_id"])
+
+def _not_modified(etag):
+    if etag in request.if_none_match:
+        resp = make_response("", 304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+    return None
+
+def _with_etag(html, etag):
+    resp = make_response(html)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+# Card artwork under static/ (spreads.CARD_FILES maps deck names to the image files)
 def tarot_image_url(name: Optional[str]):
     if not name: return None
     key = " ".join(name.split()).lower()
-    f = TAROT_FILE_MAP.get(key)
-    return url_for("static", filename=f"cards/tarot/{f}") if f else None
+    f = spreads.card_file("tarot", key)
+    return url_for("static", filename=f) if f else None
 def rune_image_url(name: Optional[str]):
     if not name: return None
     key = " ".join(name.split()).lower()
-    f = RUNE_FILE_MAP.get(key)
-    return url_for("static", filename=f"cards/runes/{f}") if f else None
-
-def ai_oracle_response(question:str):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    return (
-  "Today's energy suggests gentle clarity. Name two hopes and one boundary. Trust your pacing.",
-  "I am calmly guided",
-  "clarity, pacing, trust",
-)
-    from openai import OpenAI
-    client = OpenAI(api_key=api_key)
+    f = spreads.card_file("rune", key)
+    return url_for("static", filename=f) if f else None
+
+@traced("oracle")
+def ai_oracle_response(question:str, seed: Optional[str] = None, context: Optional[str] = None,
+                       user_id: Optional[str] = None):
+    """(body, affirmation, tags); the offline reading when there is no key or no budget left."""
+    offline = (
+        "Today's energy suggests gentle clarity. Name two hopes and one boundary. Trust your pacing.",
+        "I am calmly guided",
+        "clarity, pacing, trust",
+    )
+    if not os.environ.get("OPENAI_API_KEY"):
+        return offline
     system = ("You are Miss Amara, a compassionate tarot guide. Offer grounded, kind insights in plain language. "
               "Use metaphor sparingly. Never give medical/legal/financial advice. Encourage reflection and free will. "
-              "At the top include an optional line 'Primary Card: <Name>' if one fits. "
-              "End with one concise affirmation beginning with 'I am…' and 3 lowercase tags (comma-separated).")
-    user = f"Question: {question}\nRespond in 3–5 short paragraphs, then provide an affirmation and tags."
+              "Return only JSON: {\"body\": the reading in 3-4 short paragraphs, opening with 'Primary Card: <Name>' "
+              "if one fits, \"affirmation\": one concise sentence beginning with 'I am', "
+              "\"tags\": 3 lowercase tags}.")
+    user = f"Question: {question}"
+    if context:
+        user += f"\nWhat you know about this seeker (use only where it helps):\n{context}"
+    if seed:
+        user += f"\nA reading you gave for a very similar question (adapt it, don't copy it):\n{seed}"
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role":"system","content":system},{"role":"user","content":user}],
-            temperature=0.8
-        )
-        full = resp.choices[0].message.content.strip()
-        affirmation = "I am centered and guided."
-        tags = "reflection, guidance, calm"
-        return (full, affirmation, tags)
+        out = LLM.complete("oracle", system, user, user_id)
+    except llm.BudgetExceeded:
+        return offline
     except Exception:
+        current_app.logger.exception("oracle call failed")
         return ("The oracle is quiet for a moment—please try again shortly.", "I am patient with the process.","retry, patience, process")
-
-def ai_aura():
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        return {"aura_color":"lavender","emotion":"calm, receptive",
-                "keywords":"intuition, stillness, trust",
-                "affirmation":"I am gently aligned with my inner knowing."}
-    from openai import OpenAI
-    client = OpenAI(api_key=api_key)
-    system=("You are Miss Amara. Create a daily aura with aura_color (CSS color words), emotion (few words), "
-            "keywords (3–5, comma-separated), affirmation (starts with 'I am'). Return four labeled lines.")
-    user="Generate today's aura."
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role":"system","content":system},{"role":"user","content":user}],
-        temperature=0.8
-    )
-    out = resp.choices[0].message.content.strip()
-    def grab(lbl):
-        m = re.search(f"{re.escape(lbl)}:\\s+(.*)", out, re.I)
-        return (m.group(1).strip() if m else "")
-    return {"aura_color":grab("aura_color|Color|Aura Color"),
-            "emotion":grab("emotion|Mood|Emotion"),
-            "keywords":grab("keywords"),
-            "affirmation":grab("affirmation") or "I am centered and guided."}
-
-def ai_draw(kind:str, name_hint: Optional[str]):
+    return out["body"].strip(), out["affirmation"].strip(), out["tags"]
+
+@traced("aura")
+def ai_aura(user_id: Optional[str] = None):
+    offline = {"aura_color":"lavender","emotion":"calm, receptive",
+               "keywords":"intuition, stillness, trust",
+               "affirmation":"I am gently aligned with my inner knowing."}
+    if not os.environ.get("OPENAI_API_KEY"):
+        return offline
+    system=("You are Miss Amara. Create a daily aura. Return only JSON with string fields aura_color "
+            "(CSS color words), emotion (few words), keywords (3–5, comma-separated), affirmation (starts with 'I am').")
+    try:
+        out = LLM.complete("aura", system, "Generate today's aura.", user_id)
+    except llm.BudgetExceeded:
+        return offline
+    except llm.BadOutput:
+        current_app.logger.warning("aura reply was not usable JSON; serving the offline aura")
+        return offline
+    except Exception:
+        current_app.logger.exception("aura generation failed; serving the offline aura")
+        return offline
+    return {k: (", ".join(v) if isinstance(v, list) else str(v)).strip() for k, v in out.items()}
+
+@traced("draw")
+def ai_draw(kind:str, name_hint: Optional[str], question: Optional[str] = None,
+            orientation: str = "upright", position: str = "single"):
+    """Card reading: meaning/keywords/affirmation from the library; the model only adds
+    a short personal paragraph when there is a question to answer."""
+    name = name_hint or ("The High Priestess" if kind == "tarot" else "Fehu")
+    entry = LIBRARY.lookup(kind, name, orientation, position)
+    out = {"name": name, "orientation": orientation, "keywords": entry["keywords"],
+           "meaning": entry["meaning"], "affirmation": entry["affirmation"], "personal": None}
     api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        if kind=="tarot":
-            return {"name":name_hint or "The High Priestess","keywords":"intuition, stillness, inner voice",
-                    "meaning":"Quiet your mind; answers arrive when you stop chasing.",
-                    "affirmation":"I am guided by calm inner knowing."}
-        else:
-            return {"name":name_hint or "Fehu","keywords":"beginnings, resources, flow",
-                    "meaning":"Nurture what's already in your hands and let momentum grow.",
-                    "affirmation":"I am a steward of growing gifts."}
-    from openai import OpenAI
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
-try:
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        temperature=0.7,
-        max_tokens=120,
-    )
-    ritual = resp.choices[0].message.content.strip()
-except Exception:
-    ritual = "Breathe slowly for two minutes and release one worry on the exhale."
+    if not question or not api_key:
+        return out
+    system = ("You are Miss Amara, a compassionate tarot guide. In 2-3 sentences, relate the drawn card's "
+              "meaning to the person's question. Plain, kind language; no medical/legal/financial advice.")
+    user = f"Card: {name} ({orientation}). Meaning: {entry['meaning']}\nQuestion: {question}"
+    try:
+        out["personal"] = LLM.complete("draw", system, user, session.get("user_id")) or None
+    except llm.BudgetExceeded:
+        pass
+    except Exception:
+        current_app.logger.exception("personal reading failed")
+    return out
 
-@app.route("/")
+@bp.route("/")
 def index():
     with ENGINE.begin() as cx:
         c = cx.execute(text("SELECT COUNT(*) FROM users")).scalar()
     return render_template("index.html", signup_count=c)
-@app.route("/signup", methods=["POST"])
+@bp.route("/signup", methods=["POST"])
 def signup():
     email = (request.form.get("email") or "").strip().lower()
     if not email or "@" not in email:
-        return redirect(url_for("index"))
+        return redirect(url_for(".index"))
+    tz = request.form.get("tz")
+    tz = tz if localday.valid(tz) else None
 
     # Create-or-get user in DB so session maps to a real user
     with ENGINE.begin() as cx:
         try:
             uid = str(uuid.uuid4())
             cx.exec_driver_sql(
-                "INSERT INTO users (id, email) VALUES (:id, :email)",
-                {"id": uid, "email": email},
+                "INSERT INTO users (id, email, tz) VALUES (:id, :email, :tz)",
+                {"id": uid, "email": email, "tz": tz},
             )
         except IntegrityError:
-            uid = cx.exec_driver_sql(
-                "SELECT id FROM users WHERE email = :email",
+            row = cx.exec_driver_sql(
+                "SELECT id, tz FROM users WHERE email = :email",
                 {"email": email},
-            ).scalar_one_or_none()
-            if uid is None:
+            ).first()
+            if row is None:
                 return "Could not find or create user", 500
+            uid = row[0]
+            if tz and tz != row[1]:
+                cx.exec_driver_sql("UPDATE users SET tz = :tz WHERE id = :id", {"tz": tz, "id": uid})
+            tz = tz or row[1]
 
     session["email"] = email
     session["user_id"] = uid
-    return redirect(url_for("app_view"))
+    session["tz"] = tz
+    _mark_write()
+    return redirect(url_for(".app_view"))
+
+# The browser reports its zone (Intl API) when it differs from the session's
+@bp.route("/settings/timezone", methods=["POST"])
+def set_timezone():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "login_required"}), 401
+    tz = (request.get_json(silent=True) or {}).get("tz") or request.form.get("tz")
+    if not localday.valid(tz):
+        return jsonify({"ok": False, "error": "bad_timezone"}), 400
+    with ENGINE.begin() as cx:
+        cx.execute(text("UPDATE users SET tz = :tz WHERE id = :u"), {"tz": tz, "u": session["user_id"]})
+    session["tz"] = tz
+    _mark_write()  # cached dashboards were keyed on the old day
+    return jsonify({"ok": True, "tz": tz, "today": localday.today(tz)})
 
-@app.route("/healthz")
+@bp.route("/healthz")
 def healthz():
-    # Reuse the same DB check as /readyz
-    return readyz()
+    # Liveness only: answering at all is the check (dependencies belong to /readyz)
+    return "ok", 200
 
 
-@app.route("/app")
+@bp.route("/app")
 def app_view():
   gate = _ensure_login()
-  if gate:
+  if gate: return gate
 
-    uid = session["user_id"]
+  uid = session["user_id"]
+  ver = DASH.version(uid)
+  etag = DASH.etag(uid, "app", ver)
+  unchanged = _not_modified(etag)
+  if unchanged: return unchanged
 
-  with ENGINE.begin() as cx:
+  data = DASH.get_or_set(uid, "app", ver, lambda: _load_app_dashboard(uid))
+  return _with_etag(render_template("app.html", **data), etag)
+
+
+def _load_app_dashboard(uid):
+  with _read_cx() as cx:
     # Recent rune draws (10)
-    sql_rune_histt = (
+    sql_rune_hist = (
       "SELECT name, keywords, created_at, draw_date FROM daily_draws "
-      "WHERE user_id=:u AND kind='rune' ORDER BY draw_date DESC LIMIT 10"
-    )
-    rune_histt = cx.execute(text(sql_rune_hist), {"u": uid}).mappings().all()
-
-    # Recent questions + answers (20)
-    sql_rows = (
-      "SELECT q.created_at, a.body, a.affirmation, a.tags_csv "
-      "FROM questions q "
-      "LEFT JOIN answers a ON a.question_id = q.id "
-      "WHERE q.user_id = :u "
-      "ORDER BY q.created_at DESC "
-      "LIMIT 20"
+      "WHERE user_id=:u AND kind='rune' AND unseen = 0 ORDER BY draw_date DESC LIMIT 10"
     )
-    rows = cx.execute(text(sql_rows), {"u": uid}).mappings().all()
+    rune_hist = [dict(r) for r in cx.execute(text(sql_rune_hist), {"u": uid}).mappings()]
+
+    # Recent questions + answers (20); falls through to archived months for quiet users
+    rows = history.recent(cx, uid, 20)
 
     # Last question time
     sql_last = (
@@ -536,79 +974,94 @@ def app_view():
     )
     last = cx.execute(text(sql_last), {"u": uid}).scalar()
 
-  return render_template("app.html", rows=rows, last=last, rune_histt=rune_hist)
+  return {"rows": rows, "last": last, "rune_hist": rune_hist}
 
 
 
-@app.route("/daily")
+@bp.route("/daily")
 def daily_view():
   gate = _ensure_login()
   if gate: return gate
 
   uid = session["user_id"]
+  ver = DASH.version(uid)
+  day = _today().isoformat()  # "today" moves at local midnight even without a write
+  etag = DASH.etag(uid, "daily", ver, day)
+  unchanged = _not_modified(etag)
+  if unchanged: return unchanged
 
-  with ENGINE.begin() as cx:
+  data = DASH.get_or_set(uid, "daily", ver, lambda: _load_daily_dashboard(uid, day), day)
+  return _with_etag(render_template("daily.html", **data), etag)
+
+
+def _load_daily_dashboard(uid, day):
+  with _read_cx() as cx:
     # Today's entry (if any)
     sql_today = (
       "SELECT aura_color, emotion, keywords, affirmation, created_at "
-      "FROM daily_entries WHERE user_id=:u AND entry_date=CURRENT_DATE"
+      "FROM daily_entries WHERE user_id=:u AND entry_date=:d"
     )
-    today = cx.execute(text(sql_today), {"u": uid}).mappings().first()
+    today = cx.execute(text(sql_today), {"u": uid, "d": day}).mappings().first()
+    today = dict(today) if today else None
 
     # Recent 14 days of entries
     sql_hist = (
       "SELECT aura_color, emotion, keywords, affirmation, created_at, entry_date "
       "FROM daily_entries WHERE user_id=:u ORDER BY entry_date DESC LIMIT 14"
     )
-    hist = cx.execute(text(sql_hist), {"u": uid}).mappings().all()
+    hist = [dict(r) for r in cx.execute(text(sql_hist), {"u": uid}).mappings()]
 
     # Recent rune draws (optional)
     sql_rune_hist = (
       "SELECT name, keywords, created_at, draw_date FROM daily_draws "
-      "WHERE user_id=:u AND kind='rune' ORDER BY draw_date DESC LIMIT 10"
+      "WHERE user_id=:u AND kind='rune' AND unseen = 0 ORDER BY draw_date DESC LIMIT 10"
     )
-    rune_hist = cx.execute(text(sql_rune_hist), {"u": uid}).mappings().all()
+    rune_hist = [dict(r) for r in cx.execute(text(sql_rune_hist), {"u": uid}).mappings()]
 
-  return render_template("daily.html", today=today, hist=hist, rune_hist=rune_hist)
-@app.route("/daily/generate", methods=["POST"])
+  return {"today": today, "hist": hist, "rune_hist": rune_hist}
+@bp.route("/daily/generate", methods=["POST"])
+@IDEM.guard("daily_generate")
 def daily_generate():
   gate = _ensure_login()
   if gate: return gate
 
   uid = session["user_id"]
-  data = ai_aura()  # returns aura_color, emotion, keywords, affirmation
+  data = ai_aura(uid)  # returns aura_color, emotion, keywords, affirmation
 
   # Upsert today's daily entry
   with ENGINE.begin() as cx:
     sql = (
       "INSERT INTO daily_entries (id, user_id, entry_date, aura_color, emotion, keywords, affirmation) "
-      "VALUES (:id, :u, CURRENT_DATE, :c, :e, :k, :a) "
+      "VALUES (:id, :u, :d, :c, :e, :k, :a) "
       "ON CONFLICT (user_id, entry_date) DO UPDATE SET "
-      "aura_color = :c, emotion = :e, keywords = :k, affirmation = :a, created_at = now()"
+      "aura_color = :c, emotion = :e, keywords = :k, affirmation = :a, created_at = CURRENT_TIMESTAMP"
     )
     cx.execute(
       text(sql),
       {
         "id": str(uuid.uuid4()),
         "u": uid,
+        "d": _today(),
         "c": data["aura_color"],
         "e": data["emotion"],
         "k": data["keywords"],
         "a": data["affirmation"],
       },
     )
+  _mark_write()
 
   # (Optional) recent rune history to show client
   with ENGINE.begin() as cx:
     sql_rune_hist = (
       "SELECT name, keywords, created_at, draw_date FROM daily_draws "
-      "WHERE user_id=:u AND kind='rune' ORDER BY draw_date DESC LIMIT 10"
+      "WHERE user_id=:u AND kind='rune' AND unseen = 0 ORDER BY draw_date DESC LIMIT 10"
     )
     rune_hist = cx.execute(text(sql_rune_hist), {"u": uid}).mappings().all()
 
   return jsonify({"ok": True, "aura": data, "rune_hist": rune_hist})
 
-@app.route("/ask", methods=["POST"])
+@bp.route("/ask", methods=["POST"])
+@IDEM.guard("ask")
 def ask():
     # --- Auth gate (dev bypass) ---
     if AUTH_BYPASS:
@@ -631,6 +1084,7 @@ def ask():
             text("SELECT created_at FROM questions WHERE user_id=:u ORDER BY created_at DESC LIMIT 1"),
             {"u": uid}
         ).scalar()
+        context = user_context.load_prompt(cx, uid)
     if ENFORCE_RATE_LIMIT and last and (_now_utc() - last) < timedelta(hours=24):
         return jsonify({"ok": False, "error": "rate_limited"}), 429
 
@@ -640,10 +1094,17 @@ def ask():
 
 
 
+    # --- Near-duplicate: serve a past answer outright, or seed the model with it ---
+    match = _similar_answer(q, uid)
+
     # --- Generate answer ---
     try:
-        body, aff, tags_csv = ai_oracle_response(q)
-        tags = tags_csv  # keep 'tags' name for compatibility
+        if match and match["score"] >= SIMILAR_SERVE:
+            body, aff, tags = match["body"], match["affirmation"], match["tags_csv"]
+        else:
+            body, aff, tags_csv = ai_oracle_response(q, seed=match["body"] if match else None, context=context,
+                                                  user_id=uid)
+            tags = tags_csv  # keep 'tags' name for compatibility
     except Exception:
         body, aff, tags = (
             "Sorry, I couldn't think of a reply just now.",
@@ -652,11 +1113,9 @@ def ask():
         )
 
     # Normalize tags -> list[str]
-    if not tags:
-        tags = []
-    elif isinstance(tags, str):
-        tags = [t.strip() for t in tags.split(",") if t.strip()]
+    tags = themes.normalize_tags(tags)
     tags_csv = ",".join(tags)
+    aid = str(uuid.uuid4())
 
     now = _now_utc()
 
@@ -675,7 +1134,7 @@ def ask():
                 VALUES (:id, :qid, :body, :aff, :tags_csv, :created_at)
             """),
             {
-                "id": str(uuid.uuid4()),
+                "id": aid,
                 "qid": qid,
                 "body": body,
                 "aff": aff,
@@ -683,7 +1142,175 @@ def ask():
                 "created_at": now,
             },
         )
+        themes.write_tags(cx, aid, uid, tags, now)
+    _mark_write()
+    if SIMILAR_INDEX:
+        try:
+            _similar().add(qid, q, uid)
+        except Exception:
+            current_app.logger.exception("similar index append failed")
+    try:
+        user_context.record_ask(ENGINE, uid, q, tags, now)
+    except Exception:
+        current_app.logger.exception("user context update failed")
+
+    return jsonify({"ok": True, "question_id": qid, "body": body, "affirmation": aff, "tags": tags,
+                    "similar_to": match["question_id"] if match else None})
+
+def after_fork():
+    """Drop anything inherited from a preloading parent (pool connections, HTTP clients)."""
+    global _llm_client
+    ENGINE.dispose(close=False)
+    if ROUTER.replica is not None:
+        ROUTER.replica.dispose(close=False)
+    reset = getattr(DASH.backend, "reset", None)
+    if reset:
+        reset()
+    _llm_client = None
+    HEALTH.ensure_started()  # probe threads don't survive fork; start this worker's now
+
+
+def create_app():
+    app = Flask(__name__, static_folder="static", template_folder="templates")
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret")
+    app.json = jsonio.FastJSONProvider(app)  # rows, dates and UUIDs serialize directly
+    app.register_blueprint(bp)
+    # Shed excess LLM/write traffic with 503 + Retry-After before it takes every worker thread
+    gate = admission.init_app(app, route_class)
+    if gate:
+        def admission_stats():
+            if not tracing.metrics_authorized(request):
+                return jsonify({"ok": False, "error": "forbidden"}), 403
+            return jsonify(gate.stats())
+
+        app.add_url_rule("/metrics/admission", "admission_stats", admission_stats)
+    # /metrics (Prometheus, METRICS_TOKEN set); spans, Server-Timing and JSON request logs with TRACING=1
+    tracing.init_app(app, [e for e in (ENGINE, ROUTER.replica) if e is not None],
+                     lambda: tracing.gauges("amara_db_pool", pool_stats(ENGINE))
+                     + (tracing.gauges("amara_db_replica_pool", pool_stats(ROUTER.replica)) if ROUTER.replica else [])
+                     + HEALTH.metrics() + (gate.metrics() if gate else []))
+    # Sampled, sanitized request records for `python -m bench.replay` (CAPTURE_SAMPLE > 0)
+    capture.init_app(app, skip=HEALTH_ENDPOINTS)
+    # Admin-only sampling profiler and per-request cProfile (PROFILE_TOKEN set)
+    profiler.init_app(app)
+
+    if SCHEMA_AUTO_INIT:
+        schema = {"ready": False}
+        schema_lock = threading.Lock()
+
+        @app.before_request
+        def _ensure_schema():
+            if schema["ready"]:
+                return
+            with schema_lock:
+                if not schema["ready"]:
+                    init_db()
+                    schema["ready"] = True
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Create all tables."""
+        init_db()
+        print("schema ready")
+
+    @app.cli.command("library-build")
+    @click.option("--llm/--offline", default=False, help="Write meanings with the model (needs OPENAI_API_KEY).")
+    @click.option("--activate/--no-activate", default=True)
+    def library_build_command(llm, activate):
+        """Generate a new card_library version (card x orientation x position)."""
+        init_db()
+        build_library(ENGINE, _llm() if llm else None, activate=activate)
+
+    @app.cli.command("card-counts-repair")
+    @click.option("--user", "uid", default=None, help="Only check this user's rollups.")
+    def card_counts_repair_command(uid):
+        """Recompute card_counts* rollups from the cards table and fix drift."""
+        init_db()
+        tracker.repair(ENGINE, uid)
+
+    @app.cli.command("idempotency-purge")
+    def idempotency_purge_command():
+        """Delete idempotency keys past IDEM_TTL."""
+        print(f"purged {IDEM.purge()} idempotency keys")
+
+    @app.cli.command("tags-backfill")
+    @click.option("--chunk", default=2000, show_default=True, help="Answers per transaction.")
+    @click.option("--after", default="", help="Resume after this answer id.")
+    @click.option("--pause", default=0.0, help="Seconds to sleep between chunks.")
+    def tags_backfill_command(chunk, after, pause):
+        """Fill answer_tags from answers.tags_csv (idempotent, resumable)."""
+        init_db()
+        themes.backfill(ENGINE, chunk, after, pause)
+
+    @app.cli.command("context-rebuild")
+    @click.option("--user", "uid", default=None, help="Only rebuild this user's context.")
+    def context_rebuild_command(uid):
+        """Recreate per-user oracle context summaries from question and draw history."""
+        init_db()
+        user_context.rebuild(ENGINE, uid)
+
+    @app.cli.command("daily-rollover")
+    @click.option("--lead", default=localday.ROLLOVER_LEAD_MINUTES, show_default=True,
+                  help="Warm cohorts whose local midnight is this many minutes away or less.")
+    @click.option("--pause", default=0.0, show_default=True, help="Seconds to sleep between users.")
+    def daily_rollover_command(lead, pause):
+        """Pre-create the next local day's draws and card images per timezone (cron, every ~10 minutes)."""
+        init_db()
+
+        def warm(uid, day):
+            for kind in ("tarot", "rune"):
+                row = upsert_daily_draw(kind, uid, day, prewarm=True)
+                SPREAD_CACHE.get_or_render(kind, "single", [(row["name"], row["orientation"] or "upright")], "webp")
+
+        localday.rollover(ENGINE, warm, lead, pause)
+
+    @app.cli.command("llm-usage")
+    @click.option("--days", default=7, show_default=True)
+    def llm_usage_command(days):
+        """Model calls and tokens per day and route, all users."""
+        init_db()
+        for r in LLM.usage(days):
+            print(f"{r['day']}  {r['route']:<8} {r['calls']:>6} calls {r['failures']:>4} bad  "
+                  f"{r['prompt_tokens']:>9} in {r['completion_tokens']:>8} out")
+
+    @app.cli.command("history-archive")
+    @click.option("--hot-days", default=history.HISTORY_HOT_DAYS, show_default=True,
+                  help="Keep this many days in questions/answers.")
+    @click.option("--file-months", default=history.HISTORY_FILE_MONTHS, show_default=True,
+                  help="Months older than this move from cold tables to per-user files.")
+    @click.option("--batch", default=1000, show_default=True, help="Rows per transaction.")
+    @click.option("--pause", default=0.0, help="Seconds to sleep between batches.")
+    def history_archive_command(hot_days, file_months, batch, pause):
+        """Move old questions/answers into monthly cold storage (idempotent, run nightly)."""
+        init_db()
+        history.archive(ENGINE, hot_days, file_months, batch, pause)
+
+    @app.cli.command("similar-rebuild")
+    def similar_rebuild_command():
+        """Re-index all questions for near-duplicate lookup (learns IDF, clusters; run nightly)."""
+        from similar import rebuild
+
+        def rows():
+            with ENGINE.connect() as cx:
+                res = cx.execution_options(yield_per=5000).execute(
+                    text("SELECT id, user_id, body FROM questions ORDER BY created_at, id"))
+                for qid, uid, body in res:
+                    yield qid, uid, body
+
+        rebuild(rows)
+
+    @app.cli.command("library-activate")
+    @click.argument("version", type=int)
+    def library_activate_command(version):
+        """Switch workers to another library version (picked up within LIBRARY_CHECK_SECS)."""
+        activate_version(ENGINE, version)
+        print(f"library v{version} active")
+
+    return app
+
+
+# gunicorn entry point (app:app); building the app does no network or DB I/O
+app = create_app()
 
-    return jsonify({"ok": True, "question_id": qid, "body": body, "affirmation": aff, "tags": tags})
 if __name__ == "__main__":
     app.run(host="127.0.0.1", port=5000, debug=True)
@@ -0,0 +1,115 @@
+"""Check that /healthz stays fast while the llm admission class is saturated.
+
+    python -m bench.admission
+    python -m bench.admission --threads 8 --llm-latency 2 --out bench/results/admission.json
+
+Boots a one-worker gthread gunicorn around a stand-in app (an llm route that
+sleeps like a model call, and /healthz) wrapped in the real admission
+middleware with the default limits for --threads. It fires more llm requests
+than limit + queue at once, then times /healthz while they are in flight.
+Checks: /healthz p95 under --health-budget-ms, and exactly limit + queue llm
+requests served while the rest get 503. Exits non-zero if a check fails.
+"""
+import argparse, json, os, subprocess, sys, threading, time
+
+import requests
+
+from bench.run import ROOT, _free_port
+
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", "2"))
+
+
+def create_app():
+    from flask import Flask
+
+    import admission
+
+    app = Flask(__name__)
+
+    @app.route("/llm", methods=["POST"])
+    def llm():
+        time.sleep(LLM_LATENCY)
+        return {"ok": True}
+
+    @app.route("/healthz")
+    def healthz():
+        return "ok"
+
+    admission.init_app(app, lambda endpoint, method: "health" if endpoint == "healthz" else "llm")
+    return app
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--llm-latency", type=float, default=2.0)
+    ap.add_argument("--extra", type=int, default=4, help="llm requests beyond limit + queue")
+    ap.add_argument("--health-budget-ms", type=float, default=100.0)
+    ap.add_argument("--out", help="write JSON results here")
+    a = ap.parse_args()
+
+    import admission
+    limit, queue, _ = admission._defaults(a.threads, admission.ADMIT_RESERVE)["llm"]
+    port = _free_port()
+    env = dict(os.environ, ADMISSION="1", GUNICORN_THREADS=str(a.threads), BENCH_LLM_LATENCY=str(a.llm_latency))
+    proc = subprocess.Popen(["gunicorn", "-w", "1", "-k", "gthread", "--threads", str(a.threads),
+                             "-b", f"127.0.0.1:{port}", "--log-level", "warning", "bench.admission:create_app()"],
+                            cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                requests.get(base + "/healthz", timeout=1)
+                break
+            except requests.RequestException:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise RuntimeError("stand-in app did not start")
+                time.sleep(0.1)
+
+        statuses = []
+        lock = threading.Lock()
+
+        def ask():
+            code = requests.post(base + "/llm", timeout=60).status_code
+            with lock:
+                statuses.append(code)
+
+        fired = [threading.Thread(target=ask) for _ in range(limit + queue + a.extra)]
+        for t in fired:
+            t.start()
+        time.sleep(min(0.5, a.llm_latency / 4))  # let the llm class fill up
+        health = []
+        while any(t.is_alive() for t in fired) and len(health) < 50:
+            t0 = time.perf_counter()
+            requests.get(base + "/healthz", timeout=10)
+            health.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.02)
+        for t in fired:
+            t.join()
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+    served, shed = statuses.count(200), statuses.count(503)
+    checks = {"healthz_fast": bool(health) and _pct(health, 95) < a.health_budget_ms,
+              "llm_served_limit_plus_queue": served == limit + queue,
+              "llm_rest_shed": shed == a.extra}
+    result = {"threads": a.threads, "llm": {"limit": limit, "queue": queue, "served": served, "shed": shed},
+              "healthz_ms": {"n": len(health), "p50": _pct(health, 50) if health else None,
+                             "p95": _pct(health, 95) if health else None},
+              "checks": checks, "ok": all(checks.values())}
+    print(json.dumps(result, indent=2))
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Diff two bench.run result files route by route.
+
+    python -m bench.compare bench/results/base.json bench/results/new.json
+"""
+import argparse, json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "rps")
+
+
+def _delta(old, new):
+    if old in (None, 0) or new is None:
+        return "n/a"
+    return f"{100.0 * (new - old) / old:+.1f}%"
+
+
+def _num(v):
+    return "-" if v is None else f"{v:.1f}"
+
+
+def compare(base, new):
+    lines = [f"base {base['meta'].get('commit')}  ->  new {new['meta'].get('commit')}"]
+    for target in sorted(set(base["targets"]) | set(new["targets"])):
+        b, n = base["targets"].get(target), new["targets"].get(target)
+        if not b or not n:
+            lines.append(f"\n{target}: only in {'base' if b else 'new'}")
+            continue
+        lines.append(f"\n{target}: journeys/s {b['journeys_per_s']} -> {n['journeys_per_s']} "
+                     f"({_delta(b['journeys_per_s'], n['journeys_per_s']).strip()})")
+        lines.append(f"  {'route':<24}" + "".join(f"{m:>28}" for m in METRICS) + f"{'503':>12}{'errors':>12}")
+        for label in sorted(set(b["routes"]) | set(n["routes"])):
+            br, nr = b["routes"].get(label, {}), n["routes"].get(label, {})
+            cells = "".join(
+                f"{_num(br.get(m))} -> {_num(nr.get(m))} ({_delta(br.get(m), nr.get(m))})".rjust(28)
+                for m in METRICS)
+            shed = f"{br.get('shed', '-')} -> {nr.get('shed', '-')}"  # results older than the shed field show '-'
+            errs = f"{br.get('errors', '-')} -> {nr.get('errors', '-')}"
+            lines.append(f"  {label:<24}{cells}{shed:>12}{errs:>12}")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("base")
+    ap.add_argument("new")
+    a = ap.parse_args()
+    with open(a.base) as f:
+        base = json.load(f)
+    with open(a.new) as f:
+        new = json.load(f)
+    print(compare(base, new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""OpenAI-compatible chat completions stub for benchmarks.
+
+    python -m bench.llm_stub --port 8765 --latency 0.4 --chunks 8
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 and any
+OPENAI_API_KEY. Non-streaming requests sleep --latency seconds then answer;
+streaming requests spread the same latency over --chunks SSE chunks.
+"""
+import argparse, json, random, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AURA = ("aura_color: lavender\nemotion: calm, receptive\n"
+        "keywords: intuition, stillness, trust\naffirmation: I am gently aligned with my inner knowing.")
+ORACLE = ("Primary Card: The Star\nToday's energy suggests gentle clarity. Name two hopes and one boundary.\n"
+          "Trust your pacing and let the answer arrive.\nI am calmly guided\nclarity, pacing, trust")
+
+
+AURA_JSON = json.dumps({"aura_color": "lavender", "emotion": "calm, receptive",
+                        "keywords": "intuition, stillness, trust",
+                        "affirmation": "I am gently aligned with my inner knowing."})
+ORACLE_JSON = json.dumps({"body": "Primary Card: The Star\nToday's energy suggests gentle clarity. Name two hopes "
+                                  "and one boundary.\nTrust your pacing and let the answer arrive.",
+                          "affirmation": "I am calmly guided", "tags": ["clarity", "pacing", "trust"]})
+
+
+def _reply_for(messages, as_json=False):
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    if "aura" in system.lower():
+        return AURA_JSON if as_json else AURA
+    return ORACLE_JSON if as_json else ORACLE
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    chunks = 8
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _delay(self, total):
+        if total > 0:
+            time.sleep(total)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        content = _reply_for(body.get("messages") or [],
+                             (body.get("response_format") or {}).get("type") == "json_object")
+        latency = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        cid = "chatcmpl-" + uuid.uuid4().hex[:12]
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            self._stream(cid, model, content, latency)
+            return
+        self._delay(latency)
+        out = json.dumps({
+            "id": cid, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 60, "completion_tokens": len(content) // 4,
+                      "total_tokens": 60 + len(content) // 4},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _stream(self, cid, model, content, latency):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        n = max(1, self.chunks)
+        step = -(-len(content) // n)
+        for i in range(0, len(content), step):
+            self._delay(latency / n)
+            chunk = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]}
+            self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def serve(port=0, latency=0.0, jitter=0.0, chunks=8):
+    """Start the stub in a daemon thread; returns the server (server_port is the bound port)."""
+    handler = type("Handler", (StubHandler,), {"latency": latency, "jitter": jitter, "chunks": chunks})
+    srv = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.4, help="seconds per completion")
+    ap.add_argument("--jitter", type=float, default=0.1, help="+/- seconds of random latency")
+    ap.add_argument("--chunks", type=int, default=8, help="SSE chunks when stream=true")
+    a = ap.parse_args()
+    srv = serve(a.port, a.latency, a.jitter, a.chunks)
+    print(f"LLM stub on http://127.0.0.1:{srv.server_port}/v1 (latency {a.latency}s)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
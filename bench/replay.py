@@ -0,0 +1,223 @@
+"""Replay captured production traffic against a locally booted app.
+
+    python -m bench.replay var/capture/*.jsonl                    # real time
+    python -m bench.replay var/capture/capture-2026101918-*.jsonl --speed 4 --out bench/results/peak.json
+    python -m bench.replay cap.jsonl --from 18:00 --minutes 30 --speed 10
+
+Records come from capture.py (CAPTURE_SAMPLE > 0 in production). The app
+boots as in bench.run (fresh SQLite unless --db, OpenAI pointed at
+bench.llm_stub), each captured user hash gets its own signed-up session,
+and requests are sent at their original offsets divided by --speed, with
+bodies synthesized from the captured shapes. Output is bench.run-shaped
+(one "replay" target), so bench.compare diffs two replays; `lag` reports how
+far behind schedule the replayer fell (raise --max-inflight if it grows).
+"""
+import argparse, glob, json, os, random, re, shutil, tempfile, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+import spreads
+from bench import llm_stub
+from bench.run import _git, _pct, boot_app, summarize
+
+WORDS = ("will", "my", "love", "work", "this", "month", "change", "should", "I", "trust", "the", "path",
+         "ahead", "what", "does", "future", "hold", "for", "us", "after", "move")
+
+
+def load(paths, since=None, minutes=None):
+    recs = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of a file still being written
+                if r.get("route"):
+                    recs.append(r)
+    recs.sort(key=lambda r: r["ts"])
+    if since and recs:
+        day = datetime.fromtimestamp(recs[0]["ts"], timezone.utc)
+        hh, mm = (int(x) for x in since.split(":"))
+        start = day.replace(hour=hh, minute=mm, second=0, microsecond=0).timestamp()
+        recs = [r for r in recs if r["ts"] >= start]
+    if minutes and recs:
+        end = recs[0]["ts"] + minutes * 60
+        recs = [r for r in recs if r["ts"] < end]
+    return recs
+
+
+def synth(shape, rng):
+    """Inverse of capture.shape(): a value with the captured structure and lengths."""
+    if isinstance(shape, dict):
+        return {k: synth(v, rng) for k, v in shape.items()}
+    if isinstance(shape, list):
+        return [synth(v, rng) for v in shape]
+    if isinstance(shape, str) and shape.startswith("str:"):
+        n = int(shape[4:])
+        text = ""
+        while len(text) < n:
+            text += rng.choice(WORDS) + " "
+        return text[:n].strip() or "x" * n
+    return {"int": 1, "float": 1.0}.get(shape, shape)
+
+
+def _args(r):
+    args = r["args"]
+    if r.get("endpoint") == "main.spread_image" and args.get("spread") == "x":
+        # captured before spread/cards/fmt were kept: a valid three-card spread, so it renders instead of 404ing
+        kind = args.get("kind") if args.get("kind") in spreads.CARD_FILES else "tarot"
+        pick = random.Random(f"{r.get('user')}:{r.get('ts')}")
+        cards = [(n, pick.choice(("upright", "reversed"))) for n in pick.sample(list(spreads.CARD_FILES[kind]), 3)]
+        args = dict(args, kind=kind, spread="three", cards=spreads.spec(cards), fmt="webp")
+    return args
+
+
+def build_path(r):
+    args = _args(r)
+    return re.sub(r"<(?:[^:>]+:)?([^>]+)>", lambda m: str(args.get(m.group(1), "x")), r["route"])
+
+
+def request_kwargs(r, rng, user):
+    kw = {"params": r.get("query") or None}
+    if r.get("body") is not None:
+        body = synth(r["body"], rng)
+        if isinstance(body, dict):
+            if "email" in body:
+                body["email"] = f"{user or f'anon{rng.getrandbits(32):08x}'}@replay.local"
+            if "idempotency_key" in body:
+                body["idempotency_key"] = f"replay-{rng.getrandbits(64):016x}"
+        kw["json" if r.get("content_type") == "application/json" else "data"] = body
+    if r.get("idempotency_key"):
+        kw["headers"] = {"Idempotency-Key": f"replay-{rng.getrandbits(64):016x}"}
+    return kw
+
+
+def replay(base, recs, speed, max_inflight, seed=0):
+    samples, lags, lock = defaultdict(list), [], threading.Lock()
+    sessions, session_lock = {}, threading.Lock()
+    rng = random.Random(seed)
+
+    def session_for(user):
+        if not user:
+            return requests.Session()  # anonymous: a fresh visitor each time
+        with session_lock:
+            s = sessions.get(user)
+            if s is None:  # captured as logged in: sign this replay user up once
+                s = sessions[user] = requests.Session()
+                s.post(base + "/signup", data={"email": f"{user}@replay.local"}, allow_redirects=False, timeout=60)
+        return s
+
+    def send(r, kw, due):
+        s = session_for(r.get("user"))
+        t0 = time.perf_counter()
+        try:
+            status = s.request(r["method"], base + build_path(r), allow_redirects=False, timeout=120,
+                               **kw).status_code
+        except requests.RequestException:
+            status = 0
+        dur = time.perf_counter() - t0
+        with lock:
+            samples[f"{r['method']} {r['route']}"].append((status, dur))
+            lags.append(max(0.0, t0 - due))
+
+    t_first = recs[0]["ts"]
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        start = time.perf_counter()
+        for r in recs:
+            due = start + (r["ts"] - t_first) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, r, request_kwargs(r, rng, r.get("user")), due)
+    wall = time.perf_counter() - start
+    lags.sort()
+    return samples, wall, {"p50_ms": round(1000 * (_pct(lags, 50) or 0), 3),
+                           "p99_ms": round(1000 * (_pct(lags, 99) or 0), 3),
+                           "max_ms": round(1000 * (lags[-1] if lags else 0), 3)}
+
+
+def captured_latency(recs):
+    """What production saw for the same records, for a side-by-side look."""
+    by = defaultdict(list)
+    for r in recs:
+        by[f"{r['method']} {r['route']}"].append(r["dur_ms"])
+    out = {}
+    for label, xs in sorted(by.items()):
+        xs.sort()
+        out[label] = {"count": len(xs), "p50_ms": _pct(xs, 50), "p95_ms": _pct(xs, 95), "p99_ms": _pct(xs, 99)}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("files", nargs="+", help="capture JSONL files (globs are expanded)")
+    ap.add_argument("--speed", type=float, default=1.0, help="time compression: 4 = four times faster")
+    ap.add_argument("--from", dest="since", help="start at this UTC HH:MM of the first captured day")
+    ap.add_argument("--minutes", type=float, help="replay only this many captured minutes")
+    ap.add_argument("--db", help="database URL (default: a throwaway SQLite file)")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--max-inflight", type=int, default=64, help="concurrent replay requests")
+    ap.add_argument("--llm-latency", type=float, default=0.4)
+    ap.add_argument("--llm-jitter", type=float, default=0.1)
+    ap.add_argument("--keep-logs", action="store_true")
+    ap.add_argument("--out", help="results file (default bench/results/replay-<commit>.json)")
+    a = ap.parse_args()
+
+    paths = sorted({p for f in a.files for p in (glob.glob(f) or [f])})
+    recs = load(paths, a.since, a.minutes)
+    if not recs:
+        raise SystemExit("no captured requests in the selected window")
+    span = recs[-1]["ts"] - recs[0]["ts"]
+    print(f"[replay] {len(recs)} requests over {span / 60:.1f} min from {len(paths)} files, "
+          f"{len({r.get('user') for r in recs})} users, speed x{a.speed:g}", flush=True)
+
+    stub = llm_stub.serve(0, a.llm_latency, a.llm_jitter, 8)
+    tmp = tempfile.mkdtemp(prefix="amara-replay-")
+    db = a.db or f"sqlite:///{os.path.join(tmp, 'replay.db')}"
+    proc, base = boot_app(db, f"http://127.0.0.1:{stub.server_port}/v1", a.workers, a.threads,
+                          os.path.join(tmp, "app.log"))
+    try:
+        samples, wall, lag = replay(base, recs, a.speed, a.max_inflight)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        stub.shutdown()
+        if a.keep_logs:
+            print(f"[replay] app logs kept in {tmp}")
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    total = sum(len(v) for v in samples.values())
+    result = {
+        "meta": {"commit": commit, "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+                 "started_at": datetime.now(timezone.utc).isoformat(), "files": paths,
+                 "args": {k: v for k, v in vars(a).items() if k not in ("out", "files", "db")}},
+        "targets": {"replay": {"db": "postgres" if db.startswith("postgres") else "sqlite",
+                               "wall_s": round(wall, 3), "captured_s": round(span, 3),
+                               "journeys_per_s": round(total / wall, 3), "requests_per_s": round(total / wall, 3),
+                               "lag": lag, "routes": summarize(samples, wall),
+                               "captured": captured_latency(recs)}},
+    }
+    out = a.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                f"replay-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    t = result["targets"]["replay"]
+    print(f"\n{total} requests in {wall:.1f}s ({t['requests_per_s']} req/s), schedule lag p99 {lag['p99_ms']} ms")
+    print(f"  {'route':<32}{'n':>7}{'err':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'prod p95':>10}")
+    for label, r in t["routes"].items():
+        prod = t["captured"].get(label, {}).get("p95_ms")
+        print(f"  {label:<32}{r['count']:>7}{r['errors']:>6}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{prod if prod is not None else float('nan'):>10.1f}")
+    print(f"\nwrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Check read-replica routing with two SQLite files standing in for primary and replica.
+
+    python -m bench.replica
+    python -m bench.replica --out bench/results/replica.json
+
+Each file holds a one-row `whoami` table naming itself, so every read shows
+where it was routed. Checks, in order: plain reads go to the replica; a
+recent write pins reads to the primary (read-your-writes); an unreachable
+replica falls back to the primary at checkout and is then avoided for the
+cooldown; a query error inside a replica read is raised but keeps the replica
+in use; a connection lost inside a replica read marks it down for the next
+read. Exits non-zero if any check fails.
+"""
+import argparse, json, os, shutil, sys, tempfile, time
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+import db
+from db import ReplicaRouter, make_engine
+
+
+def _file_db(path, name):
+    engine = make_engine(f"sqlite:///{path}")
+    with engine.begin() as cx:
+        cx.exec_driver_sql("CREATE TABLE whoami (name TEXT)")
+        cx.execute(text("INSERT INTO whoami (name) VALUES (:n)"), {"n": name})
+    engine.dispose()
+
+
+def _where(router, last_write_at=None):
+    with router.read(last_write_at) as cx:
+        return cx.execute(text("SELECT name FROM whoami")).scalar()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", help="write JSON results here")
+    a = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="amara-replica-")
+    replica_dir = os.path.join(tmp, "replica")
+    os.mkdir(replica_dir)
+    _file_db(os.path.join(tmp, "primary.db"), "primary")
+    _file_db(os.path.join(replica_dir, "replica.db"), "replica")
+    primary = make_engine(f"sqlite:///{os.path.join(tmp, 'primary.db')}")
+    replica = make_engine(f"sqlite:///{os.path.join(replica_dir, 'replica.db')}")
+    router = ReplicaRouter(primary, replica)
+    checks = {}
+    try:
+        checks["read_goes_to_replica"] = _where(router) == "replica"
+        checks["recent_write_reads_primary"] = _where(router, time.time()) == "primary"
+        checks["old_write_reads_replica"] = _where(router, time.time() - db.DB_REPLICA_STICKY - 1) == "replica"
+
+        # replica unreachable: pooled connections gone and the file can't be opened
+        replica.dispose()
+        shutil.rmtree(replica_dir)
+        router.lag_checked = time.monotonic()  # skip the lag probe: the checkout itself must fail over
+        checks["dead_replica_falls_back"] = _where(router) == "primary"
+        checks["dead_replica_marked_down"] = router.stats()["down"]
+        checks["cooldown_reads_primary"] = _where(router) == "primary"
+
+        # query error inside a replica read: re-raised, the replica stays in use
+        os.mkdir(replica_dir)
+        _file_db(os.path.join(replica_dir, "replica.db"), "replica")
+        router.down_until = router.lag_checked = 0.0
+        try:
+            with router.read() as cx:
+                cx.exec_driver_sql("CREATE TEMP TABLE one (x UNIQUE)")
+                cx.exec_driver_sql("INSERT INTO one VALUES (1), (1)")
+            checks["query_error_raised"] = False
+        except IntegrityError:
+            checks["query_error_raised"] = True
+        checks["query_error_keeps_replica"] = _where(router) == "replica"
+
+        # connection lost inside a replica read: re-raised, then the replica is avoided
+        try:
+            with router.read() as cx:
+                cx.connection.dbapi_connection.close()  # what a replica restart does to a hot connection
+                cx.execute(text("SELECT name FROM whoami"))
+            checks["lost_connection_raised"] = False
+        except DBAPIError as e:
+            checks["lost_connection_raised"] = e.connection_invalidated
+        checks["lost_connection_marks_down"] = _where(router) == "primary"
+        reads = router.stats()["reads"]
+    finally:
+        primary.dispose()
+        replica.dispose()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    result = {"checks": checks, "reads": reads, "ok": all(checks.values())}
+    print(json.dumps(result, indent=2))
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
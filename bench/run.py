@@ -0,0 +1,273 @@
+"""Drive scripted user journeys against a locally booted app and record latencies.
+
+    python -m bench.run                                   # SQLite only
+    python -m bench.run --postgres postgresql://localhost/amara_bench
+    python -m bench.run --vus 16 --duration 60 --llm-latency 0.8 --out bench/results/base.json
+
+Each target database gets a fresh app process with OpenAI pointed at
+bench.llm_stub: gunicorn with the production config (gunicorn.conf.py:
+preload + post_fork) when installed, else the Flask dev server. Virtual users
+loop the journey /signup -> /app -> /ask -> /daily/generate -> /draw/<kind>
+until --duration runs out. Results (per-route count, errors, p50/p95/p99,
+throughput) are written as JSON; compare two runs with bench.compare.
+
+Admission limits are pinned: every class gets an explicit ADMIT_* (the
+app's defaults for --threads unless --admit overrides one), and the values
+used go into meta.admission. Shed requests (503) are counted per route as
+"shed" and kept out of the latency percentiles and "errors", so p50/p95
+measure requests that were actually served.
+"""
+import argparse, json, os, platform, shutil, socket, subprocess, sys, tempfile, threading, time, uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import requests
+
+import admission
+from bench import llm_stub
+from bench.seed import seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git(*args):
+    try:
+        return subprocess.check_output(["git", *args], cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def boot_app(db_url, llm_url, workers, threads, log_path, env_extra=None):
+    """Start the app in a subprocess and wait for /readyz; returns (proc, base_url).
+
+    App output goes to `log_path`: a pipe nobody drains would fill up with
+    tracebacks and stall the workers mid-run.
+    """
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=db_url, OPENAI_BASE_URL=llm_url, OPENAI_API_KEY="bench",
+               AUTH_BYPASS="1", ENFORCE_RATE_LIMIT="0", WEB_CONCURRENCY=str(workers),
+               GUNICORN_THREADS=str(threads), **(env_extra or {}))
+    if shutil.which("gunicorn"):
+        # workers/threads come from WEB_CONCURRENCY/GUNICORN_THREADS via the prod config
+        cmd = ["gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"]
+    else:
+        cmd = [sys.executable, "-c",
+               f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    with open(log_path, "ab") as log:
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            with open(log_path, "rb") as log:
+                raise RuntimeError("app exited during boot:\n" + log.read().decode(errors="replace")[-4000:])
+        try:
+            if requests.get(base + "/readyz", timeout=1).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("app did not become ready within 60s")
+
+
+def journey(base, run_id, n, record):
+    """One scripted visit; `record(route, status, seconds)` is called per request."""
+    s = requests.Session()
+
+    def hit(label, method, path, **kw):
+        t0 = time.perf_counter()
+        try:
+            r = s.request(method, base + path, allow_redirects=False, timeout=60, **kw)
+            status = r.status_code
+        except requests.RequestException:
+            status = 0
+        record(label, status, time.perf_counter() - t0)
+
+    hit("POST /signup", "POST", "/signup", data={"email": f"vu-{run_id}-{n}@bench.local"})
+    hit("GET /app", "GET", "/app")
+    hit("POST /ask", "POST", "/ask", json={"question": "What should I focus on this week?"})
+    hit("POST /daily/generate", "POST", "/daily/generate")
+    hit("GET /draw/<kind>", "GET", "/draw/tarot")
+    hit("GET /draw/<kind>", "GET", "/draw/rune")
+    hit("GET /app", "GET", "/app")
+
+
+def _pct(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = max(0, min(len(sorted_vals) - 1, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def _ms(v):
+    return None if v is None else round(1000 * v, 3)
+
+
+def summarize(samples, wall):
+    """Per-route stats; latencies cover served requests only (503 sheds are counted apart)."""
+    routes = {}
+    for label, vals in sorted(samples.items()):
+        lat = sorted(v for st, v in vals if st != 503)
+        statuses = defaultdict(int)
+        for st, _ in vals:
+            statuses[str(st)] += 1
+        routes[label] = {
+            "count": len(vals),
+            "served": len(lat),
+            "shed": statuses.get("503", 0),
+            "errors": sum(1 for st, _ in vals if st == 0 or (st >= 400 and st != 503)),
+            "status": dict(statuses),
+            "rps": round(len(lat) / wall, 3),
+            "mean_ms": _ms(sum(lat) / len(lat)) if lat else None,
+            "p50_ms": _ms(_pct(lat, 50)),
+            "p95_ms": _ms(_pct(lat, 95)),
+            "p99_ms": _ms(_pct(lat, 99)),
+            "max_ms": _ms(lat[-1]) if lat else None,
+        }
+    return routes
+
+
+def admission_env(a):
+    """ADMISSION and one ADMIT_<CLASS> per limited class, pinned so a stray shell variable can't change them."""
+    if not a.admission:
+        return {"ADMISSION": "0"}
+    limits = admission._defaults(a.threads)
+    for spec in a.admit:
+        cls, _, cfg = spec.partition("=")
+        limit, queue, deadline = cfg.split(",")
+        limits[cls] = (int(limit), int(queue), float(deadline))
+    env = {"ADMISSION": "1"}
+    for cls, (limit, queue, deadline) in limits.items():
+        env[f"ADMIT_{cls.upper()}"] = f"{limit},{queue},{deadline}"
+    return env
+
+
+def run_target(name, db_url, a, llm_url, log_path):
+    run_id = uuid.uuid4().hex[:8]
+    tmp = os.path.dirname(log_path)
+    env = dict(admission_env(a),  # plus per-target cache and index, so runs don't see each other's state
+               CACHE_URL=f"sqlite:///{os.path.join(tmp, f'dash-{name}.db')}",
+               SIMILAR_DIR=os.path.join(tmp, f"similar-{name}"))
+    proc, base = boot_app(db_url, llm_url, a.workers, a.threads, log_path, env)
+    try:
+        seeded = seed(db_url, a.seed_users, a.seed_questions, prefix=f"seed-{run_id}") if a.seed_users else {}
+        samples, lock = defaultdict(list), threading.Lock()
+        journeys = [0]
+
+        def record(label, status, seconds):
+            with lock:
+                samples[label].append((status, seconds))
+
+        for i in range(a.warmup):
+            journey(base, run_id, f"warm{i}", lambda *x: None)
+
+        stop_at = time.time() + a.duration
+
+        def vu(k):
+            n = 0
+            while time.time() < stop_at:
+                journey(base, run_id, f"{k}-{n}", record)
+                n += 1
+                with lock:
+                    journeys[0] += 1
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=vu, args=(k,)) for k in range(a.vus)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    total = sum(len(v) for v in samples.values())
+    return {
+        "db": name,
+        "seeded": seeded,
+        "wall_s": round(wall, 3),
+        "journeys": journeys[0],
+        "journeys_per_s": round(journeys[0] / wall, 3),
+        "requests_per_s": round(total / wall, 3),
+        "routes": summarize(samples, wall),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--postgres", help="also run against this Postgres URL (use a scratch database)")
+    ap.add_argument("--no-sqlite", action="store_true", help="skip the SQLite target")
+    ap.add_argument("--vus", type=int, default=8, help="concurrent virtual users")
+    ap.add_argument("--duration", type=float, default=20, help="seconds per target")
+    ap.add_argument("--warmup", type=int, default=2, help="journeys before measuring")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=int(os.getenv("GUNICORN_THREADS", "8")))
+    ap.add_argument("--no-admission", dest="admission", action="store_false", help="run with ADMISSION=0")
+    ap.add_argument("--admit", action="append", default=[], metavar="CLASS=LIMIT,QUEUE,DEADLINE",
+                    help="override one admission class, e.g. --admit llm=4,2,5")
+    ap.add_argument("--llm-latency", type=float, default=0.4)
+    ap.add_argument("--llm-jitter", type=float, default=0.1)
+    ap.add_argument("--llm-chunks", type=int, default=8)
+    ap.add_argument("--seed-users", type=int, default=200)
+    ap.add_argument("--seed-questions", type=int, default=30)
+    ap.add_argument("--keep-logs", action="store_true", help="keep the app's stdout/stderr logs")
+    ap.add_argument("--out", help="results file (default bench/results/<commit>.json)")
+    a = ap.parse_args()
+
+    stub = llm_stub.serve(0, a.llm_latency, a.llm_jitter, a.llm_chunks)
+    llm_url = f"http://127.0.0.1:{stub.server_port}/v1"
+    targets, tmp = [], tempfile.mkdtemp(prefix="amara-bench-")
+    if not a.no_sqlite:
+        targets.append(("sqlite", f"sqlite:///{os.path.join(tmp, 'bench.db')}"))
+    if a.postgres:
+        targets.append(("postgres", a.postgres))
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    result = {
+        "meta": {
+            "commit": commit,
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(a).items() if k not in ("out", "postgres")},
+            "admission": admission_env(a),
+        },
+        "targets": {},
+    }
+    try:
+        for name, url in targets:
+            print(f"[bench] {name}: {a.vus} VUs x {a.duration}s", flush=True)
+            log_path = os.path.join(tmp, f"app-{name}.log")
+            result["targets"][name] = run_target(name, url, a, llm_url, log_path)
+    finally:
+        stub.shutdown()
+        if a.keep_logs:
+            print(f"[bench] app logs kept in {tmp}")
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    out = a.out or os.path.join(ROOT, "bench", "results", f"{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    for name, t in result["targets"].items():
+        print(f"\n{name}: {t['journeys_per_s']} journeys/s, {t['requests_per_s']} req/s")
+        print(f"  {'route':<24}{'n':>7}{'503':>6}{'err':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for label, r in t["routes"].items():
+            pcts = "".join(f"{r[k]:>10.1f}" if r[k] is not None else f"{'-':>10}" for k in ("p50_ms", "p95_ms", "p99_ms"))
+            print(f"  {label:<24}{r['count']:>7}{r['shed']:>6}{r['errors']:>6}{pcts}")
+    print(f"\nwrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Seed a benchmark database with realistic per-user history.
+
+    python -m bench.seed --db sqlite:////tmp/bench.db --users 200 --questions 30
+
+Run after the app has booted once against the same DATABASE_URL (the app
+creates the schema). Seeded users have emails <prefix>-<n>@bench.local.
+"""
+import argparse, random, uuid
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import create_engine, text
+
+from themes import backfill
+from tracker import repair
+
+TAROT = ["The Fool", "The Magician", "The High Priestess", "The Empress", "The Lovers", "The Chariot",
+         "Strength", "The Hermit", "Wheel of Fortune", "Justice", "Death", "Temperance", "The Tower",
+         "The Star", "The Moon", "The Sun", "Judgement", "The World"]
+RUNES = ["Fehu", "Uruz", "Thurisaz", "Ansuz", "Raidho", "Kenaz", "Gebo", "Wunjo", "Hagalaz", "Nauthiz",
+         "Isa", "Jera", "Eihwaz", "Perthro", "Algiz", "Sowilo", "Tiwaz", "Berkano", "Ehwaz", "Mannaz",
+         "Laguz", "Ingwaz", "Othala", "Dagaz"]
+QUESTIONS = ["Will he come back to me?", "Is this job the right path?", "What should I focus on this week?",
+             "How do I heal from this breakup?", "Should I move to a new city?", "What is blocking my creativity?",
+             "Is my friend being honest with me?", "How can I find more peace at home?"]
+TAGS = ["clarity", "patience", "love", "career", "healing", "trust", "change", "growth", "boundaries"]
+
+
+def seed(url, users=200, questions=30, days=30, cards=40, prefix="seed", batch=500):
+    """Insert `users` users, each with questions/answers, daily entries, draws and card logs."""
+    engine = create_engine(url)
+    now = datetime.now(timezone.utc)
+    rng = random.Random(42)
+    q_rows, a_rows, u_rows, e_rows, d_rows, c_rows = [], [], [], [], [], []
+    for n in range(users):
+        uid = str(uuid.uuid4())
+        u_rows.append({"id": uid, "email": f"{prefix}-{n}@bench.local"})
+        for i in range(questions):
+            qid, at = str(uuid.uuid4()), now - timedelta(hours=rng.randint(1, 24 * 90))
+            q_rows.append({"id": qid, "u": uid, "b": rng.choice(QUESTIONS), "t": at})
+            a_rows.append({"id": str(uuid.uuid4()), "q": qid, "b": "Gentle clarity is arriving. " * 8,
+                           "a": "I am calmly guided", "tags": ",".join(rng.sample(TAGS, 3)), "t": at})
+        for d in range(days):
+            day = date.today() - timedelta(days=d + 1)
+            e_rows.append({"id": str(uuid.uuid4()), "u": uid, "d": day, "c": "lavender", "e": "calm",
+                           "k": "intuition, stillness, trust", "a": "I am gently aligned."})
+            for kind, deck in (("rune", RUNES), ("tarot", TAROT)):
+                d_rows.append({"id": str(uuid.uuid4()), "u": uid, "d": day, "k": kind,
+                               "n": rng.choice(deck), "kw": "journey, movement, change"})
+        for i in range(cards):
+            c_rows.append({"id": str(uuid.uuid4()), "u": uid, "n": rng.choice(TAROT), "notes": "",
+                           "t": now - timedelta(days=rng.randint(0, 365))})
+
+    stmts = [
+        ("INSERT INTO users (id, email) VALUES (:id, :email)", u_rows),
+        ("INSERT INTO questions (id, user_id, body, created_at) VALUES (:id, :u, :b, :t)", q_rows),
+        ("INSERT INTO answers (id, question_id, body, affirmation, tags_csv, created_at) "
+         "VALUES (:id, :q, :b, :a, :tags, :t)", a_rows),
+        ("INSERT INTO daily_entries (id, user_id, entry_date, aura_color, emotion, keywords, affirmation) "
+         "VALUES (:id, :u, :d, :c, :e, :k, :a)", e_rows),
+        ("INSERT INTO daily_draws (id, user_id, draw_date, kind, name, keywords) "
+         "VALUES (:id, :u, :d, :k, :n, :kw)", d_rows),
+        ("INSERT INTO cards (id, user_id, card_name, notes, created_at) VALUES (:id, :u, :n, :notes, :t)", c_rows),
+    ]
+    with engine.begin() as cx:
+        for sql, rows in stmts:
+            for i in range(0, len(rows), batch):
+                cx.execute(text(sql), rows[i:i + batch])
+    repair(engine, log=lambda msg: None)  # cards went in raw; build their rollups
+    backfill(engine, log=lambda msg: None)  # same for answer_tags
+    engine.dispose()
+    return {"users": len(u_rows), "questions": len(q_rows), "daily_entries": len(e_rows),
+            "daily_draws": len(d_rows), "cards": len(c_rows)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--db", required=True, help="SQLAlchemy URL")
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--questions", type=int, default=30, help="questions per user")
+    ap.add_argument("--days", type=int, default=30, help="days of aura/draw history per user")
+    ap.add_argument("--cards", type=int, default=40, help="tracker card logs per user")
+    ap.add_argument("--prefix", default="seed", help="email prefix, change it to seed the same db twice")
+    a = ap.parse_args()
+    print(seed(a.db, a.users, a.questions, a.days, a.cards, a.prefix))
+
+
+if __name__ == "__main__":
+    main()
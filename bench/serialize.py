@@ -0,0 +1,87 @@
+"""JSON serialization of 1k-row payloads: Flask's stdlib provider vs jsonio.
+
+    python -m bench.serialize                        # 1000 rows, 200 reps
+    python -m bench.serialize --rows 1000 --out bench/results/serialize.json
+
+Two payload shapes: the RowMapping list a SQLAlchemy query returns (SQLite
+gives dates back as strings) and the same rows with datetime/date/UUID values
+(what Postgres returns). Reported per payload, p50/p95 in ms:
+
+  stdlib_*        Flask's DefaultJSONProvider after [dict(r) for r in rows]
+                  (what the views did before)
+  fast_*          jsonio.FastJSONProvider on the rows as-is (orjson if installed)
+  fallback_typed  FastJSONProvider with orjson disabled (the stdlib fallback)
+  ndjson_typed    the streamed NDJSON body, joined
+"""
+import argparse, json, random, statistics, time, uuid
+from datetime import date, datetime, timedelta, timezone
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import create_engine, text
+
+import jsonio
+from bench.seed import TAROT, RUNES
+
+
+def rows(n, seed=3):
+    rng = random.Random(seed)
+    engine = create_engine("sqlite://")
+    now = datetime.now(timezone.utc)
+    with engine.begin() as cx:
+        cx.execute(text("CREATE TABLE t (id TEXT, user_id TEXT, name TEXT, keywords TEXT, notes TEXT, "
+                        "score REAL, created_at TIMESTAMP, draw_date DATE)"))
+        cx.execute(text("INSERT INTO t VALUES (:id, :u, :n, :k, :notes, :s, :c, :d)"), [
+            {"id": str(uuid.uuid4()), "u": str(uuid.uuid4()), "n": rng.choice(TAROT + RUNES),
+             "k": "intuition, stillness, trust", "notes": "Felt calmer after the morning walk — “trust”.",
+             "s": rng.random(), "c": now - timedelta(minutes=i), "d": date.today() - timedelta(days=i)}
+            for i in range(n)])
+    with engine.connect() as cx:
+        out = cx.execute(text("SELECT * FROM t")).mappings().all()
+    # SQLite hands back strings for these; convert so the payload matches Postgres rows
+    return [{**r, "id": uuid.UUID(r["id"]), "created_at": datetime.fromisoformat(r["created_at"]),
+             "draw_date": date.fromisoformat(r["draw_date"])} for r in out], out
+
+
+def _time(fn, reps):
+    xs = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        xs.append((time.perf_counter() - t0) * 1000)
+    xs.sort()
+    return {"p50_ms": round(statistics.median(xs), 3), "p95_ms": round(xs[int(len(xs) * 0.95) - 1], 3)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=1000)
+    ap.add_argument("--reps", type=int, default=200)
+    ap.add_argument("--out", help="write JSON results here")
+    a = ap.parse_args()
+
+    typed, mappings = rows(a.rows)
+    app = Flask(__name__)
+    stock, fast = DefaultJSONProvider(app), jsonio.FastJSONProvider(app)
+    report = {"rows": a.rows, "orjson": jsonio.orjson is not None}
+    with app.test_request_context(headers={"Accept": jsonio.NDJSON}):
+        report["bytes"] = len(fast.response({"ok": True, "rows": typed}).get_data())
+        for label, data in (("rowmapping", mappings), ("typed", typed)):
+            report[f"stdlib_{label}"] = _time(lambda: stock.response({"ok": True, "rows": [dict(r) for r in data]}),
+                                              a.reps)
+            report[f"fast_{label}"] = _time(lambda: fast.response({"ok": True, "rows": data}), a.reps)
+        report["ndjson_typed"] = _time(lambda: b"".join(jsonio.ndjson(typed).response), a.reps)
+        saved, jsonio.orjson = jsonio.orjson, None
+        try:
+            report["fallback_typed"] = _time(lambda: fast.response({"ok": True, "rows": typed}), a.reps)
+        finally:
+            jsonio.orjson = saved
+    for label in ("rowmapping", "typed"):
+        report[f"speedup_{label}"] = round(report[f"stdlib_{label}"]["p50_ms"] / report[f"fast_{label}"]["p50_ms"], 1)
+    print(json.dumps(report, indent=2))
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Build the near-duplicate index over synthetic questions and time lookups.
+
+    python -m bench.similar                      # 100k questions
+    python -m bench.similar --n 1000000 --queries 500 --out bench/results/similar.json
+
+Questions are generated from templates so paraphrases exist; the report gives
+rebuild time, lookup p50/p95/p99 against a full scan, and how often the
+probed lists still contain the scan's best match. It also checks the
+per-user filter: another user's paraphrases outscore the asker's own
+question, and a lookup for the asker must still return it. Exits non-zero
+if that check fails.
+"""
+import argparse, json, random, shutil, sys, tempfile, time
+
+from similar import QuestionIndex, rebuild
+
+WHO = ["he", "she", "my ex", "my partner", "my boss", "my sister", "my friend", "they", "my crush", "my husband"]
+ASK = ["will {w} come back", "does {w} still love me", "is {w} thinking about me", "should I trust {w}",
+       "will {w} forgive me", "why is {w} so distant", "is {w} the one for me", "will {w} call me this week",
+       "what does {w} really feel", "should I tell {w} how I feel"]
+TOPIC = ["", " after the fight", " this month", " before summer", " after what happened", " at all",
+         " when I move", " if I apologise", " about the wedding", " about the new job"]
+PARA = {"will {w} come back": "is {w} coming back to me", "does {w} still love me": "does {w} love me still",
+        "should I trust {w}": "can I trust {w}", "will {w} forgive me": "is {w} going to forgive me"}
+
+
+def questions(n, seed=0, users=1000):
+    rng = random.Random(seed)
+    for i in range(n):
+        t, w, tail = rng.choice(ASK), rng.choice(WHO), rng.choice(TOPIC)
+        yield (f"q{i:09d}", f"u{rng.randrange(users):06d}",
+               t.format(w=w) + tail + f" ({rng.randrange(10 ** 6)})" * (i % 3 == 0))
+
+
+def user_filter_check(root, dim):
+    """The asker's own near-duplicate comes back although 50 other users' paraphrases score higher."""
+    index = QuestionIndex(root, dim=dim)
+    q = "will my ex come back after the fight"
+    for i in range(50):
+        index.add(f"other-{i:04d}", q, f"other-user-{i}")
+    index.add("own-0001", "is my ex coming back to me after our fight", "asker")
+    crowded = [qid for qid, _ in index.search(q, k=5)]
+    own = [qid for qid, _ in index.search(q, k=5, user_id="asker")]
+    return {"unfiltered_has_own": "own-0001" in crowded, "filtered": own, "ok": own == ["own-0001"]}
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--nprobe", type=int, default=8)
+    ap.add_argument("--out", help="write JSON results here")
+    a = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="amara-similar-")
+    check_root = tempfile.mkdtemp(prefix="amara-similar-users-")
+    try:
+        user_filter = user_filter_check(check_root, a.dim)
+        t0 = time.perf_counter()
+        meta = rebuild(lambda: questions(a.n), root=root, dim=a.dim)
+        build_s = time.perf_counter() - t0
+        index = QuestionIndex(root, dim=a.dim, nprobe=a.nprobe)
+        index.add("tail-0001", "will my ex come back after the fight", "u000001")  # exercise the tail path too
+
+        exact = QuestionIndex(root, dim=a.dim, nprobe=meta["nlist"] or 1)  # scores every row
+
+        rng = random.Random(1)
+        lat, exact_lat, recall, best = [], [], 0, []
+        for _ in range(a.queries):
+            t, w = rng.choice(list(PARA)), rng.choice(WHO)
+            q = PARA[t].format(w=w)
+            t0 = time.perf_counter()
+            hits = index.search(q, k=5)
+            lat.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            truth = exact.search(q, k=1)
+            exact_lat.append((time.perf_counter() - t0) * 1000)
+            recall += bool(truth) and truth[0][1] <= hits[0][1] + 1e-6
+            best.append(hits[0][1] if hits else 0.0)
+        result = {"n": a.n, "dim": a.dim, "nlist": meta["nlist"], "nprobe": a.nprobe, "build_s": round(build_s, 1),
+                  "lookup_ms": {"p50": _pct(lat, 50), "p95": _pct(lat, 95), "p99": _pct(lat, 99)},
+                  "exact_scan_ms": {"p50": _pct(exact_lat, 50), "p99": _pct(exact_lat, 99)},
+                  "top1_recall_vs_exact": recall / a.queries,
+                  "best_score_p50": _pct(best, 50),
+                  "user_filter": user_filter}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(check_root, ignore_errors=True)
+    print(json.dumps(result, indent=2))
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if user_filter["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
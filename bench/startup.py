@@ -0,0 +1,102 @@
+"""Measure worker cold start: `import app`, the first request, and the slowest imports.
+
+    python -m bench.startup                    # 5 fresh interpreters, 1.0s budget
+    python -m bench.startup --runs 10 --budget 0.8 --out bench/results/startup.json
+
+Each run is a fresh interpreter against a throwaway SQLite file, so nothing
+is warm except the OS page cache. The `-X importtime` breakdown comes from one
+extra run. Exits non-zero when the median import time exceeds --budget.
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+heavy = sorted(m for m in ("openai", "httpx", "numpy", "PIL", "redis") if m in sys.modules)
+c = app.app.test_client()
+status = c.get("/readyz").status_code
+t2 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "first_request_s": t2 - t1, "status": status, "heavy_modules": heavy}))
+"""
+
+
+def _env(tmp):
+    return dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+                OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "startup-bench"))
+
+
+def run_once(tmp):
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=_env(tmp),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_breakdown(tmp, top=15):
+    """Parse `python -X importtime` output into app.py's slowest direct imports (cumulative us)."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                         env=_env(tmp), capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "[us]" in line:
+            continue
+        self_us, cum_us, name = line.split(":", 1)[1].split("|")
+        name = name[1:]  # one separator space, then two spaces of indent per nesting level
+        rows.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip())) // 2,
+                     "self_us": int(self_us), "cumulative_us": int(cum_us)})
+    # importtime prints children before their parent, so app's direct imports
+    # are the depth-1 rows between the previous root and the `app` root.
+    children, pending = [], []
+    for r in rows:
+        if r["depth"] == 0:
+            if r["module"] == "app":
+                children = pending + [dict(r, module="app (total)")]
+            pending = []
+        elif r["depth"] == 1:
+            pending.append(r)
+    return sorted(children, key=lambda r: -r["cumulative_us"])[:top]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget", type=float, default=1.0, help="seconds allowed for the median import")
+    ap.add_argument("--out", help="write JSON results here")
+    a = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="amara-startup-") as tmp:
+        runs = []
+        for _ in range(a.runs):
+            runs.append(run_once(tmp))
+            os.remove(os.path.join(tmp, "startup.db"))
+        top = import_breakdown(tmp)
+
+    imp = [r["import_s"] for r in runs]
+    first = [r["first_request_s"] for r in runs]
+    result = {
+        "runs": a.runs,
+        "import_s": {"median": statistics.median(imp), "min": min(imp), "max": max(imp)},
+        "first_request_s": {"median": statistics.median(first), "min": min(first), "max": max(first)},
+        "heavy_modules_after_import": runs[-1]["heavy_modules"],
+        "budget_s": a.budget,
+        "within_budget": statistics.median(imp) <= a.budget,
+        "slowest_imports": top,
+    }
+    print(f"import app:     median {result['import_s']['median'] * 1000:.0f} ms "
+          f"(min {min(imp) * 1000:.0f}, max {max(imp) * 1000:.0f})")
+    print(f"first request:  median {result['first_request_s']['median'] * 1000:.0f} ms (includes schema init)")
+    print(f"heavy modules loaded at import: {', '.join(result['heavy_modules_after_import']) or 'none'}")
+    print("slowest imports from app.py (cumulative):")
+    for r in top:
+        print(f"  {r['cumulative_us'] / 1000:8.1f} ms  {r['module']}")
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Card-frequency rollups vs GROUP BY scans at 100k cards per user.
+
+    python -m bench.tracker                              # throwaway SQLite, 100k cards
+    python -m bench.tracker --db postgresql://... --cards 100000 --out bench/results/tracker.json
+
+Logs --cards cards for one user through tracker.add_card (rollups maintained
+in the same transaction) plus the same volume of raw inserts for a second
+user, then times the tracker's "frequent cards" and this-month queries both
+ways, deletes a sample of cards and checks repair() finds no drift.
+"""
+import argparse, json, os, random, statistics, tempfile, time, uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, text
+
+import tracker
+from app import init_db
+from bench.seed import TAROT, RUNES
+
+SCAN_TOP = text("SELECT card_name, COUNT(*) AS n FROM cards WHERE user_id = :u "
+                "GROUP BY card_name ORDER BY n DESC LIMIT 10")
+SCAN_PERIOD = text("SELECT card_name, COUNT(*) AS n FROM cards WHERE user_id = :u AND created_at >= :t "
+                   "GROUP BY card_name ORDER BY n DESC LIMIT 10")
+
+
+def _time(fn, reps):
+    xs = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        xs.append((time.perf_counter() - t0) * 1000)
+    return {"p50_ms": round(statistics.median(xs), 3), "max_ms": round(max(xs), 3)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--db", help="database URL (default: a throwaway SQLite file)")
+    ap.add_argument("--cards", type=int, default=100_000)
+    ap.add_argument("--batch", type=int, default=1000, help="cards per transaction")
+    ap.add_argument("--reps", type=int, default=50)
+    ap.add_argument("--out", help="write JSON results here")
+    a = ap.parse_args()
+
+    tmp = None
+    if not a.db:
+        tmp = tempfile.mkdtemp(prefix="amara-tracker-")
+        a.db = f"sqlite:///{os.path.join(tmp, 'tracker.db')}"
+    engine = create_engine(a.db)
+    init_db(engine)
+    rng = random.Random(7)
+    deck = TAROT + RUNES
+    now = datetime.now(timezone.utc)
+    stamps = sorted(now - timedelta(minutes=rng.randint(0, 60 * 24 * 730)) for _ in range(a.cards))
+    uid, raw_uid = str(uuid.uuid4()), str(uuid.uuid4())
+
+    t0 = time.perf_counter()
+    for i in range(0, a.cards, a.batch):
+        with engine.begin() as cx:
+            for ts in stamps[i:i + a.batch]:
+                tracker.add_card(cx, uid, rng.choice(deck), None, now=ts)
+    with_rollups = time.perf_counter() - t0
+
+    rows = [{"id": str(uuid.uuid4()), "u": raw_uid, "c": rng.choice(deck), "t": ts} for ts in stamps]
+    t0 = time.perf_counter()
+    for i in range(0, a.cards, a.batch):
+        with engine.begin() as cx:
+            for r in rows[i:i + a.batch]:
+                cx.execute(text("INSERT INTO cards (id, user_id, card_name, created_at) VALUES (:id, :u, :c, :t)"), r)
+    raw = time.perf_counter() - t0
+
+    month = tracker.period_starts(now)["month"]
+    month_ts = datetime.fromisoformat(month).replace(tzinfo=timezone.utc)
+    with engine.connect() as cx:
+        assert [n for _, n in tracker.top_cards(cx, uid)] == [n for _, n in cx.execute(SCAN_TOP, {"u": uid})]
+        reads = {
+            "top_rollup": _time(lambda: tracker.top_cards(cx, uid), a.reps),
+            "top_scan": _time(lambda: cx.execute(SCAN_TOP, {"u": uid}).all(), a.reps),
+            "month_rollup": _time(lambda: tracker.top_period(cx, uid, "month", month), a.reps),
+            "month_scan": _time(lambda: cx.execute(SCAN_PERIOD, {"u": uid, "t": month_ts}).all(), a.reps),
+        }
+
+    with engine.connect() as cx:
+        victims = [r[0] for r in cx.execute(text("SELECT id FROM cards WHERE user_id = :u LIMIT 200"), {"u": uid})]
+    t0 = time.perf_counter()
+    for cid in victims:
+        with engine.begin() as cx:
+            tracker.delete_card(cx, uid, cid)
+    delete_ms = (time.perf_counter() - t0) * 1000 / max(len(victims), 1)
+
+    t0 = time.perf_counter()
+    drift = tracker.repair(engine, uid, log=lambda msg: None)
+    repair_s = time.perf_counter() - t0
+
+    result = {
+        "db": engine.url.get_backend_name(), "cards_per_user": a.cards,
+        "insert_per_s": {"with_rollups": round(a.cards / with_rollups), "raw": round(a.cards / raw)},
+        "delete_ms": round(delete_ms, 3),
+        "reads": reads,
+        "repair": {"seconds": round(repair_s, 2), "rows_corrected": drift},
+    }
+    engine.dispose()
+    if tmp:
+        os.remove(os.path.join(tmp, "tracker.db"))
+        os.rmdir(tmp)
+    print(json.dumps(result, indent=2))
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import hashlib, os, pickle, sqlite3, threading, time, uuid
+
+# ---- Key/value backends ----
+# CACHE_URL picks the backend:
+#   memory://              per-process dict (single worker / dev only)
+#   sqlite:////tmp/x.db    file shared by every worker on the host
+#   redis://host:6379/0    shared across hosts (needs the `redis` package)
+#
+# Dashboard keys are orphaned by every version bump and only expire by TTL,
+# so the memory and SQLite backends sweep expired keys every SWEEP_EVERY sets
+# (redis expires them itself).
+SWEEP_EVERY = 256
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._d = {}
+        self._lock = threading.Lock()
+        self._sets = 0
+
+    def _sweep(self):
+        now = time.time()
+        for k in [k for k, (_, expires) in self._d.items() if expires and expires < now]:
+            del self._d[k]
+
+    def get(self, key):
+        with self._lock:
+            hit = self._d.get(key)
+            if hit is None:
+                return None
+            value, expires = hit
+            if expires and expires < time.time():
+                del self._d[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._d[key] = (value, time.time() + ttl if ttl else None)
+            self._sets += 1
+            if self._sets % SWEEP_EVERY == 0:
+                self._sweep()
+
+    def add(self, key, value, ttl=None):
+        """Set only if missing; return True when this call stored the value."""
+        with self._lock:
+            hit = self._d.get(key)
+            if hit is not None and not (hit[1] and hit[1] < time.time()):
+                return False
+            self._d[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._d.pop(key, None)
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        self._sets = 0
+
+    def reset(self):
+        # Connections must not cross a fork; each process/thread reopens lazily
+        self._local = threading.local()
+
+    def _cx(self):
+        cx = getattr(self._local, "cx", None)
+        if cx is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            cx = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            cx.execute("PRAGMA journal_mode=WAL")
+            cx.execute("PRAGMA synchronous=NORMAL")
+            cx.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v BLOB, expires REAL)")
+            self._local.cx = cx
+        return cx
+
+    def get(self, key):
+        row = self._cx().execute("SELECT v, expires FROM kv WHERE k = ?", (key,)).fetchone()
+        if row is None or (row[1] and row[1] < time.time()):
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        self._cx().execute(
+            "INSERT OR REPLACE INTO kv (k, v, expires) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value), time.time() + ttl if ttl else None),
+        )
+        self._sets += 1  # unlocked: an occasional missed or extra sweep is harmless
+        if self._sets % SWEEP_EVERY == 0:
+            self.sweep()
+
+    def sweep(self):
+        return self._cx().execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires < ?", (time.time(),)).rowcount
+
+    def add(self, key, value, ttl=None):
+        cx = self._cx()
+        cx.execute("DELETE FROM kv WHERE k = ? AND expires IS NOT NULL AND expires < ?", (key, time.time()))
+        cur = cx.execute(
+            "INSERT OR IGNORE INTO kv (k, v, expires) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value), time.time() + ttl if ttl else None),
+        )
+        return cur.rowcount == 1
+
+    def delete(self, key):
+        self._cx().execute("DELETE FROM kv WHERE k = ?", (key,))
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis  # optional dependency, only needed for redis:// URLs
+        self.r = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.r.get(key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.r.set(key, pickle.dumps(value), ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.r.set(key, pickle.dumps(value), ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.r.delete(key)
+
+
+def make_cache(url):
+    if not url or url.startswith("memory:"):
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"unsupported CACHE_URL: {url}")
+
+
+# ---- Per-user dashboard cache ----
+DASH_CACHE_TTL = int(os.getenv("DASH_CACHE_TTL", "3600"))
+
+
+class DashboardCache:
+    """Per-user view results keyed by a version token that writes replace.
+
+    A missing version gets a fresh random token (never a reused counter), so
+    an evicted version can't resurrect an older cached payload.
+    """
+
+    def __init__(self, backend, release="dev", ttl=DASH_CACHE_TTL):
+        self.backend = backend
+        self.release = release
+        self.ttl = ttl
+
+    def _vkey(self, uid):
+        return f"dashver:{uid}"
+
+    def version(self, uid):
+        ver = self.backend.get(self._vkey(uid))
+        if ver is None:
+            self.backend.add(self._vkey(uid), uuid.uuid4().hex[:12])
+            ver = self.backend.get(self._vkey(uid))
+        return ver
+
+    def bump(self, uid):
+        self.backend.set(self._vkey(uid), uuid.uuid4().hex[:12])
+
+    def etag(self, uid, view, ver, *extra):
+        raw = ":".join(str(p) for p in (self.release, view, uid, ver) + extra)
+        return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+    def get_or_set(self, uid, view, ver, load, *extra):
+        key = f"dash:{uid}:{view}:{ver}:" + ":".join(str(p) for p in extra)
+        data = self.backend.get(key)
+        if data is None:
+            data = load()
+            self.backend.set(key, data, self.ttl)
+        return data
@@ -0,0 +1,146 @@
+import glob, hashlib, json, os, random, re, threading, time
+
+# ---- Traffic capture ----
+# CAPTURE_SAMPLE=0.05 records ~5% of users (sampled per user, so a captured
+# user's whole session is kept) as one JSON line per request under
+# CAPTURE_DIR, for `python -m bench.replay`. Records are sanitized: the route
+# template instead of the path, the *shape* of the body (field -> type and
+# length, never values), a salted hash of the user id, status and timing.
+# Files rotate hourly or at CAPTURE_MAX_MB, one writer per process; files
+# older than CAPTURE_KEEP_DAYS are pruned on rotation. With CAPTURE_SAMPLE=0
+# (the default) no hooks are installed.
+CAPTURE_SAMPLE = float(os.getenv("CAPTURE_SAMPLE", "0"))
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "var/capture")
+CAPTURE_MAX_MB = float(os.getenv("CAPTURE_MAX_MB", "64"))
+CAPTURE_KEEP_DAYS = float(os.getenv("CAPTURE_KEEP_DAYS", "7"))
+CAPTURE_SALT = os.getenv("CAPTURE_SALT", "")
+
+# URL/query values safe to keep verbatim (small enums and numbers); others become "x"
+SAFE_ARGS = {"kind", "period", "k", "days", "start", "spread", "fmt"}
+# A spread's card list ("the-fool:r,death,the-star") names cards, not people:
+# kept when it has that shape, so replays hit the render/cache path
+_CARDS = re.compile(r"[a-z0-9-]{1,40}(?::r)?(?:,[a-z0-9-]{1,40}(?::r)?){0,9}")
+
+
+def _arg(k, v):
+    if k in SAFE_ARGS or (k == "cards" and isinstance(v, str) and _CARDS.fullmatch(v)):
+        return v
+    return "x"
+
+
+def user_hash(uid, salt=CAPTURE_SALT):
+    return hashlib.sha256(f"{salt}:{uid}".encode()).hexdigest()[:16]
+
+
+def shape(value):
+    """Structure without content: {"question": "str:42", "tags": ["str:5", ...]}."""
+    if isinstance(value, dict):
+        return {str(k): shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [shape(v) for v in value[:20]]
+    if isinstance(value, str):
+        return f"str:{len(value)}"
+    if isinstance(value, bool) or value is None:
+        return value
+    return type(value).__name__  # int, float, ...
+
+
+class CaptureWriter:
+    """Appends JSON lines to CAPTURE_DIR/capture-<YYYYmmddHH>-<pid>-<n>.jsonl."""
+
+    def __init__(self, root=CAPTURE_DIR, max_mb=CAPTURE_MAX_MB, keep_days=CAPTURE_KEEP_DAYS):
+        self.root, self.max_bytes, self.keep_days = root, int(max_mb * 1024 * 1024), keep_days
+        self._lock = threading.Lock()
+        self._f = self._hour = self._pid = None
+        self._part = 0
+        self.written = self.dropped = 0
+
+    def _rotate(self, hour):
+        if self._f:
+            self._f.close()
+        if hour != self._hour or self._pid != os.getpid():
+            self._part = 0
+        else:
+            self._part += 1
+        self._hour, self._pid = hour, os.getpid()
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f"capture-{hour}-{self._pid}-{self._part}.jsonl")
+        self._f = open(path, "a", encoding="utf-8")
+        self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_days * 86400
+        for p in glob.glob(os.path.join(self.root, "capture-*.jsonl")):
+            try:
+                if os.path.getmtime(p) < cutoff:
+                    os.remove(p)
+            except OSError:
+                pass
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        hour = time.strftime("%Y%m%d%H", time.gmtime(record["ts"]))
+        with self._lock:
+            try:
+                if (self._f is None or hour != self._hour or self._pid != os.getpid()
+                        or self._f.tell() >= self.max_bytes):
+                    self._rotate(hour)
+                self._f.write(line)
+                self._f.flush()
+                self.written += 1
+            except OSError:
+                self.dropped += 1  # a full disk must not fail the request
+
+
+def _sampled(uh, rate):
+    if uh is None:
+        return random.random() < rate
+    return int(uh[:8], 16) / 0x100000000 < rate
+
+
+def init_app(app, skip=(), sample=CAPTURE_SAMPLE, writer=None):
+    """Install the capture hooks when `sample` > 0; `skip` lists endpoints never recorded."""
+    if sample <= 0:
+        return None
+    from flask import g, request, session
+
+    writer = writer or CaptureWriter()
+    skip = set(skip) | {"static"}
+
+    @app.before_request
+    def _capture_start():
+        g.capture_t0 = (time.time(), time.perf_counter())
+
+    @app.after_request
+    def _capture(resp):
+        start = g.pop("capture_t0", None)
+        if start is None or request.endpoint in skip:
+            return resp
+        uid = session.get("user_id")
+        uh = user_hash(uid) if uid else None
+        if not _sampled(uh, sample):
+            return resp
+        if request.is_json:
+            body = shape(request.get_json(silent=True))
+        elif request.form:
+            body = {k: shape(v) for k, v in request.form.items()}
+        else:
+            body = None
+        writer.write({
+            "ts": round(start[0], 3),  # arrival time: replay schedules on it
+            "route": request.url_rule.rule if request.url_rule else None,
+            "endpoint": request.endpoint,
+            "method": request.method,
+            "args": {k: _arg(k, v) for k, v in (request.view_args or {}).items()},
+            "query": {k: _arg(k, v) for k, v in request.args.items()},
+            "content_type": request.mimetype or None,
+            "body": body,
+            "idempotency_key": bool(request.headers.get("Idempotency-Key")),
+            "user": uh,
+            "status": resp.status_code,
+            "dur_ms": round((time.perf_counter() - start[1]) * 1000, 3),
+            "bytes": resp.calculate_content_length(),
+        })
+        return resp
+
+    return writer
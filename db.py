@@ -0,0 +1,266 @@
+import os, threading, time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError, DisconnectionError, OperationalError, TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# ---- Pool profile (all overridable from the environment) ----
+# gunicorn runs WEB_CONCURRENCY processes x GUNICORN_THREADS threads; each
+# process owns its own pool, and a thread holds at most one connection at a
+# time, so the steady-state pool size is the thread count, capped at this
+# worker's share of DB_MAX_CONNECTIONS (extra threads then wait for a
+# connection instead of going over the server's budget).
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "2"))
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "20"))  # server-side budget for this app
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))      # seconds
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))      # seconds to wait for a free conn
+DB_POOL_LIFO = os.getenv("DB_POOL_LIFO", "1") == "1"
+# Only connections idle longer than this get a liveness ping on checkout;
+# hot connections are handed out without an extra round trip.
+DB_IDLE_PING = float(os.getenv("DB_IDLE_PING", "300"))
+# PgBouncer in transaction-pooling mode can't keep server-side prepared statements.
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+
+def pool_profile():
+    """Return pool_size / max_overflow for this process from workers x threads."""
+    per_worker = max(1, DB_MAX_CONNECTIONS // max(1, WEB_CONCURRENCY))
+    size = int(os.getenv("DB_POOL_SIZE") or min(GUNICORN_THREADS, per_worker))
+    default_overflow = max(0, min(GUNICORN_THREADS, per_worker - size))
+    overflow = int(os.getenv("DB_MAX_OVERFLOW") or default_overflow)
+    return {"pool_size": size, "max_overflow": overflow}
+
+
+class PoolStats:
+    """Thread-safe counters for checkouts, waits and reconnects (one per pool)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidations = 0
+            self.idle_pings = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def incr(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+
+    def snapshot(self):
+        with self._lock:
+            out = {k: v for k, v in vars(self).items() if not k.startswith("_")}
+        out["wait_avg"] = out["wait_total"] / out["checkouts"] if out["checkouts"] else 0.0
+        return out
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers block waiting for a connection, in its own `stats`."""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()  # engine.dispose() swaps in a fresh pool; the counters carry over
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:  # pool exhausted; connect failures raise DBAPIError and aren't counted
+            self.stats.incr("timeouts")
+            raise
+        finally:
+            self.stats.record_wait(time.perf_counter() - t0)
+
+
+def _install_pool_events(engine):
+    def stats():
+        return engine.pool.stats  # the primary and the replica each count their own pool
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        stats().incr("connects")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, record):
+        stats().incr("checkins")
+        record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_conn, record, exc):
+        stats().incr("invalidations")
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        stats().incr("checkouts")
+        idle_since = record.info.get("checked_in_at")
+        if idle_since is None or time.monotonic() - idle_since < DB_IDLE_PING:
+            return
+        # Long-idle connection: ping once. Raising DisconnectionError makes the
+        # pool discard it and transparently hand out a fresh one.
+        stats().incr("idle_pings")
+        cur = dbapi_conn.cursor()
+        try:
+            cur.execute("SELECT 1")
+        except Exception as e:
+            raise DisconnectionError() from e
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+
+def make_engine(url):
+    """Create the app engine; Postgres gets the tuned pool, SQLite stays simple."""
+    if url.startswith("sqlite"):
+        return create_engine(url)
+    kw = dict(
+        poolclass=TimedQueuePool,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_use_lifo=DB_POOL_LIFO,
+        pool_pre_ping=False,  # replaced by the idle-only ping + disconnect handling above
+        **pool_profile(),
+    )
+    if DB_PGBOUNCER:
+        # psycopg (v3) prepares statements server-side after a few executions;
+        # turn that off. psycopg2 never prepares, so nothing to do there.
+        if "+psycopg" in url and "+psycopg2" not in url:
+            kw["connect_args"] = {"prepare_threshold": None}
+    engine = create_engine(url, **kw)
+    _install_pool_events(engine)
+    return engine
+
+
+def pool_stats(engine):
+    """This engine's counters plus its live pool gauges, for the metrics endpoint."""
+    pool = engine.pool
+    out = (getattr(pool, "stats", None) or PoolStats()).snapshot()  # SQLite pools keep no counters
+    for gauge in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, gauge, None)
+        if callable(fn):
+            out[gauge] = fn()
+    return out
+
+
+# ---- Read replica routing ----
+# DATABASE_REPLICA_URL points at a read-only copy (a second SQLite file works
+# as a local stand-in). Pure-read blocks go there unless the user wrote within
+# DB_REPLICA_STICKY seconds, the replica lags more than DB_REPLICA_MAX_LAG, or
+# it failed recently; in all of those cases we read from the primary.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+DB_REPLICA_STICKY = float(os.getenv("DB_REPLICA_STICKY", "15"))
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_LAG_CHECK = float(os.getenv("DB_REPLICA_LAG_CHECK", "5"))    # seconds between lag probes
+DB_REPLICA_COOLDOWN = float(os.getenv("DB_REPLICA_COOLDOWN", "30"))     # seconds to avoid a failed replica
+
+
+class ReplicaRouter:
+    """Pick the primary or the replica engine for a read-only block."""
+
+    def __init__(self, primary, replica=None):
+        self.primary = primary
+        self.replica = replica
+        self._lock = threading.Lock()
+        self.down_until = 0.0
+        self.lag = 0.0
+        self.lag_checked = 0.0
+        self.reads = {"replica": 0, "primary": 0}
+
+    def _mark_down(self):
+        with self._lock:
+            self.down_until = time.monotonic() + DB_REPLICA_COOLDOWN
+
+    def _measure_lag(self, cx):
+        if cx.engine.url.get_backend_name() != "postgresql":
+            return 0.0  # SQLite stand-in has no replication
+        lag = cx.exec_driver_sql(
+            "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+        ).scalar()
+        return float(lag or 0)
+
+    def _replica_usable(self, last_write_at):
+        if self.replica is None:
+            return False
+        if last_write_at and time.time() - float(last_write_at) < DB_REPLICA_STICKY:
+            return False  # read-your-writes
+        now = time.monotonic()
+        if now < self.down_until:
+            return False
+        if now - self.lag_checked >= DB_REPLICA_LAG_CHECK:
+            try:
+                with self.replica.connect() as cx:
+                    lag = self._measure_lag(cx)
+            except Exception:
+                self._mark_down()
+                return False
+            with self._lock:
+                self.lag, self.lag_checked = lag, now
+        return self.lag <= DB_REPLICA_MAX_LAG
+
+    @contextmanager
+    def read(self, last_write_at=None):
+        """Yield a connection for read-only queries, falling back to the primary.
+
+        The fallback happens at checkout: a replica that can't be reached
+        fails in connect(), and connections idle longer than DB_IDLE_PING are
+        pinged there first. Hot connections get no extra round trip, so a
+        replica that died under them fails inside the block instead; that
+        error is re-raised, and if it was a disconnect or an OperationalError
+        the replica is avoided for DB_REPLICA_COOLDOWN. Query errors (bad SQL,
+        constraint violations) leave the replica in use.
+        """
+        cx = None
+        if self._replica_usable(last_write_at):
+            try:
+                cx = self.replica.connect()
+            except Exception:
+                self._mark_down()
+        target = "replica" if cx is not None else "primary"
+        if cx is None:
+            cx = self.primary.connect()
+        with self._lock:
+            self.reads[target] += 1
+        try:
+            with cx:
+                yield cx
+        except DBAPIError as e:
+            if target == "replica" and (e.connection_invalidated or isinstance(e, OperationalError)):
+                self._mark_down()
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "configured": self.replica is not None,
+                "down": time.monotonic() < self.down_until,
+                "lag": self.lag,
+                "reads": dict(self.reads),
+            }
+
+
+def make_router(primary):
+    replica = None
+    if DATABASE_REPLICA_URL:
+        replica = make_engine(DATABASE_REPLICA_URL)
+        if replica.url.get_backend_name() == "postgresql":
+            replica = replica.execution_options(postgresql_readonly=True)
+    return ReplicaRouter(primary, replica)
@@ -0,0 +1,24 @@
+# gunicorn settings for production (run-prod.sh: gunicorn -c gunicorn.conf.py app:app)
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+# Most request time is spent waiting on the model or the DB, so threads are cheap;
+# admission.py keeps a share of them free for health and reads.
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# The dashboard cache's version bumps must be seen by every worker
+if workers > 1 and os.getenv("CACHE_URL", "").startswith("memory:"):
+    raise SystemExit("CACHE_URL=memory:// is per-process; use the default SQLite file or redis:// with workers > 1")
+
+# Import the app once in the master and fork it into workers: workers start
+# serving immediately and share the imported code pages. app.py does no I/O
+# at import, so nothing unsafe is inherited; post_fork still drops the pools
+# and clients in case the master touched them.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def post_fork(server, worker):
+    import app
+    app.after_fork()
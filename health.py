@@ -0,0 +1,127 @@
+import os, shutil, threading, time, urllib.error, urllib.request
+
+# ---- Health probes ----
+# Dependencies are checked by background threads (one per probe) on their own
+# interval; /healthz, /readyz and /health only read the cached results, so a
+# probe endpoint never waits on the DB or the network. A result older than
+# HEALTH_STALE_FACTOR x its interval counts as failed (a hung probe makes the
+# instance unready instead of piling up request threads).
+#
+#   liveness  (/healthz): the process can serve requests; no dependency checks
+#   readiness (/readyz):  every critical probe is fresh and passing
+#   detail    (/health):  JSON with each probe's state, latency and age (with
+#                         the METRICS_TOKEN bearer; otherwise status and ready only)
+HEALTH_DB_INTERVAL = float(os.getenv("HEALTH_DB_INTERVAL", "5"))
+HEALTH_LLM_INTERVAL = float(os.getenv("HEALTH_LLM_INTERVAL", "30"))
+HEALTH_DISK_INTERVAL = float(os.getenv("HEALTH_DISK_INTERVAL", "30"))
+HEALTH_STALE_FACTOR = float(os.getenv("HEALTH_STALE_FACTOR", "3"))
+HEALTH_DISK_MIN_MB = int(os.getenv("HEALTH_DISK_MIN_MB", "100"))
+
+
+class Probe:
+    def __init__(self, name, check, interval, critical=True):
+        self.name, self.check, self.interval, self.critical = name, check, interval, critical
+        self.result = None  # (ok, latency_s, checked_at, detail)
+
+    def run_once(self):
+        t0 = time.perf_counter()
+        try:
+            detail = self.check()
+            ok = True
+        except Exception as e:
+            ok, detail = False, f"{type(e).__name__}: {e}"[:200]
+        self.result = (ok, time.perf_counter() - t0, time.time(), detail)
+
+    def state(self, now=None):
+        now = now or time.time()
+        if self.result is None:
+            return {"ok": False, "state": "pending", "critical": self.critical}
+        ok, latency, at, detail = self.result
+        age = now - at
+        stale = age > self.interval * HEALTH_STALE_FACTOR
+        return {"ok": ok and not stale, "state": "stale" if stale else ("up" if ok else "down"),
+                "critical": self.critical, "latency_ms": round(latency * 1000, 2), "age_s": round(age, 1),
+                "detail": detail}
+
+
+class HealthMonitor:
+    """Owns the probe threads; they start on first use in each process (safe with preload + fork)."""
+
+    def __init__(self):
+        self.probes = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def add(self, probe):
+        self.probes[probe.name] = probe
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.started_at = time.time()
+            for p in self.probes.values():
+                p.result = None  # results inherited from a parent process are not ours
+                threading.Thread(target=self._loop, args=(p,), name=f"health-{p.name}", daemon=True).start()
+
+    def _loop(self, probe):
+        pid = os.getpid()
+        while self._pid == pid:
+            probe.run_once()
+            time.sleep(probe.interval)
+
+    def status(self):
+        self.ensure_started()
+        now = time.time()
+        probes = {name: p.state(now) for name, p in self.probes.items()}
+        ready = all(s["ok"] for s in probes.values() if s["critical"])
+        degraded = not all(s["ok"] for s in probes.values())
+        return {"status": "down" if not ready else ("degraded" if degraded else "ok"), "ready": ready,
+                "uptime_s": round(now - self.started_at, 1), "pid": os.getpid(), "probes": probes}
+
+    def metrics(self):
+        out = ["# TYPE amara_health_probe_up gauge", "# TYPE amara_health_probe_latency_seconds gauge"]
+        for name, s in sorted(self.status()["probes"].items()):
+            out.append(f'amara_health_probe_up{{probe="{name}"}} {int(s["ok"])}')
+            if "latency_ms" in s:
+                out.append(f'amara_health_probe_latency_seconds{{probe="{name}"}} {s["latency_ms"] / 1000:.6f}')
+        return out
+
+
+# ---- Checks ----
+def db_check(engine):
+    def check():
+        with engine.connect() as cx:
+            cx.exec_driver_sql("SELECT 1")
+        return engine.url.get_backend_name()
+    return check
+
+
+def llm_check(base_url=None, timeout=3.0):
+    """Reachability only: any HTTP answer from the API host counts (no tokens spent)."""
+    url = (base_url or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/") + "/models"
+
+    def check():
+        req = urllib.request.Request(url, method="GET",
+                                     headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as r:
+                return f"HTTP {r.status}"
+        except urllib.error.HTTPError as e:
+            if e.code >= 500:
+                raise
+            return f"HTTP {e.code}"
+    return check
+
+
+def disk_check(path, min_mb=HEALTH_DISK_MIN_MB):
+    def check():
+        free_mb = shutil.disk_usage(path).free // (1024 * 1024)
+        if free_mb < min_mb:
+            raise RuntimeError(f"{free_mb} MB free under {path} (< {min_mb} MB)")
+        return f"{free_mb} MB free"
+    return check
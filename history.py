@@ -0,0 +1,240 @@
+import gzip, json, os, re, time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, text
+
+from tracker import as_dt
+
+# ---- Question/answer history: hot tables + monthly cold storage ----
+# `questions`/`answers` only hold the last HISTORY_HOT_DAYS; `flask
+# history-archive` (nightly cron) moves older question+answer pairs, one row
+# each, into a per-month cold table, then writes months older than
+# HISTORY_FILE_MONTHS to gzipped per-user JSONL files and drops the table:
+#
+#   Postgres  history_YYYY_MM are range partitions of history_cold (created_at)
+#   SQLite    history_YYYY_MM are plain tables with the same columns
+#   files     HISTORY_ARCHIVE_DIR/YYYY_MM/<user_id>.jsonl.gz
+#
+# history_months lists every archived month and where it lives, so reads
+# never introspect the catalog. recent()/iter_user() read hot rows first and
+# fall through to older months only when the caller needs more rows, so the
+# hot tables and their indexes stay the size of the retention window.
+HISTORY_HOT_DAYS = int(os.getenv("HISTORY_HOT_DAYS", "180"))
+HISTORY_FILE_MONTHS = int(os.getenv("HISTORY_FILE_MONTHS", "24"))
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", "var/archive")
+
+COLUMNS = ("question_id", "user_id", "question", "created_at", "answer_id", "body", "affirmation", "tags_csv",
+           "answered_at")
+_COLS = """
+  question_id TEXT NOT NULL,
+  user_id TEXT,
+  question TEXT NOT NULL,
+  created_at TIMESTAMP NOT NULL,
+  answer_id TEXT,
+  body TEXT,
+  affirmation TEXT,
+  tags_csv TEXT,
+  answered_at TIMESTAMP,
+  PRIMARY KEY (question_id, created_at)
+"""
+_HOT = """
+    SELECT q.id AS question_id, q.user_id, q.body AS question, q.created_at, a.id AS answer_id, a.body,
+           a.affirmation, a.tags_csv, a.created_at AS answered_at
+    FROM questions q LEFT JOIN answers a ON a.question_id = q.id
+"""
+_MONTH = re.compile(r"^\d{4}_\d{2}$")
+
+
+def _pg(cx):
+    return cx.dialect.name == "postgresql"
+
+
+def month_key(dt):
+    return f"{dt.year:04d}_{dt.month:02d}"
+
+
+def month_bounds(key):
+    y, m = int(key[:4]), int(key[5:])
+    start = datetime(y, m, 1)
+    return start, datetime(y + (m == 12), m % 12 + 1, 1)
+
+
+def table(key):
+    if not _MONTH.match(key):
+        raise ValueError(f"bad month {key!r}")
+    return f"history_{key}"
+
+
+def init(cx):
+    """Postgres: the partitioned parent (SQLite month tables are standalone)."""
+    if _pg(cx):
+        cx.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS history_cold ({_COLS}) PARTITION BY RANGE (created_at)")
+        cx.exec_driver_sql("CREATE INDEX IF NOT EXISTS history_cold_user_idx ON history_cold (user_id, created_at)")
+
+
+def ensure_month(cx, key):
+    t = table(key)
+    if _pg(cx):
+        start, end = month_bounds(key)
+        cx.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {t} PARTITION OF history_cold "
+                           f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')")
+    else:
+        cx.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {t} ({_COLS})")
+        cx.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {t}_user_idx ON {t} (user_id, created_at)")
+    cx.execute(text("""
+        INSERT INTO history_months (month, state, row_count, updated_at) VALUES (:m, 'cold', 0, :now)
+        ON CONFLICT (month) DO NOTHING
+    """), {"m": key, "now": datetime.now(timezone.utc)})
+
+
+def _months(cx, before=None):
+    """[(month, state)] newest first, optionally only months starting before `before`."""
+    rows = cx.execute(text("SELECT month, state FROM history_months ORDER BY month DESC")).all()
+    if before is not None:
+        b = as_dt(before).replace(tzinfo=None)
+        rows = [r for r in rows if month_bounds(r[0])[0] < b]
+    return [tuple(r) for r in rows]
+
+
+def _file_name(user_id):
+    return re.sub(r"[^A-Za-z0-9_-]", "_", str(user_id)) + ".jsonl.gz"
+
+
+def _read_file(key, user_id, before=None):
+    path = os.path.join(HISTORY_ARCHIVE_DIR, key, _file_name(user_id))
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    if before is not None:
+        b = as_dt(before)
+        rows = [r for r in rows if as_dt(r["created_at"]) < b]
+    return sorted(rows, key=lambda r: as_dt(r["created_at"]), reverse=True)
+
+
+def _query(cx, sql, prefix, user_id, before, limit):
+    """`sql` filtered to the user (columns qualified by `prefix`), newest first."""
+    where, params = f" WHERE {prefix}user_id = :u", {"u": user_id, "n": limit}
+    if before is not None:
+        where += f" AND {prefix}created_at < :b"
+        params["b"] = before
+    return [dict(r) for r in cx.execute(
+        text(f"{sql}{where} ORDER BY {prefix}created_at DESC LIMIT :n"), params).mappings()]
+
+
+def recent(cx, user_id, limit=20, before=None, files=False):
+    """The user's newest `limit` question/answer rows older than `before`, hot first.
+
+    Cold month tables are read only when the hot tables run out; archived
+    files only with files=True (history pages and export, not the dashboard).
+    """
+    rows = _query(cx, _HOT, "q.", user_id, before, limit)
+    if len(rows) >= limit:
+        return rows
+    cursor = rows[-1]["created_at"] if rows else before
+    for key, state in _months(cx, cursor):
+        need = limit - len(rows)
+        if state == "cold":
+            rows += _query(cx, f"SELECT {', '.join(COLUMNS)} FROM {table(key)}", "", user_id, cursor, need)
+        elif files:
+            rows += _read_file(key, user_id, cursor)[:need]
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+def iter_user(engine, user_id, chunk=500):
+    """Every row for the user, newest first, across hot tables, cold months and files."""
+    before = None
+    while True:
+        with engine.connect() as cx:
+            rows = recent(cx, user_id, chunk, before, files=True)
+        yield from rows
+        if len(rows) < chunk:
+            return
+        before = rows[-1]["created_at"]
+
+
+# ---- Archive job ----
+def _move_batch(cx, key, cut, batch):
+    start, end = month_bounds(key)
+    rows = [dict(r) for r in cx.execute(text(
+        f"{_HOT} WHERE q.created_at >= :s AND q.created_at < :e ORDER BY q.created_at LIMIT :n"),
+        {"s": start, "e": min(end, cut), "n": batch}).mappings()]
+    if not rows:
+        return 0
+    cx.execute(text(f"INSERT INTO {table(key)} ({', '.join(COLUMNS)}) VALUES "
+                    f"({', '.join(':' + c for c in COLUMNS)}) ON CONFLICT DO NOTHING"), rows)
+    ids = list({r["question_id"] for r in rows})
+    cx.execute(text("DELETE FROM answers WHERE question_id IN :ids").bindparams(bindparam("ids", expanding=True)),
+               {"ids": ids})
+    cx.execute(text("DELETE FROM questions WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+               {"ids": ids})
+    cx.execute(text("UPDATE history_months SET row_count = row_count + :n, updated_at = :now WHERE month = :m"),
+               {"n": len(rows), "now": datetime.now(timezone.utc), "m": key})
+    return len(rows)
+
+
+def _to_files(engine, key, root=HISTORY_ARCHIVE_DIR, log=print):
+    """Write a cold month to per-user gzip files, then drop its table."""
+    out_dir = os.path.join(root, key)
+    tmp_dir = out_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    users = 0
+    with engine.connect() as cx:
+        uids = [r[0] for r in cx.execute(text(f"SELECT DISTINCT user_id FROM {table(key)}"))]
+        for uid in uids:
+            rows = cx.execute(text(f"SELECT {', '.join(COLUMNS)} FROM {table(key)} "
+                                   f"WHERE user_id {'IS NULL' if uid is None else '= :u'} ORDER BY created_at"),
+                              {"u": uid}).mappings()
+            with gzip.open(os.path.join(tmp_dir, _file_name(uid)), "wt", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps({k: (as_dt(v).isoformat() if k in ("created_at", "answered_at") and v
+                                            else v) for k, v in r.items()}) + "\n")
+            users += 1
+    if os.path.exists(out_dir):
+        os.rename(out_dir, f"{out_dir}.old-{int(time.time())}")
+    os.rename(tmp_dir, out_dir)
+    with engine.begin() as cx:
+        cx.execute(text("UPDATE history_months SET state = 'file', updated_at = :now WHERE month = :m"),
+                   {"now": datetime.now(timezone.utc), "m": key})
+        cx.exec_driver_sql(f"DROP TABLE IF EXISTS {table(key)}")
+    log(f"history archive: {key} -> {users} user files in {out_dir}")
+
+
+def archive(engine, hot_days=HISTORY_HOT_DAYS, file_months=HISTORY_FILE_MONTHS, batch=1000, pause=0.0,
+            now=None, log=print):
+    """Move question/answer pairs older than `hot_days` into month storage; idempotent and resumable."""
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).replace(tzinfo=None)
+    cut = now - timedelta(days=hot_days)
+    moved = 0
+    while True:
+        with engine.connect() as cx:
+            oldest = cx.execute(text("SELECT MIN(created_at) FROM questions WHERE created_at < :c"),
+                                {"c": cut}).scalar()
+        if oldest is None:
+            break
+        key = month_key(as_dt(oldest))
+        with engine.begin() as cx:
+            ensure_month(cx, key)
+        month_moved = 0
+        while True:
+            with engine.begin() as cx:
+                n = _move_batch(cx, key, cut, batch)
+            month_moved += n
+            if n < batch:
+                break
+            if pause:
+                time.sleep(pause)
+        moved += month_moved
+        if not month_moved:
+            log(f"history archive: {key} has rows before the cut that did not move; stopping")
+            break
+        log(f"history archive: {key} now cold ({moved} rows moved so far)")
+    m = now.year * 12 + now.month - 1 - file_months
+    file_cut = f"{m // 12:04d}_{m % 12 + 1:02d}"
+    with engine.connect() as cx:
+        old = [k for k, state in _months(cx) if state == "cold" and k < file_cut]
+    for key in sorted(old):
+        _to_files(engine, key, log=log)
+    log(f"history archive: moved {moved} rows, {len(old)} months to files")
+    return moved
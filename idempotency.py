@@ -0,0 +1,142 @@
+import hashlib, os, random, re, threading, time
+from functools import wraps
+from flask import Response, jsonify, make_response, request, session
+from sqlalchemy import text
+
+# ---- Idempotency keys ----
+# Clients send `Idempotency-Key` (header) or `idempotency_key` (JSON/form
+# field) with POSTs that cost a model call. The first request with a key
+# claims it (a `pending` row) and runs the view; its response is stored for
+# IDEM_TTL seconds. A retry with the same key gets that stored response, or,
+# while the first call is still running, waits for it (in-process via an
+# Event, across workers by polling the row) instead of calling the model again.
+IDEM_TTL = int(os.getenv("IDEM_TTL", "86400"))
+IDEM_WAIT = float(os.getenv("IDEM_WAIT", "30"))        # how long a retry waits for the first call
+IDEM_STALE = float(os.getenv("IDEM_STALE", "120"))     # pending rows older than this were abandoned
+
+_KEY = re.compile(r"^[A-Za-z0-9_\-:.]{8,100}$")
+
+
+def request_key():
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        data = request.get_json(silent=True) if request.is_json else None
+        key = (data or {}).get("idempotency_key") or request.form.get("idempotency_key")
+    return key if key and _KEY.match(key) else None
+
+
+def _fingerprint():
+    """Same key with a different payload is a client bug, not a retry."""
+    body = request.get_data(cache=True)
+    return hashlib.sha256(request.method.encode() + request.path.encode() + body).hexdigest()[:32]
+
+
+class IdempotencyStore:
+    def __init__(self, engine, ttl=IDEM_TTL, wait=IDEM_WAIT, stale=IDEM_STALE):
+        self.engine = engine
+        self.ttl, self.wait, self.stale = ttl, wait, stale
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    # -- storage --
+    def _claim(self, uid, route, key, fp):
+        now = time.time()
+        with self.engine.begin() as cx:
+            cx.execute(text("DELETE FROM idempotency_keys WHERE user_id = :u AND route = :r AND key = :k "
+                            "AND (expires_at < :now OR (state = 'pending' AND created_at < :stale))"),
+                       {"u": uid, "r": route, "k": key, "now": now, "stale": now - self.stale})
+            res = cx.execute(text("""
+                INSERT INTO idempotency_keys (user_id, route, key, fingerprint, state, created_at, expires_at)
+                VALUES (:u, :r, :k, :fp, 'pending', :now, :exp)
+                ON CONFLICT (user_id, route, key) DO NOTHING
+            """), {"u": uid, "r": route, "k": key, "fp": fp, "now": now, "exp": now + self.ttl})
+        return res.rowcount == 1
+
+    def _load(self, uid, route, key):
+        with self.engine.connect() as cx:
+            return cx.execute(text(
+                "SELECT fingerprint, state, status, mimetype, body FROM idempotency_keys "
+                "WHERE user_id = :u AND route = :r AND key = :k"),
+                {"u": uid, "r": route, "k": key}).mappings().first()
+
+    def _finish(self, uid, route, key, resp):
+        with self.engine.begin() as cx:
+            cx.execute(text("""
+                UPDATE idempotency_keys SET state = 'done', status = :s, mimetype = :m, body = :b
+                WHERE user_id = :u AND route = :r AND key = :k
+            """), {"s": resp.status_code, "m": resp.mimetype, "b": resp.get_data(as_text=True),
+                   "u": uid, "r": route, "k": key})
+
+    def _release(self, uid, route, key):
+        with self.engine.begin() as cx:
+            cx.execute(text("DELETE FROM idempotency_keys WHERE user_id = :u AND route = :r AND key = :k "
+                            "AND state = 'pending'"), {"u": uid, "r": route, "k": key})
+
+    def purge(self):
+        """Delete expired keys; returns the number removed."""
+        with self.engine.begin() as cx:
+            return cx.execute(text("DELETE FROM idempotency_keys WHERE expires_at < :now"),
+                              {"now": time.time()}).rowcount
+
+    # -- request flow --
+    def run(self, uid, route, key, fp, view):
+        ident = (uid, route, key)
+        deadline = time.monotonic() + self.wait
+        while True:
+            if self._claim(uid, route, key, fp):
+                return self._run_owner(ident, view)
+            row = self._load(uid, route, key)
+            if row is None:
+                continue  # expired/released between our claim and read; claim again
+            if row["fingerprint"] != fp:
+                return jsonify({"ok": False, "error": "idempotency_key_reused"}), 422
+            if row["state"] == "done":
+                resp = Response(row["body"], status=row["status"], mimetype=row["mimetype"])
+                resp.headers["Idempotent-Replayed"] = "true"
+                return resp
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                resp = jsonify({"ok": False, "error": "in_progress"})
+                resp.status_code, resp.headers["Retry-After"] = 409, "2"
+                return resp
+            with self._lock:
+                ev = self._inflight.get(ident)
+            if ev is not None:
+                ev.wait(remaining)  # the first call is running in this worker
+            else:
+                time.sleep(min(0.25, remaining))  # ...or in another one
+
+    def _run_owner(self, ident, view):
+        ev = threading.Event()
+        with self._lock:
+            self._inflight[ident] = ev
+        try:
+            resp = make_response(view())
+            if resp.status_code < 500:
+                self._finish(*ident, resp)
+            else:
+                self._release(*ident)  # let a retry try again
+            return resp
+        except BaseException:
+            self._release(*ident)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(ident, None)
+            ev.set()
+            if random.random() < 0.01:
+                self.purge()  # opportunistic TTL eviction; `flask idempotency-purge` for cron
+
+    def guard(self, route):
+        """View decorator: dedupe by the request's idempotency key (no key: run as usual)."""
+        def wrap(view):
+            @wraps(view)
+            def inner(*args, **kwargs):
+                fp = _fingerprint()  # before request_key() parses the form, so the raw body is cached
+                key = request_key()
+                uid = session.get("user_id")
+                if not key or not uid:
+                    return view(*args, **kwargs)
+                return self.run(uid, route, key, fp, lambda: view(*args, **kwargs))
+            return inner
+        return wrap
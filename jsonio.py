@@ -0,0 +1,95 @@
+import dataclasses, decimal, json, uuid
+from collections.abc import Mapping
+from datetime import date, datetime, time
+from flask import Response, current_app, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback; same output, just slower
+    orjson = None
+
+# ---- JSON responses ----
+# Views return SQLAlchemy rows (Row / RowMapping), datetimes and UUIDs as-is;
+# FastJSONProvider encodes them in one pass (orjson when installed) instead of
+# each view copying rows into dicts and Flask's provider calling default() per
+# field. Dates are ISO 8601 (Flask's default provider used HTTP dates).
+# ndjson() streams list endpoints one object per line for clients that send
+# `Accept: application/x-ndjson`.
+NDJSON = "application/x-ndjson"
+
+
+def _default(o):
+    if isinstance(o, Mapping):  # RowMapping
+        return dict(o)
+    if hasattr(o, "_mapping"):  # Row: same shape as .mappings()
+        return dict(o._mapping)
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson else 0
+
+
+def dumps_bytes(obj, indent=False):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_OPTS | (orjson.OPT_INDENT_2 if indent else 0))
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=None if indent else (",", ":"),
+                      indent=2 if indent else None).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """app.json: orjson (stdlib fallback) with Row/RowMapping, date and UUID support."""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # callers asking for specific json.dumps options get exactly that
+            kwargs.setdefault("default", _default)
+            return json.dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj, indent=self._app.debug), mimetype=self.mimetype)
+
+
+def wants_ndjson():
+    accept = request.accept_mimetypes
+    return accept[NDJSON] > accept["application/json"]  # explicit ask only; */* stays JSON
+
+
+def ndjson(items, head=None):
+    """Stream `items` (rows, dicts...) as NDJSON; `head`, if given, is the first line."""
+    def gen():
+        if head is not None:
+            yield dumps_bytes(head) + b"\n"
+        for it in items:
+            yield dumps_bytes(it) + b"\n"
+    return Response(stream_with_context(gen()), mimetype=NDJSON)
+
+
+def list_response(key, items, **meta):
+    """`{"ok": true, **meta, key: [...]}` as JSON, or NDJSON (meta line, then one item per line)."""
+    if wants_ndjson():
+        resp = ndjson(items, head={"ok": True, **meta})
+    else:
+        resp = current_app.json.response({"ok": True, **meta, key: list(items)})
+    resp.vary.add("Accept")  # same URL, two bodies: shared caches must key on Accept
+    return resp
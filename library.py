@@ -0,0 +1,224 @@
+import json, os, random, threading, time
+from sqlalchemy import text
+
+# ---- Decks ----
+# Tarot in the usual file order: majors 0-21, then Wands, Cups, Swords,
+# Pentacles (Ace..King) -- static/tarot/00.jpg .. 77.jpg follow this order.
+MAJORS = [
+    ("The Fool", "beginnings, spontaneity, faith", "hesitation, recklessness, fear of the leap"),
+    ("The Magician", "willpower, skill, manifestation", "scattered energy, untapped talent, trickery"),
+    ("The High Priestess", "intuition, stillness, inner voice", "ignored instincts, secrets, disconnection"),
+    ("The Empress", "nurture, abundance, creativity", "dependence, creative block, self-neglect"),
+    ("The Emperor", "structure, authority, stability", "rigidity, control, lack of discipline"),
+    ("The Hierophant", "tradition, guidance, belonging", "rebellion, dogma, personal beliefs"),
+    ("The Lovers", "union, choice, alignment", "imbalance, misalignment, hard choices"),
+    ("The Chariot", "determination, direction, victory", "loss of direction, opposition, self-doubt"),
+    ("Strength", "courage, patience, compassion", "self-doubt, low energy, raw emotion"),
+    ("The Hermit", "solitude, reflection, inner guidance", "isolation, withdrawal, loneliness"),
+    ("Wheel of Fortune", "cycles, change, destiny", "resistance to change, bad luck, stuck patterns"),
+    ("Justice", "fairness, truth, accountability", "dishonesty, avoidance, unfairness"),
+    ("The Hanged Man", "surrender, new perspective, pause", "stalling, indecision, resistance"),
+    ("Death", "endings, transformation, release", "clinging, stagnation, fear of change"),
+    ("Temperance", "balance, moderation, healing", "excess, imbalance, impatience"),
+    ("The Devil", "attachment, temptation, shadow", "release, breaking free, reclaiming power"),
+    ("The Tower", "upheaval, revelation, awakening", "averted disaster, delayed change, fear of upheaval"),
+    ("The Star", "hope, renewal, serenity", "discouragement, lost faith, disconnection"),
+    ("The Moon", "dreams, uncertainty, intuition", "confusion lifting, released fear, truth surfacing"),
+    ("The Sun", "vitality, success, joy", "temporary gloom, low energy, muted joy"),
+    ("Judgement", "awakening, reckoning, calling", "self-judgement, doubt, ignoring the call"),
+    ("The World", "completion, wholeness, arrival", "loose ends, delays, seeking closure"),
+]
+SUITS = [
+    ("Wands", "passion", "creative drive and action"),
+    ("Cups", "feeling", "emotions and relationships"),
+    ("Swords", "clarity", "thoughts, words and conflict"),
+    ("Pentacles", "grounding", "work, money and the body"),
+]
+RANKS = [
+    ("Ace", "new beginning, potential", "missed opening, delay"),
+    ("Two", "choice, partnership", "indecision, imbalance"),
+    ("Three", "growth, collaboration", "setbacks, misalignment"),
+    ("Four", "stability, rest", "restlessness, stagnation"),
+    ("Five", "challenge, change", "recovery, lingering tension"),
+    ("Six", "harmony, generosity", "imbalance, nostalgia"),
+    ("Seven", "persistence, assessment", "doubt, scattered effort"),
+    ("Eight", "movement, mastery", "hesitation, feeling trapped"),
+    ("Nine", "resilience, fulfilment", "worry, overextension"),
+    ("Ten", "culmination, completion", "burden, endings resisted"),
+    ("Page", "curiosity, messages", "immaturity, mixed signals"),
+    ("Knight", "momentum, pursuit", "haste, inconsistency"),
+    ("Queen", "nurturing mastery, intuition", "insecurity, over-giving"),
+    ("King", "leadership, command", "control, rigidity"),
+]
+TAROT = [(n, up, rev) for n, up, rev in MAJORS] + [
+    (f"{rank} of {suit}", f"{rk_up}, {s_kw}", f"{rk_rev}, blocked {s_kw}")
+    for suit, s_kw, _ in SUITS for rank, rk_up, rk_rev in RANKS
+]
+# Elder Futhark; reversed (merkstave) keywords
+RUNES = [
+    ("Fehu", "beginnings, resources, flow", "loss, greed, blocked flow"),
+    ("Uruz", "strength, vitality, endurance", "weakness, missed chances, illness"),
+    ("Thurisaz", "protection, reaction, threshold", "danger, compulsion, defenselessness"),
+    ("Ansuz", "wisdom, messages, communication", "misunderstanding, manipulation, bad advice"),
+    ("Raidho", "journey, movement, change", "disruption, stagnation, detours"),
+    ("Kenaz", "insight, creativity, illumination", "lack of clarity, false hope, ending"),
+    ("Gebo", "gift, partnership, exchange", "imbalance, obligation, one-sidedness"),
+    ("Wunjo", "joy, harmony, belonging", "sorrow, alienation, strife"),
+    ("Hagalaz", "disruption, cleansing, trial", "stagnation, avoided crisis, loss of control"),
+    ("Nauthiz", "need, restraint, resilience", "deprivation, desire, distress"),
+    ("Isa", "stillness, pause, clarity", "blockage, frozen feelings, delay"),
+    ("Jera", "harvest, cycles, reward", "patience needed, poor timing, reversal"),
+    ("Eihwaz", "endurance, transformation, defense", "confusion, dissatisfaction, weakness"),
+    ("Perthro", "mystery, fate, chance", "secrets kept, stagnation, loneliness"),
+    ("Algiz", "protection, guardianship, instinct", "hidden danger, vulnerability, taboo"),
+    ("Sowilo", "success, vitality, guidance", "false goals, misguidance, burnout"),
+    ("Tiwaz", "honor, justice, courage", "imbalance, lost motivation, conflict"),
+    ("Berkano", "growth, birth, nurturing", "family trouble, anxiety, stagnation"),
+    ("Ehwaz", "trust, teamwork, progress", "restlessness, mistrust, disharmony"),
+    ("Mannaz", "self, community, awareness", "isolation, self-delusion, manipulation"),
+    ("Laguz", "intuition, flow, dreams", "confusion, poor judgement, fear"),
+    ("Ingwaz", "completion, fertility, rest", "impotence, toil, unfinished work"),
+    ("Dagaz", "breakthrough, dawn, clarity", "ending, limits, completion"),
+    ("Othala", "heritage, home, inheritance", "prejudice, poverty, clinging to the past"),
+]
+DECKS = {"tarot": TAROT, "rune": RUNES}
+ORIENTATIONS = ("upright", "reversed")
+
+# Spread positions an interpretation can be read in
+POSITIONS = {
+    "single": "As your card for today,",
+    "past": "In the past position,",
+    "present": "In the present position,",
+    "future": "In the future position,",
+    "challenge": "As the challenge before you,",
+    "advice": "As advice,",
+}
+SPREADS = {"single": ["single"], "three": ["past", "present", "future"], "guidance": ["present", "challenge", "advice"]}
+
+LIBRARY_CHECK_SECS = float(os.getenv("LIBRARY_CHECK_SECS", "60"))
+
+
+# ---- Building the library (CLI batch job) ----
+def _offline_entry(kind, card, keywords, orientation, position):
+    """Template text for one library row; used when no LLM is configured for the build."""
+    kws = [k.strip() for k in keywords.split(",") if k.strip()]
+    lead = POSITIONS[position]
+    if orientation == "upright":
+        meaning = (f"{lead} {card} speaks of {', '.join(kws[:-1])} and {kws[-1]}. "
+                   f"Lean into {kws[0]}; it is already moving toward you.")
+        affirmation = f"I am open to {kws[0]}."
+    else:
+        meaning = (f"{lead} {card} reversed points to {', '.join(kws[:-1])} and {kws[-1]}. "
+                   f"Notice where {kws[0]} is asking for gentle attention rather than force.")
+        affirmation = f"I am gently releasing {kws[0]}."
+    return {"keywords": ", ".join(kws), "meaning": meaning, "affirmation": affirmation}
+
+
+def _llm_entries(client, kind, card, keywords, orientation, model="gpt-4o-mini"):
+    """One completion per card x orientation covering every position, as JSON."""
+    system = ("You are Miss Amara, a compassionate tarot and rune guide. Plain language, kind, grounded. "
+              "Return only JSON: an object keyed by position, each value {\"meaning\": 2-3 sentences, "
+              "\"affirmation\": one sentence starting with 'I am'}.")
+    user = (f"{kind} card: {card} ({orientation}). Core keywords: {keywords}. "
+            f"Positions: {', '.join(POSITIONS)}.")
+    resp = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+        response_format={"type": "json_object"},
+        temperature=0.7,
+    )
+    data = json.loads(resp.choices[0].message.content)
+    return {pos: {"keywords": keywords, "meaning": (data.get(pos) or {}).get("meaning", ""),
+                  "affirmation": (data.get(pos) or {}).get("affirmation", "")}
+            for pos in POSITIONS}
+
+
+def build_library(engine, client=None, activate=True, log=print):
+    """Generate a new library version for every card x orientation x position."""
+    with engine.begin() as cx:
+        version = (cx.execute(text("SELECT MAX(version) FROM card_library_versions")).scalar() or 0) + 1
+        cx.execute(text("INSERT INTO card_library_versions (version, source, active) VALUES (:v, :s, 0)"),
+                   {"v": version, "s": "llm" if client else "offline"})
+    rows = []
+    for kind, deck in DECKS.items():
+        for card, up, rev in deck:
+            for orientation, keywords in (("upright", up), ("reversed", rev)):
+                entries = None
+                if client is not None:
+                    try:
+                        entries = _llm_entries(client, kind, card, keywords, orientation)
+                    except Exception as e:
+                        log(f"  {card} ({orientation}): LLM failed ({e}); using offline text")
+                for pos in POSITIONS:
+                    e = (entries or {}).get(pos)
+                    if not e or not e["meaning"]:
+                        e = _offline_entry(kind, card, keywords, orientation, pos)
+                    rows.append({"v": version, "k": kind, "c": card, "o": orientation, "p": pos, **e})
+    with engine.begin() as cx:
+        cx.execute(text(
+            "INSERT INTO card_library (version, kind, card, orientation, position, keywords, meaning, affirmation) "
+            "VALUES (:v, :k, :c, :o, :p, :keywords, :meaning, :affirmation)"), rows)
+    if activate:
+        activate_version(engine, version)
+    log(f"library v{version}: {len(rows)} entries{' (active)' if activate else ''}")
+    return version
+
+
+def activate_version(engine, version):
+    with engine.begin() as cx:
+        cx.execute(text("UPDATE card_library_versions SET active = CASE WHEN version = :v THEN 1 ELSE 0 END"),
+                   {"v": version})
+
+
+# ---- Serving (in-memory index) ----
+class LibraryIndex:
+    """The active library version held in a dict; re-checks the active version every LIBRARY_CHECK_SECS."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.version = None
+        self._entries = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _active_version(self, cx):
+        return cx.execute(text("SELECT version FROM card_library_versions WHERE active = 1")).scalar()
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < LIBRARY_CHECK_SECS:
+            return
+        with self._lock:
+            if not force and now - self._checked < LIBRARY_CHECK_SECS:
+                return
+            self._checked = now
+            try:
+                with self.engine.connect() as cx:
+                    active = self._active_version(cx)
+                    if active is None or active == self.version:
+                        return
+                    rows = cx.execute(text(
+                        "SELECT kind, card, orientation, position, keywords, meaning, affirmation "
+                        "FROM card_library WHERE version = :v"), {"v": active}).mappings().all()
+            except Exception:
+                return  # table missing / DB hiccup: keep serving what we have
+            self._entries = {(r["kind"], r["card"], r["orientation"], r["position"]): dict(r) for r in rows}
+            self.version = active
+
+    def lookup(self, kind, card, orientation="upright", position="single"):
+        self.refresh()
+        hit = self._entries.get((kind, card, orientation, position))
+        if hit is None:
+            # Library not built yet: fall back to the offline template
+            deck = {c: (up, rev) for c, up, rev in DECKS[kind]}
+            up, rev = deck[card]
+            hit = {"kind": kind, "card": card, "orientation": orientation, "position": position,
+                   **_offline_entry(kind, card, up if orientation == "upright" else rev, orientation, position)}
+        return hit
+
+
+def draw_cards(kind, spread="single", rng=random):
+    """Pick distinct cards for a spread: [(card, orientation, position), ...]."""
+    positions = SPREADS[spread]
+    cards = rng.sample([c for c, _, _ in DECKS[kind]], len(positions))
+    return [(c, rng.choice(ORIENTATIONS), p) for c, p in zip(cards, positions)]
@@ -0,0 +1,145 @@
+import json, os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from sqlalchemy import text
+
+from user_context import estimate_tokens
+
+# ---- Model routing and token budgets ----
+# Every completion goes through ModelRouter.complete(route, ...), which picks
+# the model, max_tokens and temperature for the call type (ROUTES), asks for
+# JSON when the route has fields (response_format=json_object, no regex
+# scraping), and records prompt/completion tokens per (day, user, route) in
+# llm_usage. Budgets are daily, in total tokens:
+#
+#   LLM_USER_DAILY_TOKENS    per user (0 = unlimited)
+#   LLM_GLOBAL_DAILY_TOKENS  all users together (0 = unlimited)
+#
+# A call may not use more than what is left: max_tokens shrinks to the
+# remaining budget, and when even the route's min_tokens don't fit,
+# BudgetExceeded is raised and the caller serves its offline answer.
+# Models per route: LLM_MODEL_<ROUTE> (e.g. LLM_MODEL_ORACLE=gpt-4o), else
+# LLM_MODEL (default gpt-4o-mini).
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_USER_DAILY_TOKENS = int(os.getenv("LLM_USER_DAILY_TOKENS", "20000"))
+LLM_GLOBAL_DAILY_TOKENS = int(os.getenv("LLM_GLOBAL_DAILY_TOKENS", "0"))
+GLOBAL = "*"  # llm_usage.user_id of the all-users rows
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    max_tokens: int
+    min_tokens: int
+    temperature: float
+    fields: tuple = ()  # JSON keys the reply must carry; () = plain text
+
+    @property
+    def model(self):
+        return os.getenv(f"LLM_MODEL_{self.name.upper()}", LLM_MODEL)
+
+
+ROUTES = {r.name: r for r in (
+    Route("oracle", max_tokens=450, min_tokens=200, temperature=0.8, fields=("body", "affirmation", "tags")),
+    Route("aura", max_tokens=120, min_tokens=60, temperature=0.8,  # four JSON fields; 80 cut replies off
+          fields=("aura_color", "emotion", "keywords", "affirmation")),
+    Route("draw", max_tokens=120, min_tokens=60, temperature=0.7),
+)}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class BadOutput(Exception):
+    """The model's reply wasn't the JSON object the route asked for."""
+
+
+_UPSERT = text("""
+    INSERT INTO llm_usage (day, user_id, route, calls, failures, prompt_tokens, completion_tokens)
+    VALUES (:d, :u, :r, 1, :f, :p, :c)
+    ON CONFLICT (day, user_id, route) DO UPDATE SET
+      calls = llm_usage.calls + 1,
+      failures = llm_usage.failures + excluded.failures,
+      prompt_tokens = llm_usage.prompt_tokens + excluded.prompt_tokens,
+      completion_tokens = llm_usage.completion_tokens + excluded.completion_tokens
+""")
+
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+
+def _parse(route, choice):
+    out = choice.message.content or ""
+    if not route.fields:
+        return out.strip()
+    try:
+        data = json.loads(out)
+    except ValueError:
+        data = None
+    # a reply cut off at max_tokens is never valid JSON worth salvaging
+    if choice.finish_reason == "length" or not isinstance(data, dict) or any(not data.get(f) for f in route.fields):
+        raise BadOutput(f"{route.name}: {out[:200]!r}")
+    return {f: data[f] for f in route.fields}
+
+
+class ModelRouter:
+    def __init__(self, engine, client, user_budget=LLM_USER_DAILY_TOKENS, global_budget=LLM_GLOBAL_DAILY_TOKENS):
+        self.engine, self._client = engine, client  # client: zero-arg callable returning the OpenAI client
+        self.user_budget, self.global_budget = user_budget, global_budget
+
+    def remaining(self, user_id=None):
+        """Tokens left today for this user (and everyone); None when unlimited."""
+        limits = {GLOBAL: self.global_budget}
+        if user_id:
+            limits[user_id] = self.user_budget
+        limits = {k: v for k, v in limits.items() if v > 0}
+        if not limits:
+            return None
+        with self.engine.connect() as cx:
+            used = dict(cx.execute(text("""
+                SELECT user_id, SUM(prompt_tokens + completion_tokens) FROM llm_usage
+                WHERE day = :d AND user_id IN (:g, :u) GROUP BY user_id
+            """), {"d": _today(), "g": GLOBAL, "u": user_id or GLOBAL}).all())
+        return min(limit - (used.get(k) or 0) for k, limit in limits.items())
+
+    def complete(self, route_name, system, user, user_id=None):
+        """Run one call on `route_name`: a dict of the route's fields, or text for plain routes."""
+        route = ROUTES[route_name]
+        max_tokens = route.max_tokens
+        left = self.remaining(user_id)
+        if left is not None:
+            max_tokens = min(max_tokens, left - estimate_tokens(system + user))
+            if max_tokens < route.min_tokens:
+                raise BudgetExceeded(route_name)
+        kw = {"response_format": {"type": "json_object"}} if route.fields else {}
+        resp = self._client().chat.completions.create(
+            model=route.model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            temperature=route.temperature,
+            max_tokens=max_tokens,
+            **kw,
+        )
+        try:
+            out = _parse(route, resp.choices[0])
+        except BadOutput:
+            self._record(route.name, user_id, resp.usage, ok=False)
+            raise
+        self._record(route.name, user_id, resp.usage, ok=True)
+        return out
+
+    def _record(self, route_name, user_id, usage, ok):
+        p = getattr(usage, "prompt_tokens", 0) or 0
+        c = getattr(usage, "completion_tokens", 0) or 0
+        row = {"d": _today(), "r": route_name, "f": 0 if ok else 1, "p": p, "c": c}
+        with self.engine.begin() as cx:
+            cx.execute(_UPSERT, [dict(row, u=u) for u in ([user_id] if user_id else []) + [GLOBAL]])
+
+    def usage(self, days=7):
+        """Per-day, per-route totals across all users, newest first."""
+        with self.engine.connect() as cx:
+            return cx.execute(text("""
+                SELECT day, route, calls, failures, prompt_tokens, completion_tokens FROM llm_usage
+                WHERE user_id = :g ORDER BY day DESC, route LIMIT :n
+            """), {"g": GLOBAL, "n": days * len(ROUTES)}).mappings().all()
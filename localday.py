@@ -0,0 +1,106 @@
+import os, time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import text
+
+# ---- Per-user local days ----
+# Daily content (draws, aura entries, journal days, the moon page) is keyed
+# on the user's *local* date: users.tz holds an IANA zone name, sent by the
+# browser (Intl.DateTimeFormat().resolvedOptions().timeZone) at signup and
+# POST /settings/timezone, and copied into the session so requests never
+# look it up. Users without one get DEFAULT_TZ.
+#
+# `flask daily-rollover` (cron, every ~10 minutes) pre-warms the next local
+# day for each timezone cohort ROLLOVER_LEAD_MINUTES before its midnight:
+# daily draws for recently active users and their card images. New days
+# then begin across the 24 hours, cohort by cohort, with the rows already
+# in place, instead of every user's first-of-day work landing at UTC
+# midnight. rollover_runs records (tz, local_date) so reruns skip done cohorts.
+DEFAULT_TZ = os.getenv("DEFAULT_TZ", "UTC")
+ROLLOVER_LEAD_MINUTES = int(os.getenv("ROLLOVER_LEAD_MINUTES", "30"))
+ROLLOVER_ACTIVE_DAYS = int(os.getenv("ROLLOVER_ACTIVE_DAYS", "7"))  # only pre-warm users seen this recently
+
+
+@lru_cache(maxsize=1024)
+def zone(name):
+    """ZoneInfo for an IANA name; DEFAULT_TZ for unknown or empty names."""
+    try:
+        return ZoneInfo(name or DEFAULT_TZ)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TZ)
+
+
+def valid(name):
+    if not name or len(name) > 64:
+        return False
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def today(tz=None, now=None):
+    """The local date in `tz` (the key for all daily content)."""
+    return (now or datetime.now(timezone.utc)).astimezone(zone(tz)).date()
+
+
+def next_midnight(tz, now=None):
+    """UTC instant of the next local midnight in `tz`."""
+    now = now or datetime.now(timezone.utc)
+    local = now.astimezone(zone(tz))
+    midnight = datetime.combine(local.date() + timedelta(days=1), datetime.min.time(), zone(tz))
+    return midnight.astimezone(timezone.utc)
+
+
+def due_cohorts(cx, lead_minutes=ROLLOVER_LEAD_MINUTES, now=None):
+    """[(tz, next local date)] for cohorts whose midnight is within the lead window and not yet warmed."""
+    now = now or datetime.now(timezone.utc)
+    zones = {r[0] or DEFAULT_TZ for r in cx.execute(text("SELECT DISTINCT tz FROM users"))}
+    due = []
+    for tz in sorted(zones):
+        if next_midnight(tz, now) - now <= timedelta(minutes=lead_minutes):
+            due.append((tz, today(tz, now) + timedelta(days=1)))
+    if not due:
+        return []
+    done = {(r[0], str(r[1])) for r in cx.execute(text("SELECT tz, local_date FROM rollover_runs"))}
+    return [(tz, d) for tz, d in due if (tz, str(d)) not in done]
+
+
+def cohort_users(cx, tz, active_days=ROLLOVER_ACTIVE_DAYS, now=None):
+    """Users in `tz` with a daily draw in the last `active_days`."""
+    now = now or datetime.now(timezone.utc)
+    tz_filter = "(u.tz = :tz OR u.tz IS NULL)" if tz == DEFAULT_TZ else "u.tz = :tz"
+    return [r[0] for r in cx.execute(text(f"""
+        SELECT DISTINCT u.id FROM users u JOIN daily_draws d ON d.user_id = u.id
+        WHERE {tz_filter} AND d.draw_date >= :since
+    """), {"tz": tz, "since": (now - timedelta(days=active_days)).date()})]
+
+
+def rollover(engine, warm, lead_minutes=ROLLOVER_LEAD_MINUTES, pause=0.0, now=None, log=print):
+    """Pre-warm every due cohort: warm(user_id, local_date) per active user, then mark the cohort done."""
+    now = now or datetime.now(timezone.utc)
+    with engine.connect() as cx:
+        due = due_cohorts(cx, lead_minutes, now)
+    total = 0
+    for tz, day in due:
+        with engine.connect() as cx:
+            users = cohort_users(cx, tz, now=now)
+        for uid in users:
+            try:
+                warm(uid, day)
+            except Exception as e:  # one bad user must not stop the cohort
+                log(f"daily rollover: {tz} {day} user {uid} failed: {e}")
+            if pause:
+                time.sleep(pause)
+        with engine.begin() as cx:
+            cx.execute(text("""
+                INSERT INTO rollover_runs (tz, local_date, users, finished_at) VALUES (:tz, :d, :n, :now)
+                ON CONFLICT (tz, local_date) DO NOTHING
+            """), {"tz": tz, "d": day, "n": len(users), "now": datetime.now(timezone.utc)})
+        total += len(users)
+        log(f"daily rollover: {tz} {day} warmed for {len(users)} users")
+    with engine.begin() as cx:
+        cx.execute(text("DELETE FROM rollover_runs WHERE local_date < :d"), {"d": (now - timedelta(days=7)).date()})
+    return total
@@ -0,0 +1,158 @@
+import bisect, math, os, threading
+from datetime import datetime, time as dtime, timezone
+
+# ---- Moon phases ----
+# New/full moon instants come from Meeus, "Astronomical Algorithms" ch. 49
+# (main periodic terms; good to a few minutes). They are computed once per
+# process for MOON_TABLE_YEARS, then every lookup is a bisect over that table:
+# the elongation is interpolated between the surrounding new and full moons,
+# which puts illumination within ~1% of an ephemeris. No network, no model.
+MOON_TABLE_YEARS = tuple(int(y) for y in os.getenv("MOON_TABLE_YEARS", "1900-2100").split("-"))
+
+SYNODIC = 29.530588861
+_UNIX_JD = 2440587.5
+_DELTA_T = 69.0 / 86400  # TT - UT, close enough for this century
+
+PHASES = ("New Moon", "Waxing Crescent", "First Quarter", "Waxing Gibbous",
+          "Full Moon", "Waning Gibbous", "Last Quarter", "Waning Crescent")
+
+RITUALS = {
+    "New Moon": "Write one intention on paper, fold it twice and keep it somewhere you will see it until the full moon.",
+    "Waxing Crescent": "Take the smallest next step toward your intention today, then name it aloud before sleep.",
+    "First Quarter": "Notice the one obstacle in your way; breathe into it for three slow breaths and choose a response.",
+    "Waxing Gibbous": "Refine rather than restart: tidy one corner of your space and adjust your plan to match.",
+    "Full Moon": "Sit in the moonlight (or by a candle), list what has come to fruition and thank each item by name.",
+    "Waning Gibbous": "Share something you have learned this cycle with someone who would benefit from it.",
+    "Last Quarter": "Write down one habit or worry you are ready to release, then tear the paper and let it go.",
+    "Waning Crescent": "Rest. Breathe slowly for two minutes and release one worry on each exhale.",
+}
+
+# Meeus table 49.A: (new moon coeff, full moon coeff, power of E, M, M', F, Omega multipliers)
+_TERMS = (
+    (-0.40720, -0.40614, 0, 0, 1, 0, 0),
+    (0.17241, 0.17302, 1, 1, 0, 0, 0),
+    (0.01608, 0.01614, 0, 0, 2, 0, 0),
+    (0.01039, 0.01043, 0, 0, 0, 2, 0),
+    (0.00739, 0.00734, 1, -1, 1, 0, 0),
+    (-0.00514, -0.00515, 1, 1, 1, 0, 0),
+    (0.00208, 0.00209, 2, 2, 0, 0, 0),
+    (-0.00111, -0.00111, 0, 0, 1, -2, 0),
+    (-0.00057, -0.00057, 0, 0, 1, 2, 0),
+    (0.00056, 0.00056, 1, 1, 2, 0, 0),
+    (-0.00042, -0.00042, 0, 0, 3, 0, 0),
+    (0.00042, 0.00042, 1, 1, 0, 2, 0),
+    (0.00038, 0.00038, 1, 1, 0, -2, 0),
+    (-0.00024, -0.00024, 1, -1, 2, 0, 0),
+    (-0.00017, -0.00017, 0, 0, 0, 0, 1),
+)
+
+
+def _syzygy(k):
+    """Julian Day (UT) of the new moon for integer k, full moon for k + 0.5 (k=0 is Jan 2000)."""
+    T = k / 1236.85
+    jde = (2451550.09766 + SYNODIC * k + 0.00015437 * T ** 2
+           - 0.000000150 * T ** 3 + 0.00000000073 * T ** 4)
+    E = 1 - 0.002516 * T - 0.0000074 * T ** 2
+    M = math.radians(2.5534 + 29.10535670 * k - 0.0000014 * T ** 2)
+    Mp = math.radians(201.5643 + 385.81693528 * k + 0.0107582 * T ** 2 + 0.00001238 * T ** 3)
+    F = math.radians(160.7108 + 390.67050284 * k - 0.0016118 * T ** 2 - 0.00000227 * T ** 3)
+    Om = math.radians(124.7746 - 1.56375588 * k + 0.0020672 * T ** 2)
+    full = k % 1 != 0
+    for new_c, full_c, e, m, mp, f, om in _TERMS:
+        jde += (full_c if full else new_c) * E ** e * math.sin(m * M + mp * Mp + f * F + om * Om)
+    return jde - _DELTA_T
+
+
+# Alternating [new, full, new, full, ...] instants in JD, built on first use
+_table = None
+_table_lock = threading.Lock()
+
+
+def _events():
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                lo, hi = MOON_TABLE_YEARS
+                k0, k1 = math.floor((lo - 2000) * 12.3685) - 1, math.ceil((hi + 1 - 2000) * 12.3685) + 1
+                _table = [_syzygy(k + half) for k in range(k0, k1) for half in (0, 0.5)]
+    return _table
+
+
+def _jd(dt):
+    return dt.timestamp() / 86400 + _UNIX_JD
+
+
+def _from_jd(jd):
+    return datetime.fromtimestamp((jd - _UNIX_JD) * 86400, tz=timezone.utc)
+
+
+def _elongation(i, jd, ev):
+    """Sun-moon elongation in degrees (0 new, 180 full) between ev[i] and ev[i + 1]."""
+    frac = (jd - ev[i]) / (ev[i + 1] - ev[i])
+    return (180.0 * (i % 2) + 180.0 * frac) % 360.0
+
+
+def phase_name(elongation):
+    return PHASES[int(((elongation + 22.5) % 360) // 45)]
+
+
+def moon_at(when=None):
+    """Phase, illumination, age and next new/full moon for an aware datetime (default: now)."""
+    when = when or datetime.now(timezone.utc)
+    ev, jd = _events(), _jd(when)
+    i = bisect.bisect_right(ev, jd) - 1
+    if i < 0 or i + 1 >= len(ev):
+        raise ValueError(f"{when:%Y-%m-%d} is outside MOON_TABLE_YEARS {MOON_TABLE_YEARS}")
+    elong = _elongation(i, jd, ev)
+    last_new = ev[i - (i % 2)]
+    name = phase_name(elong)
+    return {
+        "phase": name,
+        "illumination": round((1 - math.cos(math.radians(elong))) / 2, 4),
+        "age_days": round(jd - last_new, 2),
+        "elongation": round(elong, 2),
+        "next_new_moon": _from_jd(ev[i + 2 - (i % 2)]),
+        "next_full_moon": _from_jd(ev[i + 1 + (i % 2)]),
+        "ritual": RITUALS[name],
+    }
+
+
+def moon_on(day):
+    """moon_at() for noon UTC of a calendar date."""
+    return moon_at(datetime.combine(day, dtime(12), tzinfo=timezone.utc))
+
+
+def calendar(start, days):
+    """Vectorized phases for `days` consecutive dates from `start` (noon UTC each).
+
+    Returns numpy arrays: dates (datetime64[D]), elongation, illumination,
+    phase index into PHASES. One searchsorted over the event table, so a
+    multi-month calendar costs about the same as a single day.
+    """
+    import numpy as np  # only calendar views need it
+
+    ev = np.asarray(_events())
+    dates = np.datetime64(start, "D") + np.arange(days)
+    jd = (dates - np.datetime64("1970-01-01", "D")).astype(np.float64) + 0.5 + _UNIX_JD
+    i = np.searchsorted(ev, jd, side="right") - 1
+    if len(i) and (i[0] < 0 or i[-1] + 1 >= len(ev)):
+        raise ValueError(f"calendar range is outside MOON_TABLE_YEARS {MOON_TABLE_YEARS}")
+    frac = (jd - ev[i]) / (ev[i + 1] - ev[i])
+    elong = (180.0 * (i % 2) + 180.0 * frac) % 360.0
+    illum = (1 - np.cos(np.radians(elong))) / 2
+    phase = (((elong + 22.5) % 360) // 45).astype(np.int8)
+    return {"dates": dates, "elongation": elong, "illumination": illum, "phase": phase}
+
+
+def events_between(start, end):
+    """[(kind, utc datetime)] for new and full moons in [start, end) dates."""
+    ev = _events()
+    lo, hi = _jd(datetime.combine(start, dtime(), tzinfo=timezone.utc)), \
+        _jd(datetime.combine(end, dtime(), tzinfo=timezone.utc))
+    i = bisect.bisect_left(ev, lo)
+    out = []
+    while i < len(ev) and ev[i] < hi:
+        out.append(("full" if i % 2 else "new", _from_jd(ev[i])))
+        i += 1
+    return out
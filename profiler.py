@@ -0,0 +1,147 @@
+import cProfile, hmac, io, os, pstats, sys, threading, time
+from collections import Counter
+
+# ---- Live profiling (admin only) ----
+# Nothing here is installed unless PROFILE_TOKEN is set. With it, requests
+# carrying `Authorization: Bearer $PROFILE_TOKEN` can use:
+#
+#   GET /debug/profile?seconds=10&hz=100    sample every thread of the worker
+#       that serves the request (sys._current_frames() on a timer) and return
+#       collapsed stacks ("frame;frame;frame count" lines) for flamegraph.pl,
+#       speedscope or inferno; ?format=json adds the hottest leaf frames.
+#       X-Profile-Pid says which worker answered; repeat to reach the others.
+#   X-Profile: 1 on any request    run that request under cProfile and
+#       replace the body with the pstats report (the .prof file is kept in
+#       PROFILE_DIR for snakeviz).
+#
+# The sampler only runs while a /debug/profile request is open, one session
+# per worker at a time, capped at PROFILE_MAX_SECONDS.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "var/profiles")
+
+# Leaf frames of threads parked waiting for work; dropped unless ?idle=1
+_IDLE = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("selectors.py", "select"),
+         ("queue.py", "get"), ("socket.py", "accept"), ("thread.py", "_worker")}
+
+
+def _frame_label(code, lineno):
+    mod = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{mod}:{code.co_name}:{lineno}"
+
+
+def _idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE
+
+
+class Sampler:
+    """Collapsed-stack sampler over all threads of this process."""
+
+    def __init__(self):
+        self._busy = threading.Lock()
+
+    def run(self, seconds, hz=100, idle=False):
+        """Sample for `seconds` from the calling thread; returns (Counter, samples, overhead_s)."""
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("a profile is already running in this worker")
+        try:
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks, samples, spent = Counter(), 0, 0.0
+            interval = 1.0 / hz
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                t0 = time.perf_counter()
+                for tid, frame in sys._current_frames().items():
+                    if tid == me or (not idle and _idle(frame)):
+                        continue
+                    parts = []
+                    while frame is not None:
+                        parts.append(_frame_label(frame.f_code, frame.f_lineno))
+                        frame = frame.f_back
+                    parts.append(names.get(tid) or f"thread-{tid}")
+                    stacks[";".join(reversed(parts))] += 1
+                samples += 1
+                took = time.perf_counter() - t0
+                spent += took
+                time.sleep(max(0.0, interval - took))
+            return stacks, samples, spent
+        finally:
+            self._busy.release()
+
+
+def collapsed(stacks):
+    return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+
+def hottest(stacks, k=20):
+    leaves = Counter()
+    for stack, n in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += n
+    return leaves.most_common(k)
+
+
+def _authorized(request, token):
+    auth = request.headers.get("Authorization", "")
+    return auth.startswith("Bearer ") and hmac.compare_digest(auth[7:].encode(), token.encode())
+
+
+def init_app(app, token=PROFILE_TOKEN):
+    """Register /debug/profile and the X-Profile hook when `token` is set; otherwise do nothing."""
+    if not token:
+        return None
+    from flask import Response, g, jsonify, request
+
+    sampler = Sampler()
+
+    def profile():
+        if not _authorized(request, token):
+            return jsonify({"ok": False, "error": "forbidden"}), 403
+        try:
+            seconds = min(float(request.args.get("seconds", 10)), PROFILE_MAX_SECONDS)
+            hz = max(1, min(int(request.args.get("hz", 100)), 1000))
+        except ValueError:
+            return jsonify({"ok": False, "error": "bad_args"}), 400
+        try:
+            stacks, samples, spent = sampler.run(seconds, hz, idle=request.args.get("idle") == "1")
+        except RuntimeError as e:
+            return jsonify({"ok": False, "error": str(e)}), 409
+        headers = {"X-Profile-Pid": str(os.getpid()), "X-Profile-Samples": str(samples),
+                   "X-Profile-Overhead": f"{spent / max(seconds, 1e-9):.4f}", "Cache-Control": "no-store"}
+        if request.args.get("format") == "json":
+            return jsonify({"ok": True, "pid": os.getpid(), "seconds": seconds, "hz": hz, "samples": samples,
+                            "sampler_seconds": round(spent, 4), "hottest": hottest(stacks),
+                            "stacks": dict(stacks.most_common())}), 200, headers
+        return Response(collapsed(stacks), mimetype="text/plain", headers=headers)
+
+    app.add_url_rule("/debug/profile", "debug_profile", profile)
+
+    @app.before_request
+    def _cprofile_start():
+        if request.headers.get("X-Profile") != "1" or not _authorized(request, token):
+            return
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            return  # another profiler owns this thread
+        g.cprofile = prof
+
+    @app.after_request
+    def _cprofile_finish(resp):
+        prof = g.pop("cprofile", None)
+        if prof is None:
+            return resp
+        prof.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"req-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-"
+                                         f"{request.endpoint or 'none'}.prof")
+        prof.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(50)
+        report = Response(out.getvalue(), mimetype="text/plain")
+        report.headers.update({"X-Profile-File": path, "X-Profile-Status": str(resp.status_code),
+                               "Cache-Control": "no-store"})
+        return report
+
+    return sampler
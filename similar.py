@@ -0,0 +1,324 @@
+import fcntl, json, math, os, re, shutil, threading, time, zlib
+import numpy as np
+
+# ---- Near-duplicate question index ----
+# Questions become hashed word/bigram/char-trigram TF-IDF vectors (no
+# embedding service). Vectors live in a memory-mapped float32 matrix under
+# SIMILAR_DIR, shared by every worker on the host:
+#
+#   meta.json           {"dir", "dim", "count", "capacity", "built", ...}
+#   <dir>/vectors.f32   capacity x dim, L2-normalized rows
+#   <dir>/ids.S36       question id per row
+#   <dir>/users.S36     asker's user id per row (search(user_id=...) filters on it)
+#   <dir>/idf.npy       per-bucket IDF frozen at the last rebuild
+#   <dir>/centroids.npy, offsets.npy   coarse lists for rows [0, built)
+#
+# `flask similar-rebuild` re-vectorizes every question, clusters the rows
+# (spherical k-means) and stores them grouped by cluster, so a lookup scores
+# only the SIMILAR_NPROBE closest clusters plus the "tail" of rows appended
+# since the rebuild. Appends from ask() go to the tail under a file lock.
+# A lookup for one user keeps only that user's rows before ranking, so other
+# users' paraphrases never crowd the asker's own questions out of the top k.
+SIMILAR_DIR = os.getenv("SIMILAR_DIR", "var/similar")
+SIMILAR_DIM = int(os.getenv("SIMILAR_DIM", "256"))
+SIMILAR_NPROBE = int(os.getenv("SIMILAR_NPROBE", "8"))
+
+ID_DTYPE = "S36"
+_WORD = re.compile(r"[a-z0-9]+")
+# Down-weighted until a rebuild learns real IDF from the questions table
+_STOP = frozenset("a an the is are am was i to of and or in on at for my me it be do does did will "
+                  "would what when how should can could with this that there about".split())
+
+
+# Who the question is about matters more than most words ("will he" vs "will she")
+_PERSON = frozenset("he him his she her they them ex".split())
+_SUFFIXES = ("ing", "ed", "es", "s", "e")
+
+
+def _stem(w):
+    for suf in _SUFFIXES:
+        if w.endswith(suf) and len(w) - len(suf) >= 3:
+            return w[:-len(suf)]
+    return w
+
+
+def features(text):
+    """Weighted sparse features: stemmed words, word bigrams and in-word char trigrams."""
+    words = [w if w in _STOP else _stem(w) for w in _WORD.findall(text.lower())]
+    feats = {}
+
+    def add(f, w):
+        feats[f] = feats.get(f, 0.0) + w
+
+    for w in words:
+        add("w:" + w, 0.25 if w in _STOP else 1.5 if w in _PERSON else 1.0)
+        if w not in _STOP:
+            p = f"<{w}>"
+            for i in range(len(p) - 2):
+                add("c:" + p[i:i + 3], 0.3)
+    for a, b in zip(words, words[1:]):
+        add(f"b:{a} {b}", 0.25 if a in _STOP and b in _STOP else 0.6)
+    return feats
+
+
+def _hash(feats, dim):
+    buckets, values = [], []
+    for f, w in feats.items():
+        h = zlib.crc32(f.encode())
+        buckets.append(h % dim)
+        values.append((1.0 + math.log(w) if w > 1 else w) * (1 if h >> 31 else -1))
+    return buckets, values
+
+
+def vectorize(text, dim, idf=None):
+    v = np.zeros(dim, dtype=np.float32)
+    b, vals = _hash(features(text), dim)
+    np.add.at(v, b, vals)
+    if idf is not None:
+        v *= idf
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+
+def _lock(root):
+    os.makedirs(root, exist_ok=True)
+    f = open(os.path.join(root, "lock"), "a+")
+    fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+
+def _write_meta(root, meta):
+    tmp = os.path.join(root, f"meta.json.{os.getpid()}")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(root, "meta.json"))
+
+
+def _grow(path, nbytes):
+    with open(path, "ab") as f:
+        f.truncate(nbytes)
+
+
+class QuestionIndex:
+    """Reader/appender over SIMILAR_DIR; remaps lazily when another process appends or rebuilds."""
+
+    def __init__(self, root=SIMILAR_DIR, dim=SIMILAR_DIM, nprobe=SIMILAR_NPROBE):
+        self.root = root
+        self.dim = dim
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._view = None
+
+    # -- reading --
+    def _refresh(self):
+        path = os.path.join(self.root, "meta.json")
+        try:
+            stamp = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if stamp == self._stamp:
+            return self._view
+        with self._lock:
+            if stamp == self._stamp:
+                return self._view
+            with open(path) as f:
+                meta = json.load(f)
+            d = os.path.join(self.root, meta["dir"])
+            n, dim = meta["count"], meta["dim"]
+            view = {"meta": meta, "idf": np.load(os.path.join(d, "idf.npy"))}
+            view["vecs"] = np.memmap(os.path.join(d, "vectors.f32"), np.float32, "r", shape=(n, dim)) if n else None
+            view["ids"] = np.memmap(os.path.join(d, "ids.S36"), ID_DTYPE, "r", shape=(n,)) if n else None
+            users = os.path.join(d, "users.S36")  # absent in versions built before it existed
+            view["users"] = np.memmap(users, ID_DTYPE, "r", shape=(n,)) if n and os.path.exists(users) else None
+            if meta["built"]:
+                view["centroids"] = np.load(os.path.join(d, "centroids.npy"))
+                view["offsets"] = np.load(os.path.join(d, "offsets.npy"))
+            self._view, self._stamp = view, stamp
+            return view
+
+    def search(self, text, k=5, user_id=None):
+        """Top-k [(question_id, cosine)] for `text`, best first; only `user_id`'s questions when given."""
+        view = self._refresh()
+        if view is None or view["vecs"] is None:
+            return []
+        meta = view["meta"]
+        q = vectorize(text, meta["dim"], view["idf"])
+        vecs, built = view["vecs"], meta["built"]
+        spans = [(built, meta["count"])]  # tail: appended since the last rebuild
+        if built:
+            off = view["offsets"]
+            spans += [(off[c], off[c + 1]) for c in np.argsort(view["centroids"] @ q)[::-1][:self.nprobe]]
+        spans = [(lo, hi) for lo, hi in spans if hi > lo]
+        if not spans:
+            return []
+        rows = np.concatenate([np.arange(lo, hi) for lo, hi in spans])
+        if user_id is not None and view["users"] is not None:
+            rows = rows[view["users"][rows] == user_id.encode()[:36]]
+            if not len(rows):
+                return []
+            scores = vecs[rows] @ q
+        else:
+            scores = np.concatenate([vecs[lo:hi] @ q for lo, hi in spans])
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(view["ids"][rows[i]].decode(), float(scores[i])) for i in top]
+
+    # -- appending --
+    def add(self, qid, text, user_id=None):
+        lk = _lock(self.root)
+        try:
+            path = os.path.join(self.root, "meta.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    meta = json.load(f)
+            else:
+                meta = _new_version(self.root, self.dim, 0, np.ones(self.dim, np.float32))
+            d = os.path.join(self.root, meta["dir"])
+            idf = np.load(os.path.join(d, "idf.npy"))
+            v = vectorize(text, meta["dim"], idf)
+            n = meta["count"]
+            if n >= meta["capacity"]:
+                meta["capacity"] = max(1024, meta["capacity"] * 2)
+                _grow(os.path.join(d, "vectors.f32"), meta["capacity"] * meta["dim"] * 4)
+                _grow(os.path.join(d, "ids.S36"), meta["capacity"] * 36)
+            _grow(os.path.join(d, "users.S36"), meta["capacity"] * 36)  # no-op once sized; creates it on old versions
+            with open(os.path.join(d, "vectors.f32"), "r+b") as f:
+                f.seek(n * meta["dim"] * 4)
+                f.write(v.astype(np.float32).tobytes())
+            with open(os.path.join(d, "ids.S36"), "r+b") as f:
+                f.seek(n * 36)
+                f.write(qid.encode()[:36].ljust(36, b"\0"))
+            with open(os.path.join(d, "users.S36"), "r+b") as f:
+                f.seek(n * 36)
+                f.write((user_id or "").encode()[:36].ljust(36, b"\0"))
+            meta["count"] = n + 1
+            _write_meta(self.root, meta)
+        finally:
+            lk.close()
+
+
+def _new_version(root, dim, capacity, idf):
+    name = f"v{time.time_ns()}"
+    d = os.path.join(root, name)
+    os.makedirs(d)
+    capacity = max(1024, capacity)
+    _grow(os.path.join(d, "vectors.f32"), capacity * dim * 4)
+    _grow(os.path.join(d, "ids.S36"), capacity * 36)
+    _grow(os.path.join(d, "users.S36"), capacity * 36)
+    np.save(os.path.join(d, "idf.npy"), idf.astype(np.float32))
+    meta = {"dir": name, "dim": dim, "count": 0, "capacity": capacity, "built": 0}
+    _write_meta(root, meta)
+    return meta
+
+
+# ---- Rebuild ----
+def _kmeans(x, k, iters=8, seed=0):
+    rng = np.random.default_rng(seed)
+    c = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(x, c)
+        order = np.argsort(assign, kind="stable")
+        starts = np.searchsorted(assign[order], np.arange(k))
+        sums = np.add.reduceat(x[order], np.minimum(starts, len(x) - 1), axis=0)
+        filled = np.bincount(assign, minlength=k) > 0  # empty clusters keep their old centroid
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        c[filled] = sums[filled] / np.maximum(norms[filled], 1e-12)
+    return c
+
+
+def _assign(x, c, chunk=65536):
+    out = np.empty(len(x), dtype=np.int32)
+    for i in range(0, len(x), chunk):
+        out[i:i + chunk] = np.argmax(x[i:i + chunk] @ c.T, axis=1)
+    return out
+
+
+def rebuild(rows, root=SIMILAR_DIR, dim=SIMILAR_DIM, nlist=None, log=print):
+    """Re-index every question and swap meta.json to the new version.
+
+    `rows()` must yield (question_id, user_id, body) and is called twice (IDF pass,
+    vector pass). Rows appended to the old version meanwhile are carried into
+    the new tail, re-weighted to the new IDF, before the swap.
+    """
+    t0 = time.time()
+    os.makedirs(root, exist_ok=True)
+    df, n = np.zeros(dim, dtype=np.int64), 0
+    for _, _, body in rows():
+        b, _ = _hash(features(body or ""), dim)
+        df[np.unique(b)] += 1
+        n += 1
+    idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+
+    name = f"v{time.time_ns()}"
+    d = os.path.join(root, name)
+    os.makedirs(d)
+    raw = np.memmap(os.path.join(d, "raw.f32"), np.float32, "w+", shape=(max(n, 1), dim))
+    ids = np.zeros(max(n, 1), dtype=ID_DTYPE)
+    owners = np.zeros(max(n, 1), dtype=ID_DTYPE)
+    for i, (qid, uid, body) in enumerate(rows()):
+        if i >= n:
+            break
+        raw[i] = vectorize(body or "", dim, idf)
+        ids[i] = qid.encode()
+        owners[i] = (uid or "").encode()
+
+    nlist = nlist or (max(1, min(4096, int(4 * math.sqrt(n)))) if n >= 1000 else 0)
+    if nlist:
+        sample = raw[np.random.default_rng(0).choice(n, min(n, 64 * nlist), replace=False)]
+        centroids = _kmeans(np.asarray(sample), nlist)
+        assign = _assign(raw[:n], centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+        np.save(os.path.join(d, "centroids.npy"), centroids)
+        np.save(os.path.join(d, "offsets.npy"), offsets)
+    else:
+        order = np.arange(n)
+
+    capacity = max(1024, int(n * 1.25))
+    vecs = np.memmap(os.path.join(d, "vectors.f32"), np.float32, "w+", shape=(capacity, dim))
+    for i in range(0, n, 65536):
+        j = min(i + 65536, n)
+        vecs[i:j] = raw[order[i:j]]
+    idm = np.memmap(os.path.join(d, "ids.S36"), ID_DTYPE, "w+", shape=(capacity,))
+    idm[:n] = ids[order]
+    um = np.memmap(os.path.join(d, "users.S36"), ID_DTYPE, "w+", shape=(capacity,))
+    um[:n] = owners[order]
+    del raw
+    os.remove(os.path.join(d, "raw.f32"))
+    np.save(os.path.join(d, "idf.npy"), idf)
+    meta = {"dir": name, "dim": dim, "count": n, "capacity": capacity, "built": n if nlist else 0,
+            "nlist": nlist}
+
+    lk = _lock(root)
+    try:
+        path = os.path.join(root, "meta.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                old = json.load(f)
+            od = os.path.join(root, old["dir"])
+            if old["count"] and old["dim"] == dim:
+                old_ids = np.memmap(os.path.join(od, "ids.S36"), ID_DTYPE, "r", shape=(old["count"],))
+                missed = np.flatnonzero(~np.isin(old_ids, ids[:n]))[:capacity - n]
+                if len(missed):
+                    old_vecs = np.memmap(os.path.join(od, "vectors.f32"), np.float32, "r",
+                                         shape=(old["count"], dim))
+                    carry = old_vecs[missed] * (idf / np.load(os.path.join(od, "idf.npy")))
+                    carry /= np.maximum(np.linalg.norm(carry, axis=1, keepdims=True), 1e-12)
+                    vecs[n:n + len(missed)] = carry
+                    idm[n:n + len(missed)] = old_ids[missed]
+                    old_users = os.path.join(od, "users.S36")
+                    if os.path.exists(old_users):
+                        um[n:n + len(missed)] = np.memmap(old_users, ID_DTYPE, "r", shape=(old["count"],))[missed]
+                    meta["count"] += len(missed)
+        vecs.flush()
+        idm.flush()
+        um.flush()
+        _write_meta(root, meta)
+    finally:
+        lk.close()
+    for entry in os.listdir(root):
+        if entry.startswith("v") and entry != name:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)  # open maps survive unlink
+    log(f"similar index: {meta['count']} questions, {nlist} lists, dim {dim} in {time.time() - t0:.1f}s")
+    return meta
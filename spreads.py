@@ -0,0 +1,186 @@
+import hashlib, os, re, threading, time
+from functools import lru_cache
+
+from library import DECKS, SPREADS
+
+# ---- Spread images ----
+# One composited image per (kind, spread, cards+orientation, format): drawn
+# cards side by side, reversed cards rotated, position labels underneath.
+# The URL spells out the whole spread (/spread/tarot/three/the-fool:r,death,
+# the-star.webp), so the image is a pure function of its URL: it is rendered
+# once, kept in SPREAD_CACHE_DIR under a content hash and served as
+# immutable. The directory is trimmed oldest-used-first when it grows past
+# SPREAD_CACHE_MB (hits refresh the file's mtime). Pillow loads on first render.
+SPREAD_CACHE_DIR = os.getenv("SPREAD_CACHE_DIR", "var/spreads")
+SPREAD_CACHE_MB = float(os.getenv("SPREAD_CACHE_MB", "256"))
+SPREAD_CARD_HEIGHT = int(os.getenv("SPREAD_CARD_HEIGHT", "420"))
+RENDER_VERSION = 1  # bump when the layout changes; old files age out of the cache
+
+STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+FORMATS = {"webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+           "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True})}
+
+# static/tarot/NN.jpg follow the deck order except Justice (08) and Strength (11)
+_TAROT = [c for c, _, _ in DECKS["tarot"]]
+_TAROT[8], _TAROT[11] = _TAROT[11], _TAROT[8]
+# static/runes/Runy-images-N.jpg are in the artist's order (25 is the card back)
+_RUNES = ["Fehu", "Uruz", "Thurisaz", "Raidho", "Kenaz", "Ansuz", "Hagalaz", "Wunjo", "Gebo", "Isa", "Jera",
+          "Nauthiz", "Mannaz", "Perthro", "Eihwaz", "Tiwaz", "Berkano", "Sowilo", "Algiz", "Laguz", "Ehwaz",
+          "Othala", "Dagaz", "Ingwaz"]
+CARD_FILES = {
+    "tarot": {n: f"tarot/{i:02d}.jpg" for i, n in enumerate(_TAROT)},
+    "rune": {n: f"runes/Runy-images-{i}.jpg" for i, n in enumerate(_RUNES)},
+}
+BACKGROUND = (246, 241, 250)
+INK = (90, 70, 110)
+
+
+def slug(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+_BY_SLUG = {kind: {slug(n): n for n in files} for kind, files in CARD_FILES.items()}
+
+
+def card_file(kind, name):
+    """Path under static/ for a card's artwork, or None."""
+    canon = _BY_SLUG.get(kind, {}).get(slug(name or ""))
+    return CARD_FILES[kind][canon] if canon else None
+
+
+def spec(cards):
+    """[(name, orientation)] -> URL segment: 'the-fool:r,death'."""
+    return ",".join(slug(n) + (":r" if o == "reversed" else "") for n, o in cards)
+
+
+def parse(kind, spread, segment):
+    """URL segment -> [(name, orientation)]; ValueError if it doesn't fit the spread."""
+    if kind not in CARD_FILES or spread not in SPREADS:
+        raise ValueError("unknown kind or spread")
+    cards = []
+    for part in segment.split(","):
+        s, _, flag = part.partition(":")
+        name = _BY_SLUG[kind].get(s)
+        if name is None or flag not in ("", "r"):
+            raise ValueError(f"unknown card {part!r}")
+        cards.append((name, "reversed" if flag else "upright"))
+    if len(cards) != len(SPREADS[spread]) or len({n for n, _ in cards}) != len(cards):
+        raise ValueError("cards don't match the spread")
+    return cards
+
+
+def cache_key(kind, spread, cards, fmt, height=SPREAD_CARD_HEIGHT):
+    raw = f"{RENDER_VERSION}|{kind}|{spread}|{spec(cards)}|{fmt}|{height}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+@lru_cache(maxsize=48)
+def _card(kind, name, height):
+    """Decoded, scaled card art (JPEG draft mode decodes at 1/2..1/8 scale directly)."""
+    from PIL import Image
+    im = Image.open(os.path.join(STATIC, CARD_FILES[kind][name]))
+    w, h = im.size
+    width = round(w * height / h)
+    im.draft("RGB", (width, height))
+    return im.convert("RGB").resize((width, height), Image.LANCZOS)
+
+
+def render(kind, spread, cards, fmt="webp", height=SPREAD_CARD_HEIGHT):
+    """Composite the spread and return encoded image bytes."""
+    import io
+    from PIL import Image, ImageDraw, ImageFont
+
+    arts = [_card(kind, n, height) for n, _ in cards]
+    arts = [a.rotate(180) if o == "reversed" else a for a, (_, o) in zip(arts, cards)]
+    pad, gap = height // 16, height // 18
+    labels = len(cards) > 1
+    label_h = height // 9 if labels else 0
+    width = sum(a.width for a in arts) + gap * (len(arts) - 1) + 2 * pad
+    canvas = Image.new("RGB", (width, height + 2 * pad + label_h), BACKGROUND)
+    draw = ImageDraw.Draw(canvas)
+    try:
+        font = ImageFont.load_default(size=max(12, label_h // 2))
+    except TypeError:  # Pillow < 10.1: fixed-size bitmap font
+        font = ImageFont.load_default()
+    x = pad
+    for art, position, (_, orientation) in zip(arts, SPREADS[spread], cards):
+        canvas.paste(art, (x, pad))
+        if labels:
+            text = position.title() + (" (reversed)" if orientation == "reversed" else "")
+            tw = draw.textlength(text, font=font)
+            draw.text((x + (art.width - tw) / 2, pad + height + label_h // 4), text, fill=INK, font=font)
+        x += art.width + gap
+    pil_format, _, opts = FORMATS[fmt]
+    buf = io.BytesIO()
+    canvas.save(buf, pil_format, **opts)
+    return buf.getvalue()
+
+
+class SpreadCache:
+    """Content-addressed files under `root`, trimmed least-recently-used first past `max_mb`."""
+
+    SCAN_EVERY = 64  # writes between directory scans
+
+    def __init__(self, root=SPREAD_CACHE_DIR, max_mb=SPREAD_CACHE_MB):
+        self.root, self.max_bytes = root, int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._writes = self.SCAN_EVERY  # scan on the first write
+        self.hits = self.misses = self.evicted = 0
+
+    def path(self, key, fmt):
+        return os.path.join(self.root, key[:2], f"{key}.{fmt}")
+
+    def get_or_render(self, kind, spread, cards, fmt):
+        """Path of the cached image, rendering it first on a miss."""
+        key = cache_key(kind, spread, cards, fmt)
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)  # hit: mark as recently used
+            self.hits += 1
+            return key, path
+        except FileNotFoundError:
+            pass
+        self.misses += 1
+        data = render(kind, spread, cards, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # readers never see a partial file
+        with self._lock:
+            self._writes += 1
+            scan = self._writes >= self.SCAN_EVERY
+            if scan:
+                self._writes = 0
+        if scan:
+            self.evict()
+        return key, path
+
+    def evict(self):
+        files, total = [], 0
+        for dirpath, _, names in os.walk(self.root):
+            for n in names:
+                p = os.path.join(dirpath, n)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                if n.endswith(".tmp") and st.st_mtime < time.time() - 3600:
+                    os.remove(p)  # left behind by a crashed render
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, p in sorted(files):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(p)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self.evicted += removed
+        return removed
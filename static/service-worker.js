@@ -1,3 +1,152 @@
-self.addEventListener("install", e => self.skipWaiting());
-self.addEventListener("activate", e => clients.claim());
-self.addEventListener("fetch", () => {});
+// Miss Amara offline support.
+// - Only the public shell is cached: /static/ files (cache-first) and
+//   offline.html, served for any page navigation that fails. Signed-in pages
+//   are never cached, so nobody else on the device can see them offline.
+// - Card logs (/tracker/add) and journal entries (/journal) posted while
+//   offline are queued in IndexedDB with a client id, then sent to /sync in
+//   one batch (Background Sync where available, otherwise on the next
+//   successful request or a {type: "flush"} message). The server dedupes by
+//   client id, so resending a batch after a lost response is safe.
+// - The queue and sync cursor belong to the signed-in user: /logout sends
+//   what it can first, then both are cleared; /signup (a new session) clears them.
+const SHELL = "amara-shell-v2";  // activate deletes older caches (v1 held signed-in pages)
+const OFFLINE = "/static/offline.html";
+const SYNC_TAG = "amara-sync";
+const QUEUED = {"/tracker/add": "card", "/journal": "journal"};
+
+self.addEventListener("install", e => {
+  e.waitUntil(caches.open(SHELL).then(c => c.addAll(["/static/manifest.json", "/static/style.css", OFFLINE])).then(() => self.skipWaiting()));
+});
+self.addEventListener("activate", e => {
+  e.waitUntil(caches.keys()
+    .then(keys => Promise.all(keys.filter(k => k !== SHELL).map(k => caches.delete(k))))
+    .then(() => clients.claim()));
+});
+
+// ---- IndexedDB: "ops" (queued writes) and "meta" (sync cursor) ----
+function db() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open("amara-sync", 1);
+    req.onupgradeneeded = () => {
+      req.result.createObjectStore("ops", {keyPath: "client_id"});
+      req.result.createObjectStore("meta");
+    };
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+async function tx(store, mode, fn) {
+  const d = await db();
+  return new Promise((resolve, reject) => {
+    const t = d.transaction(store, mode);
+    const out = fn(t.objectStore(store));
+    t.oncomplete = () => resolve(out && "result" in out ? out.result : undefined);
+    t.onerror = () => reject(t.error);
+  });
+}
+
+async function enqueue(path, form) {
+  const op = {client_id: crypto.randomUUID(), type: QUEUED[path], at: new Date().toISOString()};
+  if (op.type === "card") {
+    op.card_name = form.get("card_name");
+    op.notes = form.get("notes");
+  } else {
+    const now = new Date();
+    op.entry_date = new Date(now - now.getTimezoneOffset() * 60000).toISOString().slice(0, 10);
+  }
+  await tx("ops", "readwrite", s => s.put(op));
+  if (self.registration.sync) {
+    try { await self.registration.sync.register(SYNC_TAG); } catch (_) { /* flushed on the next request */ }
+  }
+}
+
+let flushing = null;
+function flush() {
+  flushing = flushing || doFlush().finally(() => { flushing = null; });
+  return flushing;
+}
+
+async function doFlush() {
+  const ops = await tx("ops", "readonly", s => s.getAll());
+  const cursor = await tx("meta", "readonly", s => s.get("cursor"));
+  if (!ops.length && cursor) return;
+  const resp = await fetch("/sync", {
+    method: "POST", credentials: "same-origin",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({cursor: cursor || null, ops: ops.slice(0, 200)}),
+  });
+  if (!resp.ok) throw new Error("sync failed: " + resp.status);
+  const body = await resp.json();
+  // applied, duplicate and rejected ops are all settled; only unsent ones stay queued
+  const settled = body.results.map(r => r.client_id).filter(Boolean);
+  await tx("ops", "readwrite", s => settled.forEach(id => s.delete(id)));
+  await tx("meta", "readwrite", s => s.put(body.cursor, "cursor"));
+  const all = await clients.matchAll({type: "window"});
+  all.forEach(c => c.postMessage({type: "synced", results: body.results, delta: body.delta}));
+  if (ops.length > 200) return doFlush();
+}
+
+self.addEventListener("sync", e => {
+  if (e.tag === SYNC_TAG) e.waitUntil(flush());
+});
+self.addEventListener("message", e => {
+  if (e.data && e.data.type === "flush") e.waitUntil(flush().catch(() => {}));
+});
+
+// ---- fetch ----
+async function queueablePost(event, path) {
+  const copy = event.request.clone();
+  try {
+    const resp = await fetch(event.request);
+    event.waitUntil(flush().catch(() => {}));
+    return resp;
+  } catch (_) {
+    await enqueue(path, await copy.formData());
+    const back = path === "/tracker/add" ? "/tracker" : "/journal";
+    return Response.redirect(back + "?queued=1", 303);
+  }
+}
+
+async function forgetUser() {
+  await tx("ops", "readwrite", s => s.clear());
+  await tx("meta", "readwrite", s => s.delete("cursor"));
+}
+
+async function switchUser(event, send) {
+  if (send) await flush().catch(() => {});  // still signed in: last chance to deliver the queue
+  await forgetUser();
+  return fetch(event.request);
+}
+
+async function page(event) {
+  try {
+    return await fetch(event.request);
+  } catch (err) {
+    const hit = await caches.match(OFFLINE);
+    if (hit) return hit;
+    throw err;
+  }
+}
+
+async function asset(event) {
+  const hit = await caches.match(event.request);
+  if (hit) return hit;
+  const resp = await fetch(event.request);
+  if (resp.ok) (await caches.open(SHELL)).put(event.request, resp.clone());
+  return resp;
+}
+
+self.addEventListener("fetch", event => {
+  const url = new URL(event.request.url);
+  if (url.origin !== location.origin) return;
+  if (url.pathname === "/logout" || (url.pathname === "/signup" && event.request.method === "POST")) {
+    event.respondWith(switchUser(event, url.pathname === "/logout"));
+  } else if (event.request.method === "POST" && QUEUED[url.pathname]) {
+    event.respondWith(queueablePost(event, url.pathname));
+  } else if (event.request.mode === "navigate") {
+    event.respondWith(page(event));
+  } else if (event.request.method === "GET" && url.pathname.startsWith("/static/")) {
+    event.respondWith(asset(event));
+  }
+});
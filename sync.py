@@ -0,0 +1,205 @@
+import os, random, uuid
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import bindparam, text
+
+import tracker
+from tracker import as_dt
+
+# ---- Offline batch sync (POST /sync) ----
+# The service worker queues card logs and journal entries made while offline,
+# each with a client-generated id, and posts them in one batch when the
+# network is back:
+#
+#   {"cursor": "<from the last sync>", "ops": [
+#       {"client_id": "…", "type": "card", "card_name": "Death", "notes": "…", "at": "<iso>"},
+#       {"client_id": "…", "type": "journal", "entry_date": "2026-10-19"}]}
+#
+# apply() writes the whole batch in one transaction: a multi-row insert per
+# kind, rollups bumped once per card (tracker.add_cards). sync_ops remembers
+# every applied (user_id, client_id) for SYNC_KEEP_DAYS, so a batch resent
+# after a lost response reports "duplicate" instead of logging twice.
+# delta() returns what changed since the client's cursor, including rows
+# written elsewhere; clients upsert by id, so the small overlap is harmless.
+# Deleted cards leave a sync_ops row (kind 'delete', ref_id = the card id)
+# that delta() reports in "deleted". A delta bigger than a snapshot
+# (FULL_CARDS / FULL_JOURNAL rows) is replaced by the snapshot, full=True.
+SYNC_MAX_OPS = int(os.getenv("SYNC_MAX_OPS", "200"))
+SYNC_KEEP_DAYS = int(os.getenv("SYNC_KEEP_DAYS", "30"))
+SYNC_BACKDATE_DAYS = 30  # oldest client timestamp honoured; older ones are clamped
+OVERLAP = timedelta(seconds=5)  # covers commits that raced the previous cursor
+FULL_CARDS, FULL_JOURNAL = 200, 60  # snapshot size when the cursor is missing or expired
+
+def _client_time(value, now):
+    """Client timestamp clamped to [now - SYNC_BACKDATE_DAYS, now]; now if missing, None if not an ISO string."""
+    if not value:
+        return now
+    if not isinstance(value, str):
+        return None
+    try:
+        ts = as_dt(value)
+    except ValueError:
+        return None
+    return min(max(ts, now - timedelta(days=SYNC_BACKDATE_DAYS)), now)
+
+
+def _client_date(value, today):
+    if value and not isinstance(value, str):
+        return None
+    try:
+        d = date.fromisoformat(value) if value else today
+    except (TypeError, ValueError):
+        return None
+    # the device's zone may differ from the one on file by up to a day
+    if not today - timedelta(days=SYNC_BACKDATE_DAYS) <= d <= today + timedelta(days=1):
+        return None
+    return d
+
+
+def as_date(v):
+    # SQLite hands DATE columns back as strings through text() queries
+    return date.fromisoformat(v) if isinstance(v, str) else v
+
+
+def apply(cx, uid, ops, now=None, today=None, tz=None):
+    """Apply a batch in the caller's transaction (`today`/`tz`: the user's local date and zone).
+
+    Returns ([{client_id, status, id?, error?}] in request order, names of the
+    cards logged). status is applied, duplicate or rejected.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = today or now.date()
+    results, seen = [], set()
+    cards, journal = [], []
+    for op in ops:
+        cid = str(op.get("client_id") or "")[:64] if isinstance(op, dict) else ""
+        res = {"client_id": cid or None}
+        results.append(res)
+        if not cid:
+            res.update(status="rejected", error="missing_client_id")
+        elif cid in seen:
+            res["status"] = "duplicate"
+        elif op.get("type") == "card":
+            card_name, notes = op.get("card_name"), op.get("notes") or ""
+            name = tracker.normalize_card(card_name) if isinstance(card_name, str) else None
+            ts = _client_time(op.get("at"), now)
+            if not name:
+                res.update(status="rejected", error="missing_card_name")
+            elif ts is None:
+                res.update(status="rejected", error="bad_at")
+            elif not isinstance(notes, str):
+                res.update(status="rejected", error="bad_notes")
+            else:
+                cards.append((res, name, notes.strip()[:2000] or None, ts))
+        elif op.get("type") == "journal":
+            d = _client_date(op.get("entry_date"), today)
+            if d is None:
+                res.update(status="rejected", error="bad_entry_date")
+            else:
+                journal.append((res, d))
+        else:
+            res.update(status="rejected", error="bad_type")
+        seen.add(cid)
+
+    pending = [r["client_id"] for r, *_ in cards + journal]
+    if pending:
+        done = {r[0] for r in cx.execute(
+            text("SELECT client_id FROM sync_ops WHERE user_id = :u AND client_id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)), {"u": uid, "ids": pending})}
+        for res, *_ in cards + journal:
+            if res["client_id"] in done:
+                res["status"] = "duplicate"
+        cards = [c for c in cards if "status" not in c[0]]
+        journal = [j for j in journal if "status" not in j[0]]
+
+    logged = []
+    if cards:
+        ids = tracker.add_cards(cx, uid, [(name, notes, ts) for _, name, notes, ts in cards], tz)
+        for (res, name, _, _), ref in zip(cards, ids):
+            res.update(status="applied", id=ref)
+            logged.append(name)
+    if journal:
+        # one entry per user per day (daily_entries_user_date_uq): an existing day counts as applied
+        days = sorted({d for _, d in journal})
+        cx.execute(text("""
+            INSERT INTO daily_entries (id, user_id, entry_date, created_at) VALUES (:id, :u, :d, :now)
+            ON CONFLICT (user_id, entry_date) DO NOTHING
+        """), [{"id": str(uuid.uuid4()), "u": uid, "d": d, "now": now} for d in days])
+        by_day = {as_date(r[1]): r[0] for r in cx.execute(
+            text("SELECT id, entry_date FROM daily_entries WHERE user_id = :u AND entry_date IN :days")
+            .bindparams(bindparam("days", expanding=True)), {"u": uid, "days": days})}
+        for res, d in journal:
+            res.update(status="applied", id=by_day.get(d))
+
+    applied = [r for r in results if r.get("status") == "applied"]
+    if applied:
+        # a concurrent sync of the same ops fails here and rolls back; its retry sees duplicates
+        cx.execute(text("""
+            INSERT INTO sync_ops (user_id, client_id, kind, ref_id, created_at) VALUES (:u, :c, :k, :r, :now)
+        """), [{"u": uid, "c": r["client_id"], "k": k, "r": r["id"], "now": now}
+               for k, group in (("card", cards), ("journal", journal)) for r, *_ in group])
+    if random.random() < 0.01:
+        purge(cx, now)
+    return results, logged
+
+
+def purge(cx, now=None):
+    now = now or datetime.now(timezone.utc)
+    return cx.execute(text("DELETE FROM sync_ops WHERE created_at < :c"),
+                      {"c": now - timedelta(days=SYNC_KEEP_DAYS)}).rowcount
+
+
+def record_delete(cx, uid, card_id, now=None):
+    """Tombstone for a deleted card, so clients that cached it drop it on their next delta."""
+    cx.execute(text("""
+        INSERT INTO sync_ops (user_id, client_id, kind, ref_id, created_at) VALUES (:u, :c, 'delete', :r, :now)
+        ON CONFLICT (user_id, client_id) DO NOTHING
+    """), {"u": uid, "c": f"delete:{card_id}"[:64], "r": card_id, "now": now or datetime.now(timezone.utc)})
+
+
+def cursor(now=None):
+    return (now or datetime.now(timezone.utc)).isoformat()
+
+
+def delta(cx, uid, since, now=None):
+    """Rows the client hasn't seen since `since` (a cursor from an earlier sync).
+
+    A missing, unparseable or expired cursor (older than the sync_ops
+    retention), or one so old the delta would outgrow a snapshot, gets a
+    snapshot of recent rows with full=True instead; "deleted" is then empty
+    because the snapshot replaces what the client holds.
+    """
+    now = now or datetime.now(timezone.utc)
+    try:
+        since = as_dt(since) if since else None
+    except (TypeError, ValueError):
+        since = None
+    full = since is None or since < now - timedelta(days=SYNC_KEEP_DAYS)
+    deleted = []
+    if not full:
+        # created_at is the client's time for synced rows, so also pick up rows synced since
+        p = {"u": uid, "c": since - OVERLAP}
+        cards = cx.execute(text("""
+            SELECT id, card_name, notes, created_at FROM cards WHERE user_id = :u AND (created_at >= :c
+              OR id IN (SELECT ref_id FROM sync_ops WHERE user_id = :u AND kind = 'card' AND created_at >= :c))
+            ORDER BY created_at DESC LIMIT :n
+        """), dict(p, n=FULL_CARDS + 1)).mappings().all()
+        journal = cx.execute(text("""
+            SELECT id, entry_date, created_at FROM daily_entries WHERE user_id = :u AND created_at >= :c
+            ORDER BY entry_date DESC LIMIT :n
+        """), dict(p, n=FULL_JOURNAL + 1)).mappings().all()
+        full = len(cards) > FULL_CARDS or len(journal) > FULL_JOURNAL
+        if not full:
+            deleted = [r[0] for r in cx.execute(text("""
+                SELECT ref_id FROM sync_ops WHERE user_id = :u AND kind = 'delete' AND created_at >= :c
+            """), p)]
+    if full:
+        cards = cx.execute(text("""
+            SELECT id, card_name, notes, created_at FROM cards WHERE user_id = :u
+            ORDER BY created_at DESC LIMIT :n
+        """), {"u": uid, "n": FULL_CARDS}).mappings().all()
+        journal = cx.execute(text("""
+            SELECT id, entry_date, created_at FROM daily_entries WHERE user_id = :u
+            ORDER BY entry_date DESC LIMIT :n
+        """), {"u": uid, "n": FULL_JOURNAL}).mappings().all()
+    return {"full": full, "cards": cards, "journal": journal, "deleted": deleted,
+            "top": tracker.top_cards(cx, uid, 10)}
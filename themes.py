@@ -0,0 +1,86 @@
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+
+# ---- Answer tags ("what themes keep coming up for me") ----
+# ask() writes one answer_tags row per tag next to the answer, so theme
+# summaries are a single aggregate over the (user_id, created_at, tag) index
+# instead of splitting every answers.tags_csv in Python. answers.tags_csv is
+# still written for the existing views; `flask tags-backfill` fills
+# answer_tags for answers stored before this table existed.
+MAX_TAGS = 8
+PERIOD_DAYS = {"week": 7, "month": 30, "year": 365, "all": None}
+
+_INSERT = text("""
+    INSERT INTO answer_tags (answer_id, user_id, tag, created_at) VALUES (:a, :u, :t, :c)
+    ON CONFLICT (answer_id, tag) DO NOTHING
+""")
+
+
+def normalize_tags(tags):
+    """list/CSV -> unique lowercase tags, in order, at most MAX_TAGS."""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    out = []
+    for t in tags or ():
+        t = " ".join(str(t).lower().split()).strip(" .#")[:40]
+        if t and t not in out:
+            out.append(t)
+    return out[:MAX_TAGS]
+
+
+def write_tags(cx, answer_id, user_id, tags, created_at):
+    rows = [{"a": answer_id, "u": user_id, "t": t, "c": created_at} for t in normalize_tags(tags)]
+    if rows:
+        cx.execute(_INSERT, rows)
+
+
+def top_tags(cx, user_id, period="month", k=10, now=None):
+    """[(tag, count)] for the user over the trailing period (PERIOD_DAYS), most frequent first."""
+    days = PERIOD_DAYS[period]
+    params = {"u": user_id, "k": k}
+    where = "user_id = :u"
+    if days:
+        params["since"] = (now or datetime.now(timezone.utc)) - timedelta(days=days)
+        where += " AND created_at >= :since"
+    return [tuple(r) for r in cx.execute(text(f"""
+        SELECT tag, COUNT(*) AS n FROM answer_tags WHERE {where}
+        GROUP BY tag ORDER BY n DESC, tag LIMIT :k
+    """), params)]
+
+
+def tag_timeline(cx, user_id, tag, limit=20):
+    """Most recent answers carrying `tag` for the user (answer_id, created_at)."""
+    return [tuple(r) for r in cx.execute(text("""
+        SELECT answer_id, created_at FROM answer_tags
+        WHERE user_id = :u AND tag = :t ORDER BY created_at DESC LIMIT :n
+    """), {"u": user_id, "t": tag, "n": limit})]
+
+
+def backfill(engine, chunk=2000, after="", pause=0.0, log=print):
+    """Stream answers with tags_csv in id order, `chunk` rows per transaction.
+
+    Idempotent (ON CONFLICT DO NOTHING) and resumable from the last id printed.
+    `pause` seconds between chunks keeps it polite on a live primary.
+    """
+    done, t0 = 0, time.time()
+    while True:
+        with engine.connect() as cx:
+            rows = cx.execute(text("""
+                SELECT a.id, q.user_id, a.tags_csv, a.created_at
+                FROM answers a JOIN questions q ON q.id = a.question_id
+                WHERE a.id > :after AND a.tags_csv IS NOT NULL AND a.tags_csv <> ''
+                ORDER BY a.id LIMIT :n
+            """), {"after": after, "n": chunk}).all()
+        if not rows:
+            break
+        with engine.begin() as cx:
+            for aid, uid, csv, created in rows:
+                write_tags(cx, aid, uid, csv, created)
+        done += len(rows)
+        after = rows[-1][0]
+        log(f"tags backfill: {done} answers (last id {after})")
+        if pause:
+            time.sleep(pause)
+    log(f"tags backfill: done, {done} answers in {time.time() - t0:.1f}s")
+    return done
@@ -0,0 +1,233 @@
+import hmac, json, logging, os, re, threading, time
+from functools import wraps
+from sqlalchemy import event
+
+# ---- Request tracing ----
+# TRACING=1 turns on per-request spans (SQL, AI helpers, templates), the
+# Server-Timing header, one JSON log line per request and latency histograms.
+# With TRACING=0 no hooks are installed at all; /metrics still serves the
+# DB pool gauges.
+#
+# /metrics is registered only when METRICS_TOKEN is set, and answers only
+# scrapes carrying `Authorization: Bearer $METRICS_TOKEN` (Prometheus:
+# `authorization: {credentials: ...}` in the scrape config). The same bearer
+# unlocks /metrics/pool, /metrics/admission and the probe detail on /health.
+TRACING = os.getenv("TRACING", "0") == "1"
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+log = logging.getLogger("amara.requests")
+_local = threading.local()
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, labels, buckets=BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_values, seconds):
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if seconds <= b:
+                    s[0][i] += 1
+            s[1] += seconds
+            s[2] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for values, (counts, total, n) in sorted(series.items()):
+            lbl = ",".join(f'{k}="{_esc(v)}"' for k, v in zip(self.labels, values))
+            for b, c in zip(self.buckets, counts):
+                out.append(f'{self.name}_bucket{{{lbl},le="{b}"}} {c}')
+            out.append(f'{self.name}_bucket{{{lbl},le="+Inf"}} {n}')
+            out.append(f"{self.name}_sum{{{lbl}}} {total:.6f}")
+            out.append(f"{self.name}_count{{{lbl}}} {n}")
+        return out
+
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+HTTP_HIST = Histogram("amara_http_request_duration_seconds", "Request latency by route.",
+                      ("route", "method", "status"))
+SQL_HIST = Histogram("amara_sql_duration_seconds", "Statement latency by normalized SQL.", ("stmt",))
+AI_HIST = Histogram("amara_ai_call_duration_seconds", "AI helper latency.", ("call",))
+
+
+def normalize_sql(statement):
+    """Collapse whitespace and literals so one statement shape maps to one series."""
+    s = re.sub(r"\s+", " ", statement).strip()
+    s = re.sub(r"'[^']*'", "?", s)
+    s = re.sub(r"\b\d+\b", "?", s)
+    return s[:160]
+
+
+# ---- Spans ----
+def _trace():
+    return getattr(_local, "trace", None)
+
+
+def _add_span(kind, name, t0, dur):
+    tr = _trace()
+    if tr is not None:
+        tr["spans"].append((kind, name, round((t0 - tr["t0"]) * 1000, 3), round(dur * 1000, 3)))
+
+
+def traced(name):
+    """Decorator timing an AI helper call; returns `fn` untouched when tracing is off."""
+    def wrap(fn):
+        if not TRACING:
+            return fn
+
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dur = time.perf_counter() - t0
+                AI_HIST.observe((name,), dur)
+                _add_span("ai", name, t0, dur)
+        return inner
+    return wrap
+
+
+def _install_sql_hooks(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("trace_t0")
+        if not stack:
+            return
+        t0 = stack.pop()
+        dur = time.perf_counter() - t0
+        stmt = normalize_sql(statement)
+        SQL_HIST.observe((stmt,), dur)
+        _add_span("db", stmt, t0, dur)
+
+
+def _install_template_hooks(app):
+    from flask import before_render_template, template_rendered
+
+    def _before(sender, template, context, **extra):
+        tr = _trace()
+        if tr is not None:
+            tr["tpl_t0"] = time.perf_counter()
+
+    def _after(sender, template, context, **extra):
+        tr = _trace()
+        if tr is not None and "tpl_t0" in tr:
+            t0 = tr.pop("tpl_t0")
+            _add_span("tpl", template.name or "<string>", t0, time.perf_counter() - t0)
+
+    before_render_template.connect(_before, app, weak=False)
+    template_rendered.connect(_after, app, weak=False)
+
+
+def _server_timing(tr, total_ms):
+    parts = []
+    for kind, desc in (("db", "sql"), ("ai", "ai"), ("tpl", "template")):
+        spans = [s for s in tr["spans"] if s[0] == kind]
+        if spans:
+            parts.append(f'{kind};dur={sum(s[3] for s in spans):.1f};desc="{len(spans)} {desc}"')
+    parts.append(f"app;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def gauges(prefix, values):
+    """Render a flat dict of numbers as Prometheus gauge lines."""
+    out = []
+    for k, v in sorted(values.items()):
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            out.append(f"# TYPE {prefix}_{k} gauge")
+            out.append(f"{prefix}_{k} {v}")
+    return out
+
+
+def _authorized(request, token):
+    auth = request.headers.get("Authorization", "")
+    return auth.startswith("Bearer ") and hmac.compare_digest(auth[7:].encode(), token.encode())
+
+
+def metrics_authorized(request, token=METRICS_TOKEN):
+    """True when `request` carries the METRICS_TOKEN bearer; never when the token is unset.
+
+    The app's other diagnostics (/metrics/pool, /metrics/admission, /health
+    detail) use this too.
+    """
+    return bool(token) and _authorized(request, token)
+
+
+def init_app(app, engines, extra_metrics=None, token=METRICS_TOKEN):
+    """Register /metrics (when `token` is set) and, when TRACING is on, the request/SQL/template hooks.
+
+    `extra_metrics` is an optional callable returning more Prometheus lines
+    (the app passes its pool gauges).
+    """
+    from flask import request
+
+    def metrics():
+        if not _authorized(request, token):
+            return "forbidden\n", 403, {"Content-Type": "text/plain"}
+        lines = []
+        for h in (HTTP_HIST, SQL_HIST, AI_HIST):
+            lines += h.render()
+        if extra_metrics:
+            lines += extra_metrics()
+        return "\n".join(lines) + "\n", 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+    if token:
+        app.add_url_rule("/metrics", "metrics", metrics)
+    if not TRACING:
+        return
+
+    if TRACE_LOG and not log.handlers:
+        h = logging.StreamHandler()
+        h.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(h)
+        log.setLevel(logging.INFO)
+        log.propagate = False
+
+    for engine in engines:
+        _install_sql_hooks(engine)
+    _install_template_hooks(app)
+
+    @app.before_request
+    def _start_trace():
+        _local.trace = {"t0": time.perf_counter(), "spans": []}
+
+    @app.after_request
+    def _finish_trace(resp):
+        tr = _trace()
+        if tr is None:
+            return resp
+        _local.trace = None
+        total = time.perf_counter() - tr["t0"]
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        HTTP_HIST.observe((route, request.method, str(resp.status_code)), total)
+        resp.headers["Server-Timing"] = _server_timing(tr, total * 1000)
+        if TRACE_LOG:
+            log.info(json.dumps({
+                "ts": round(time.time(), 3),
+                "route": route,
+                "method": request.method,
+                "status": resp.status_code,
+                "dur_ms": round(total * 1000, 3),
+                "sql_count": sum(1 for s in tr["spans"] if s[0] == "db"),
+                "spans": tr["spans"],
+            }))
+        return resp
@@ -0,0 +1,237 @@
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+
+import localday
+from library import DECKS
+
+# ---- Card-frequency rollups (Path Mirror tracker) ----
+# Every insert/delete on `cards` goes through add_card()/delete_card(), which
+# adjust the rollups in the same transaction:
+#   card_counts         (user_id, card_name) -> count, last_seen
+#   card_counts_global  (card_name)          -> count, last_seen
+#   card_counts_period  (user_id, period, period_start, card_name) -> count
+#                       user_id GLOBAL ("*") holds the all-users rows
+# so "frequent cards" reads k rows instead of grouping a user's history.
+# Week/month buckets follow the logger's local day (localday.py): each card
+# stores cards.local_day when logged, and the period rows, deletes and
+# repair() all key on it, so a later tz change never moves old cards. The
+# GLOBAL period rows therefore count each card in its logger's local week.
+# Rows without local_day (older rows, raw bulk loads) bucket on the UTC date.
+# repair() recomputes all of them from `cards` (after bulk loads or drift).
+GLOBAL = "*"
+PERIODS = ("week", "month")
+
+# SQLite hands TIMESTAMP columns back as strings through text() queries
+def as_dt(v):
+    if isinstance(v, str):
+        v = datetime.fromisoformat(v)
+    if v is not None and v.tzinfo is None:
+        v = v.replace(tzinfo=timezone.utc)
+    return v
+
+
+# Typed names that match a deck card (any case/spacing) count as that card
+_CANONICAL = {n.lower(): n for deck in DECKS.values() for n, _, _ in deck}
+
+
+def normalize_card(name):
+    name = " ".join((name or "").split())[:80]
+    return _CANONICAL.get(name.lower(), name)
+
+
+def period_starts(day):
+    """Week/month bucket starts for a local date; a timestamp buckets on its UTC date."""
+    d = day if type(day) is date else as_dt(day).date()
+    return {"week": (d - timedelta(days=d.weekday())).isoformat(), "month": d.replace(day=1).isoformat()}
+
+
+_UPSERT_USER = text("""
+    INSERT INTO card_counts (user_id, card_name, count, last_seen) VALUES (:u, :c, :n, :t)
+    ON CONFLICT (user_id, card_name) DO UPDATE SET
+      count = card_counts.count + excluded.count,
+      last_seen = CASE WHEN excluded.last_seen > card_counts.last_seen
+                       THEN excluded.last_seen ELSE card_counts.last_seen END
+""")
+_UPSERT_GLOBAL = text("""
+    INSERT INTO card_counts_global (card_name, count, last_seen) VALUES (:c, :n, :t)
+    ON CONFLICT (card_name) DO UPDATE SET
+      count = card_counts_global.count + excluded.count,
+      last_seen = CASE WHEN excluded.last_seen > card_counts_global.last_seen
+                       THEN excluded.last_seen ELSE card_counts_global.last_seen END
+""")
+_UPSERT_PERIOD = text("""
+    INSERT INTO card_counts_period (user_id, period, period_start, card_name, count) VALUES (:u, :p, :s, :c, :n)
+    ON CONFLICT (user_id, period, period_start, card_name) DO UPDATE SET
+      count = card_counts_period.count + excluded.count
+""")
+
+
+def _bump(cx, uid, card, ts, day, n):
+    cx.execute(_UPSERT_USER, {"u": uid, "c": card, "n": n, "t": ts})
+    cx.execute(_UPSERT_GLOBAL, {"c": card, "n": n, "t": ts})
+    cx.execute(_UPSERT_PERIOD, [{"u": who, "p": p, "s": start, "c": card, "n": n}
+                                for who in (uid, GLOBAL) for p, start in period_starts(day).items()])
+
+
+_INSERT_CARD = text("INSERT INTO cards (id, user_id, card_name, notes, created_at, local_day) "
+                    "VALUES (:id, :u, :c, :n, :t, :d)")
+
+
+def add_card(cx, uid, card_name, notes=None, now=None, tz=None):
+    """Log a card and bump its rollups; returns the new card id. `tz`: the user's zone."""
+    now = now or datetime.now(timezone.utc)
+    day = localday.today(tz, now)
+    card = normalize_card(card_name)
+    cid = str(uuid.uuid4())
+    cx.execute(_INSERT_CARD, {"id": cid, "u": uid, "c": card, "n": notes, "t": now, "d": day})
+    _bump(cx, uid, card, now, day, 1)
+    return cid
+
+
+def add_cards(cx, uid, items, tz=None):
+    """Log many cards at once: [(card_name, notes, ts)] -> new ids.
+
+    One multi-row insert, and each rollup row is bumped once with the
+    combined count instead of once per card.
+    """
+    rows, user, period = [], {}, Counter()
+    for name, notes, ts in items:
+        card = normalize_card(name)
+        day = localday.today(tz, ts)
+        rows.append({"id": str(uuid.uuid4()), "u": uid, "c": card, "n": notes, "t": ts, "d": day})
+        n, last = user.get(card, (0, ts))
+        user[card] = (n + 1, max(last, ts))
+        for p, start in period_starts(day).items():
+            period[(p, start, card)] += 1
+    if not rows:
+        return []
+    cx.execute(_INSERT_CARD, rows)
+    cx.execute(_UPSERT_USER, [{"u": uid, "c": c, "n": n, "t": t} for c, (n, t) in user.items()])
+    cx.execute(_UPSERT_GLOBAL, [{"c": c, "n": n, "t": t} for c, (n, t) in user.items()])
+    cx.execute(_UPSERT_PERIOD, [{"u": who, "p": p, "s": start, "c": c, "n": n}
+                                for who in (uid, GLOBAL) for (p, start, c), n in period.items()])
+    return [r["id"] for r in rows]
+
+
+def delete_card(cx, uid, card_id):
+    """Delete one of the user's cards and decrement its rollups; False if not found."""
+    row = cx.execute(text("SELECT card_name, created_at, local_day FROM cards WHERE id = :id AND user_id = :u"),
+                     {"id": card_id, "u": uid}).first()
+    if row is None:
+        return False
+    card, ts, day = row
+    cx.execute(text("DELETE FROM cards WHERE id = :id"), {"id": card_id})
+    _bump(cx, uid, card, ts, _local_day(day, ts), -1)
+    cx.execute(text("DELETE FROM card_counts WHERE user_id = :u AND card_name = :c AND count <= 0"),
+               {"u": uid, "c": card})
+    cx.execute(text("DELETE FROM card_counts_global WHERE card_name = :c AND count <= 0"), {"c": card})
+    cx.execute(text("DELETE FROM card_counts_period WHERE user_id IN (:u, :g) AND card_name = :c AND count <= 0"),
+               {"u": uid, "g": GLOBAL, "c": card})
+    # last_seen may have been the deleted card; both lookups are index-only
+    cx.execute(text("""
+        UPDATE card_counts SET last_seen = (SELECT MAX(created_at) FROM cards WHERE user_id = :u AND card_name = :c)
+        WHERE user_id = :u AND card_name = :c
+    """), {"u": uid, "c": card})
+    cx.execute(text("""
+        UPDATE card_counts_global SET last_seen = (SELECT MAX(created_at) FROM cards WHERE card_name = :c)
+        WHERE card_name = :c
+    """), {"c": card})
+    return True
+
+
+def _local_day(day, ts):
+    # SQLite hands DATE columns back as strings; rows logged before local_day use the UTC date
+    return date.fromisoformat(day) if isinstance(day, str) else day or as_dt(ts).date()
+
+
+def top_cards(cx, uid, k=10):
+    return [tuple(r) for r in cx.execute(text(
+        "SELECT card_name, count FROM card_counts WHERE user_id = :u ORDER BY count DESC, last_seen DESC LIMIT :k"),
+        {"u": uid, "k": k})]
+
+
+def top_global(cx, k=10):
+    return [tuple(r) for r in cx.execute(text(
+        "SELECT card_name, count FROM card_counts_global ORDER BY count DESC LIMIT :k"), {"k": k})]
+
+
+def top_period(cx, uid, period, start, k=10):
+    """Top cards for one week/month bucket; uid=GLOBAL for all users."""
+    return [tuple(r) for r in cx.execute(text("""
+        SELECT card_name, count FROM card_counts_period
+        WHERE user_id = :u AND period = :p AND period_start = :s
+        ORDER BY count DESC LIMIT :k
+    """), {"u": uid, "p": period, "s": start, "k": k})]
+
+
+# ---- Consistency repair ----
+def _lock_cards(cx):
+    """Hold off add_card/delete_card until the transaction ends, so the counts read stay current."""
+    if cx.dialect.name == "postgresql":
+        cx.exec_driver_sql("LOCK TABLE cards IN SHARE MODE")  # waits for in-flight writers, blocks new ones
+    else:
+        # SQLite: a write statement (even one matching nothing) takes the database write lock now
+        cx.exec_driver_sql("UPDATE card_counts SET count = count WHERE 1 = 0")
+
+
+def _expected(cx, uid=None):
+    users, glob, periods, last_u, last_g = Counter(), Counter(), Counter(), {}, {}
+    sql = "SELECT user_id, card_name, created_at, local_day FROM cards" + (" WHERE user_id = :u" if uid else "")
+    for u, card, ts, day in cx.execute(text(sql).execution_options(yield_per=10000), {"u": uid}):
+        ts = as_dt(ts)
+        users[(u, card)] += 1
+        glob[card] += 1
+        if (u, card) not in last_u or ts > last_u[(u, card)]:
+            last_u[(u, card)] = ts
+        if card not in last_g or ts > last_g[card]:
+            last_g[card] = ts
+        for p, start in period_starts(_local_day(day, ts)).items():
+            periods[(u, p, start, card)] += 1
+            periods[(GLOBAL, p, start, card)] += 1
+    return users, glob, periods, last_u, last_g
+
+
+def repair(engine, uid=None, log=print):
+    """Recompute rollups from `cards` and fix any drift; returns the number of rows corrected.
+
+    With `uid` only that user's rows are checked (global rollups need a full pass).
+    Counts are read and written in one transaction with card writes held off,
+    so a card logged mid-repair can't be overwritten by a stale count.
+    """
+    scope = " WHERE user_id = :u" if uid else ""
+    fixed = 0
+    with engine.begin() as cx:
+        _lock_cards(cx)
+        users, glob, periods, last_u, last_g = _expected(cx, uid)
+        have = {(r[0], r[1]): r[2] for r in cx.execute(
+            text("SELECT user_id, card_name, count FROM card_counts" + scope), {"u": uid})}
+        fixed += _sync(cx, "card_counts", ("user_id", "card_name"), have, users,
+                       lambda key: {"last_seen": last_u[key]})
+        have = {tuple(r[:4]): r[4] for r in cx.execute(text(
+            "SELECT user_id, period, period_start, card_name, count FROM card_counts_period"
+            + (" WHERE user_id = :u" if uid else "")), {"u": uid})}
+        fixed += _sync(cx, "card_counts_period", ("user_id", "period", "period_start", "card_name"), have,
+                       periods if not uid else Counter({k: v for k, v in periods.items() if k[0] == uid}))
+        if not uid:
+            have = {(r[0],): r[1] for r in cx.execute(text("SELECT card_name, count FROM card_counts_global"))}
+            fixed += _sync(cx, "card_counts_global", ("card_name",), have, Counter({(c,): n for c, n in glob.items()}),
+                           lambda key: {"last_seen": last_g[key[0]]})
+    log(f"card rollups: {fixed} rows corrected" + (f" for user {uid}" if uid else ""))
+    return fixed
+
+
+def _sync(cx, table, keys, have, want, extra=None):
+    where = " AND ".join(f"{k} = :{k}" for k in keys)
+    stale = [dict(zip(keys, key)) for key in have if key not in want]
+    if stale:
+        cx.execute(text(f"DELETE FROM {table} WHERE {where}"), stale)
+    changed = [dict(zip(keys, key), count=n, **(extra(key) if extra else {}))
+               for key, n in want.items() if have.get(key) != n]
+    if changed:
+        cols = list(changed[0])
+        cx.execute(text(f"DELETE FROM {table} WHERE {where}"), changed)
+        cx.execute(text(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(':' + c for c in cols)})"),
+                   changed)
+    return len(stale) + len(changed)
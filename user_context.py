@@ -0,0 +1,185 @@
+import json, math, os, re
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import text
+
+# ---- Per-user oracle context ----
+# One user_context row per user holds a small JSON state (recent question
+# notes, older compacted gists, tag counts, recent cards) and the prompt text
+# rendered from it. record_ask()/record_card() update it incrementally after
+# each write; ai_oracle_response() reads the pre-rendered `prompt` column, so
+# personalising a reading costs one primary-key read and a bounded number of
+# prompt tokens (CONTEXT_TOKENS, counted with estimate_tokens()).
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "300"))
+MAX_NOTES = 8        # recent questions kept verbatim(ish)
+MAX_GISTS = 12       # older questions kept as a few words each
+MAX_CARDS = 5
+MAX_THEMES = 6
+NOTE_TOKENS = 30
+GIST_TOKENS = 8
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(s):
+    """Rough BPE count for English prose (within ~15% of tiktoken): long words
+    split every ~4 letters, digits every 3, punctuation is its own token."""
+    n = 0
+    for p in _PIECES.findall(s or ""):
+        if p[0].isalpha():
+            n += max(1, math.ceil(len(p) / 4)) if len(p) > 6 else 1
+        elif p[0].isdigit():
+            n += math.ceil(len(p) / 3)
+        else:
+            n += 1
+    return n
+
+
+def clip_tokens(s, budget):
+    words, out, used = (s or "").split(), [], 0
+    for w in words:
+        t = estimate_tokens(w)
+        if used + t > budget:
+            out.append("…")
+            break
+        out.append(w)
+        used += t
+    return " ".join(out)
+
+
+def _gist(note):
+    return clip_tokens(note.split(": ", 1)[-1], GIST_TOKENS)
+
+
+def _empty():
+    return {"notes": [], "gists": [], "themes": {}, "cards": [], "asks": 0}
+
+
+def render(state, budget=CONTEXT_TOKENS):
+    """State -> prompt text within `budget`, compacting the oldest detail first."""
+    themes = Counter(state["themes"]).most_common(MAX_THEMES)
+    notes, gists = list(state["notes"]), list(state["gists"])
+
+    def build():
+        lines = [f"{state['asks']} questions asked so far."]
+        if themes:
+            lines.append("Recurring themes: " + ", ".join(f"{t} ({n})" for t, n in themes))
+        if state["cards"]:
+            lines.append("Recent cards: " + ", ".join(state["cards"]))
+        if gists:
+            lines.append("Earlier questions: " + "; ".join(gists))
+        if notes:
+            lines.append("Recent questions:")
+            lines += [f"- {n}" for n in notes]
+        return "\n".join(lines)
+
+    out = build()
+    while estimate_tokens(out) > budget and (notes or gists):
+        if notes and (len(notes) > 2 or not gists):
+            gists = (gists + [_gist(notes.pop(0))])[-MAX_GISTS:]
+        else:
+            gists.pop(0)
+        out = build()
+    state["notes"], state["gists"] = notes, gists  # keep the compaction
+    return out
+
+
+def load_prompt(cx, user_id):
+    """The user's pre-rendered context, or None for a first-time asker."""
+    return cx.execute(text("SELECT prompt FROM user_context WHERE user_id = :u"), {"u": user_id}).scalar()
+
+
+def _update(engine, user_id, change, attempts=3):
+    """Read-modify-write with an optimistic version check (no row locks, works on SQLite and Postgres)."""
+    for _ in range(attempts):
+        with engine.begin() as cx:
+            row = cx.execute(text("SELECT state, version FROM user_context WHERE user_id = :u"),
+                             {"u": user_id}).first()
+            state, version = (json.loads(row[0]), row[1]) if row else (_empty(), 0)
+            change(state)
+            prompt = render(state)
+            params = {"u": user_id, "s": json.dumps(state), "p": prompt, "t": estimate_tokens(prompt),
+                      "v": version, "now": datetime.now(timezone.utc)}
+            if row is None:
+                res = cx.execute(text("""
+                    INSERT INTO user_context (user_id, state, prompt, tokens, version, updated_at)
+                    VALUES (:u, :s, :p, :t, 1, :now) ON CONFLICT (user_id) DO NOTHING
+                """), params)
+            else:
+                res = cx.execute(text("""
+                    UPDATE user_context SET state = :s, prompt = :p, tokens = :t, version = version + 1,
+                           updated_at = :now
+                    WHERE user_id = :u AND version = :v
+                """), params)
+            if res.rowcount == 1:
+                return prompt
+    return None  # lost the race repeatedly; the next ask catches up
+
+
+def _apply_ask(state, question, tags, day):
+    note = clip_tokens(" ".join(question.split()), NOTE_TOKENS)
+    if tags:
+        note += f" [{', '.join(tags[:3])}]"
+    state["notes"].append(f"{day}: {note}")
+    while len(state["notes"]) > MAX_NOTES:
+        state["gists"].append(_gist(state["notes"].pop(0)))
+    state["gists"] = state["gists"][-MAX_GISTS:]
+    for t in tags:
+        state["themes"][t] = state["themes"].get(t, 0) + 1
+    # keep the tag table small: only the strongest themes survive
+    state["themes"] = dict(Counter(state["themes"]).most_common(MAX_THEMES * 3))
+    state["asks"] += 1
+
+
+def _apply_card(state, card):
+    state["cards"] = ([card] + [c for c in state["cards"] if c != card])[:MAX_CARDS]
+
+
+def record_ask(engine, user_id, question, tags, at=None):
+    day = (at or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+    return _update(engine, user_id, lambda state: _apply_ask(state, question, tags, day))
+
+
+def record_card(engine, user_id, card):
+    return _update(engine, user_id, lambda state: _apply_card(state, card))
+
+
+def record_cards(engine, user_id, cards):
+    """Several cards (oldest first) in one read-modify-write, e.g. an offline sync batch."""
+    def change(state):
+        for card in cards:
+            _apply_card(state, card)
+    return _update(engine, user_id, change)
+
+
+def rebuild(engine, user_id=None, log=print):
+    """Recreate context rows from history (existing users, or after changing the format)."""
+    sql = "SELECT DISTINCT user_id FROM questions WHERE user_id IS NOT NULL" + (" AND user_id = :u" if user_id else "")
+    with engine.connect() as cx:
+        users = [r[0] for r in cx.execute(text(sql), {"u": user_id})]
+    for uid in users:
+        with engine.connect() as cx:
+            asks = cx.execute(text("""
+                SELECT q.body, q.created_at, a.tags_csv FROM questions q
+                LEFT JOIN answers a ON a.question_id = q.id
+                WHERE q.user_id = :u ORDER BY q.created_at DESC LIMIT 50
+            """), {"u": uid}).all()
+            cards = [r[0] for r in cx.execute(text(
+                "SELECT name FROM daily_draws WHERE user_id = :u AND unseen = 0 ORDER BY draw_date DESC LIMIT :n"),
+                {"u": uid, "n": MAX_CARDS})]
+        state = _empty()
+        for body, at, tags_csv in reversed(asks):
+            at = datetime.fromisoformat(at) if isinstance(at, str) else at
+            _apply_ask(state, body, [t for t in (tags_csv or "").split(",") if t], f"{at:%Y-%m-%d}")
+        for card in reversed(cards):
+            _apply_card(state, card)
+        prompt = render(state)
+        with engine.begin() as cx:
+            cx.execute(text("DELETE FROM user_context WHERE user_id = :u"), {"u": uid})
+            cx.execute(text("""
+                INSERT INTO user_context (user_id, state, prompt, tokens, version, updated_at)
+                VALUES (:u, :s, :p, :t, 1, :now)
+            """), {"u": uid, "s": json.dumps(state), "p": prompt, "t": estimate_tokens(prompt),
+                   "now": datetime.now(timezone.utc)})
+    log(f"user context: rebuilt {len(users)} users")
+    return len(users)